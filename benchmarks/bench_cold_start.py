@@ -0,0 +1,66 @@
+"""Benchmark of the import (cold start) time of every Lambda entry point.
+
+Each handler module in tba_invest_etl.lambdas is imported in fresh interpreters with
+-X importtime, which is what a Lambda cold start pays before the first invocation.
+Reports the median cumulative import time and the heavy packages pulled in by it.
+
+Usage: python -m benchmarks.bench_cold_start [--repeat 5]
+"""
+
+import argparse
+import pkgutil
+import statistics
+import subprocess
+import sys
+
+from tba_invest_etl import lambdas
+
+HEAVY_PACKAGES = ["pandas", "numpy", "sqlalchemy", "psycopg2", "boto3", "requests"]
+
+
+def get_entry_points() -> list:
+    return [
+        f"{lambdas.__name__}.{module.name}" for module in pkgutil.iter_modules(lambdas.__path__)
+    ]
+
+
+def import_times(module: str) -> dict:
+    """Cumulative import time in ms of module and of the top-level packages it imports."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        name = name.strip()
+        if name == module or name in HEAVY_PACKAGES:
+            times[name] = int(cumulative) / 1000
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'entry point':<30} {'import ms':>10}  heavy imports (ms)")
+    for module in get_entry_points():
+        runs = [import_times(module) for _ in range(args.repeat)]
+        total = statistics.median(run.get(module, 0.0) for run in runs)
+        heavy = ", ".join(
+            f"{name} {statistics.median(run.get(name, 0.0) for run in runs):.0f}"
+            for name in HEAVY_PACKAGES
+            if name in runs[0]
+        )
+        print(f"{module.rsplit('.', 1)[1]:<30} {total:>10.0f}  {heavy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Benchmark of BALANCE_SHEET parsing on realistic payloads.
+
+Compares parsers.parse_accounting, per symbol and for all symbols in one call, with
+the previous AlphaTableAccounting.wrangle_json, which built a DataFrame per report
+and appended them one at a time.
+
+Usage: python -m benchmarks.bench_parse_accounting [--symbols 50] [--repeat 5]
+"""
+
+import argparse
+import json
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from tba_invest_etl.alpha import parsers
+
+# Fields of a BALANCE_SHEET report, as returned by the API
+BALANCE_SHEET_FIELDS = [
+    "totalAssets",
+    "totalCurrentAssets",
+    "cashAndCashEquivalentsAtCarryingValue",
+    "cashAndShortTermInvestments",
+    "inventory",
+    "currentNetReceivables",
+    "totalNonCurrentAssets",
+    "propertyPlantEquipment",
+    "accumulatedDepreciationAmortizationPPE",
+    "intangibleAssets",
+    "intangibleAssetsExcludingGoodwill",
+    "goodwill",
+    "investments",
+    "longTermInvestments",
+    "shortTermInvestments",
+    "otherCurrentAssets",
+    "otherNonCurrentAssets",
+    "totalLiabilities",
+    "totalCurrentLiabilities",
+    "currentAccountsPayable",
+    "deferredRevenue",
+    "currentDebt",
+    "shortTermDebt",
+    "totalNonCurrentLiabilities",
+    "capitalLeaseObligations",
+    "longTermDebt",
+    "currentLongTermDebt",
+    "longTermDebtNoncurrent",
+    "shortLongTermDebtTotal",
+    "otherCurrentLiabilities",
+    "otherNonCurrentLiabilities",
+    "totalShareholderEquity",
+    "treasuryStock",
+    "retainedEarnings",
+    "commonStock",
+    "commonStockSharesOutstanding",
+]
+
+# Accounts kept by the update_accounting lambda
+ACCOUNTS = ["totalAssets", "commonStock", "commonStockSharesOutstanding"]
+
+
+def make_payload(rng, n_annual: int = 20, n_quarterly: int = 80) -> dict:
+    """Synthetic BALANCE_SHEET payload, some values missing as the API reports them"""
+
+    def make_report(fiscal_date):
+        report = {"fiscalDateEnding": fiscal_date, "reportedCurrency": "USD"}
+        for field in BALANCE_SHEET_FIELDS:
+            missing = rng.uniform() < 0.1
+            report[field] = "None" if missing else str(int(rng.integers(1, 10**12)))
+        return report
+
+    years = pd.date_range(end="2023-12-31", periods=n_annual, freq="A")[::-1]
+    quarters = pd.date_range(end="2023-12-31", periods=n_quarterly, freq="Q")[::-1]
+    return {
+        "symbol": "AAPL",
+        "annualReports": [make_report(d.strftime("%Y-%m-%d")) for d in years],
+        "quarterlyReports": [make_report(d.strftime("%Y-%m-%d")) for d in quarters],
+    }
+
+
+def wrangle_json_legacy(symbol, data_json, key_report, key_report_map, accounts, final_cols):
+    """Previous AlphaTableAccounting.wrangle_json, with concat in place of append"""
+    data = pd.DataFrame()
+    for report in data_json.get(key_report, []):
+        data_report_lst = [
+            [k, int(float(v))] for k, v in report.items() if k in accounts and v != "None"
+        ]
+        currency = report["reportedCurrency"]
+        data_report = pd.DataFrame(data_report_lst, columns=["account_name", "account_value"])
+        data_report["symbol"] = symbol
+        data_report["report_type"] = key_report_map[key_report]
+        data_report["report_date"] = report["fiscalDateEnding"]
+        data_report["currency"] = currency if len(currency) <= 3 else ""
+        data = pd.concat([data, data_report[final_cols]])
+    return data
+
+
+def parse_legacy(contents: dict) -> pd.DataFrame:
+    """Previous get_api_data per symbol, then the symbols appended"""
+    frames = []
+    for symbol, content in contents.items():
+        data_json = json.loads(content)
+        for key_report in parsers.ACCOUNTING_REPORT_TYPES:
+            data = wrangle_json_legacy(
+                symbol,
+                data_json,
+                key_report,
+                parsers.ACCOUNTING_REPORT_TYPES,
+                ACCOUNTS,
+                parsers.ACCOUNTING_COLUMNS,
+            )
+            frames.append(data)
+    return pd.concat(frames, ignore_index=True)
+
+
+def parse_per_symbol(contents: dict) -> pd.DataFrame:
+    frames = [parsers.parse_accounting({s: c}, ACCOUNTS) for s, c in contents.items()]
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    contents = {
+        f"S{i}": json.dumps(make_payload(rng), indent=4).encode("utf-8")
+        for i in range(args.symbols)
+    }
+    keys = ["symbol", "report_type", "report_date", "account_name"]
+    expected = parse_legacy(contents).sort_values(keys, ignore_index=True)
+
+    # Legacy values are objects when a report has none of the accounts
+    expected = expected.astype({"account_value": "int64"})
+    actual = parsers.parse_accounting(contents, ACCOUNTS).sort_values(keys, ignore_index=True)
+    pd.testing.assert_frame_equal(actual, expected)
+
+    n_reports = args.symbols * 100
+    print(f"Payloads: {args.symbols} symbols, {n_reports} reports, {len(expected)} rows")
+    cases = [
+        ("legacy", parse_legacy),
+        ("per_symbol", parse_per_symbol),
+        ("batch", lambda contents: parsers.parse_accounting(contents, ACCOUNTS)),
+    ]
+    results = {}
+    for name, fun in cases:
+        times = timeit.repeat(lambda fun=fun: fun(contents), number=1, repeat=args.repeat)
+        results[name] = min(times)
+        print(
+            f"{name:>10}: best {min(times) * 1e3:8.1f} ms, "
+            f"{n_reports / min(times):10.0f} reports/s"
+        )
+    for name in ["per_symbol", "batch"]:
+        print(f"{name:>10} speedup: {results['legacy'] / results[name]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
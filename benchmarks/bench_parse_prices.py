@@ -0,0 +1,105 @@
+"""Benchmark of TIME_SERIES_DAILY_ADJUSTED parsing on full-size payloads.
+
+Compares parsers.parse_daily_adjusted with the previous get_api_data transformation
+(requests JSON decoding plus a transposed DataFrame of strings), and with
+parsers.parse_daily_adjusted_csv on the same data downloaded with datatype=csv.
+
+Usage: python -m benchmarks.bench_parse_prices [--days 6300] [--repeat 20]
+"""
+
+import argparse
+import json
+import timeit
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from tba_invest_etl.alpha import parsers
+
+
+def make_payload(n_days: int) -> dict:
+    """Synthetic full-size payload, about 25 years of business days by default"""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range(end="2024-01-02", periods=n_days)[::-1]
+    closes = rng.uniform(1, 500, n_days)
+    time_series = {
+        day.strftime("%Y-%m-%d"): {
+            "1. open": f"{close * 0.99:.4f}",
+            "2. high": f"{close * 1.01:.4f}",
+            "3. low": f"{close * 0.98:.4f}",
+            "4. close": f"{close:.4f}",
+            "5. adjusted close": f"{close * 0.9:.4f}",
+            "6. volume": str(int(close * 1e5)),
+            "7. dividend amount": "0.0000",
+            "8. split coefficient": "1.0",
+        }
+        for day, close in zip(dates, closes)
+    }
+    return {"Meta Data": {"2. Symbol": "AAPL"}, "Time Series (Daily)": time_series}
+
+
+def to_csv_content(payload: dict) -> bytes:
+    """Same time series as the API returns it with datatype=csv"""
+    lines = [
+        "timestamp,open,high,low,close,adjusted_close,volume,dividend_amount,split_coefficient"
+    ]
+    for day, values in payload["Time Series (Daily)"].items():
+        lines.append(",".join([day] + list(values.values())))
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def parse_legacy(content: bytes, symbol: str) -> pd.DataFrame:
+    """Previous AlphaTablePrices.get_api_data transformation"""
+    prices_json = json.loads(content)
+    prices = pd.DataFrame(prices_json["Time Series (Daily)"], dtype="float").T
+    col_rename = {col: col[3:].replace(" ", "_") for col in prices.columns}
+    prices.rename(columns=col_rename, inplace=True)
+    prices = prices.reset_index().rename(columns={"index": "date"})
+    prices["symbol"] = symbol
+    cols = list(prices.columns[-1:]) + list(prices.columns[:-1])
+    prices = prices[cols]
+    prices = prices.astype({"symbol": "object", "date": "datetime64[ns]"})
+    prices["date"] = prices.date.dt.date
+    prices["lud"] = datetime.now()
+    return prices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=6300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payload = make_payload(args.days)
+    content = json.dumps(payload, indent=4).encode("utf-8")
+    csv_content = to_csv_content(payload)
+    expected = parse_legacy(content, "AAPL").drop(columns="lud")
+    pd.testing.assert_frame_equal(
+        parsers.parse_daily_adjusted(content, "AAPL").drop(columns="lud"), expected
+    )
+    pd.testing.assert_frame_equal(
+        parsers.parse_daily_adjusted_csv(csv_content, "AAPL").drop(columns="lud"), expected
+    )
+
+    print(f"Payload: {args.days} days")
+    print(f"Size: json {len(content) / 1e6:.1f} MB, csv {len(csv_content) / 1e6:.1f} MB")
+    print(f"JSON decoder: {'orjson' if parsers.orjson is not None else 'json'}")
+    cases = [
+        ("legacy", parse_legacy, content),
+        ("columnar", parsers.parse_daily_adjusted, content),
+        ("csv", parsers.parse_daily_adjusted_csv, csv_content),
+    ]
+    results = {}
+    for name, fun, data in cases:
+        times = timeit.repeat(
+            lambda fun=fun, data=data: fun(data, "AAPL"), number=1, repeat=args.repeat
+        )
+        results[name] = min(times)
+        print(f"{name:>10}: best {min(times) * 1e3:8.1f} ms, mean {np.mean(times) * 1e3:8.1f} ms")
+    for name in ["columnar", "csv"]:
+        print(f"{name:>10} speedup: {results['legacy'] / results[name]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark of the predicted makespan of get_assets sublists.
+
+Compares the previous fixed batches of equal-count sublists (np.array_split) with
+partition.partition_batches, on synthetic costs from partition.estimate_costs
+where a share of the symbols needs a full history reload and the rest a compact
+refresh. Makespans with waits include the hourly wait between batches.
+
+Usage: python -m benchmarks.bench_partition [--symbols 4500] [--full-share 0.1]
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from tba_invest_etl.alpha import partition
+
+
+def make_assets(n_symbols: int, full_share: float, rng) -> pd.DataFrame:
+    """Watermarks of symbols, full reloads measured as slower and longer fetches"""
+    full = rng.uniform(size=n_symbols) < full_share
+    return pd.DataFrame(
+        {
+            "symbol": [f"S{i:05d}" for i in range(n_symbols)],
+            "row_count": np.where(full, rng.integers(1000, 6300, n_symbols), 100),
+            "last_duration": np.where(
+                full, rng.uniform(5, 40, n_symbols), rng.uniform(0.5, 2, n_symbols)
+            ),
+        }
+    )
+
+
+def equal_count_batches(costs: pd.Series, n_lists: int, max_assets_in_batch: int) -> list:
+    """Previous get_assets batching, predicted seconds of each sublist"""
+    batches = []
+    for start in range(0, len(costs), max_assets_in_batch):
+        batch = costs.iloc[start : start + max_assets_in_batch]
+        batches.append([chunk.sum() for chunk in np.array_split(batch.to_numpy(), n_lists)])
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=4500)
+    parser.add_argument("--full-share", type=float, default=0.1)
+    parser.add_argument("--n-lists", type=int, default=10)
+    parser.add_argument("--max-assets-in-batch", type=int, default=75 * 60)
+    parser.add_argument("--timeout", type=float, default=900)
+    args = parser.parse_args()
+
+    assets = make_assets(args.symbols, args.full_share, np.random.default_rng(0))
+    costs = partition.estimate_costs(assets, call_interval=0.0)
+    max_list_seconds = args.timeout * partition.TIMEOUT_SAFETY
+
+    fixed = equal_count_batches(costs, args.n_lists, args.max_assets_in_batch)
+    balanced = partition.partition_batches(
+        costs, args.n_lists, args.max_assets_in_batch, max_list_seconds
+    )
+    seconds = timeit.timeit(
+        lambda: partition.partition_batches(
+            costs, args.n_lists, args.max_assets_in_batch, max_list_seconds
+        ),
+        number=5,
+    )
+
+    print(f"Symbols: {args.symbols}, total predicted {costs.sum():.0f} s")
+    for name, batches in [
+        ("equal_count", fixed),
+        ("balanced", [[s for _, s in batch] for batch in balanced]),
+    ]:
+        makespans = [max(batch) for batch in batches]
+        over = sum(s > args.timeout for batch in batches for s in batch)
+        print(
+            f"{name:>12}: {len(batches)} batches, makespan {sum(makespans):8.0f} s, "
+            f"with waits {partition.get_run_makespan(makespans):8.0f} s, "
+            f"max sublist {max(makespans):6.0f} s, {over} sublists over the timeout"
+        )
+    print(f"Partitioning time: {seconds / 5 * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
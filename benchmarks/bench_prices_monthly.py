@@ -0,0 +1,86 @@
+"""Benchmark of daily to monthly price aggregation on a synthetic panel.
+
+Compares aggregation.get_prices_monthly, one pass of segment reductions over all
+symbols, with AlphaTablePricesMonthly._get_prices_monthly (groupby().resample()),
+on all symbols at once and one symbol per call.
+
+Usage: python -m benchmarks.bench_prices_monthly [--symbols 200] [--repeat 3]
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from tba_invest_etl.alpha import aggregation
+from tba_invest_etl.alpha.table import AlphaTablePricesMonthly
+
+
+def make_prices_daily(n_symbols: int, rng) -> pd.DataFrame:
+    """Daily prices since 2000 of symbols listed on different dates, ordered as read"""
+    all_dates = pd.bdate_range("2000-01-03", "2024-03-14")
+    frames = []
+    for i in range(n_symbols):
+        dates = all_dates[rng.integers(0, len(all_dates) // 2) :]
+        frames.append(
+            pd.DataFrame(
+                {
+                    "symbol": f"S{i:04d}",
+                    "date": dates.date,
+                    "open": 100.0,
+                    "high": 100.0,
+                    "low": 100.0,
+                    "close": 100.0,
+                    "adjusted_close": 100 * np.exp(rng.normal(0, 0.01, len(dates)).cumsum()),
+                    "volume": rng.integers(0, 10**7, len(dates)),
+                    "lud": pd.Timestamp("2024-03-14"),
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def resample(prices_daily):
+    return AlphaTablePricesMonthly._get_prices_monthly(  # pylint: disable=protected-access
+        None, prices_daily.copy()
+    )
+
+
+def resample_per_symbol(prices_daily):
+    return pd.concat([resample(df) for _, df in prices_daily.groupby("symbol")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    prices_daily = make_prices_daily(args.symbols, np.random.default_rng(0))
+    expected = resample(prices_daily).reset_index(drop=True)
+    actual = aggregation.get_prices_monthly(prices_daily)
+    pd.testing.assert_frame_equal(
+        actual.drop(columns="lud"), expected.drop(columns="lud"), check_exact=False, rtol=1e-12
+    )
+
+    print(f"Panel: {args.symbols} symbols, {len(prices_daily)} days, {len(expected)} months")
+    cases = [
+        ("resample", resample),
+        ("per_symbol", resample_per_symbol),
+        ("numpy", aggregation.get_prices_monthly),
+    ]
+    results = {}
+    for name, fun in cases:
+        times = timeit.repeat(lambda fun=fun: fun(prices_daily), number=1, repeat=args.repeat)
+        results[name] = min(times)
+        print(
+            f"{name:>10}: best {min(times) * 1e3:8.1f} ms, "
+            f"{args.symbols / min(times):10.0f} symbols/s"
+        )
+    for name in ["resample", "per_symbol"]:
+        print(f"numpy speedup over {name}: {results[name] / results['numpy']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark of ManagerSQL.select_typed against pd.read_sql (select_query).
+
+Reads a synthetic temporary table shaped like prices_alpha (numeric price columns)
+from the Postgres instance given by TEST_DB_HOST, TEST_DB_PORT, TEST_DB_NAME,
+TEST_DB_USER and TEST_DB_PASSWORD, as the integration tests do. select_typed is
+timed with pyarrow if installed and with pandas.
+
+Usage: python -m benchmarks.bench_read_prices [--symbols 20] [--days 6300] [--repeat 5]
+"""
+
+import argparse
+import os
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from tba_invest_etl.domain_models.io import SQLParams
+from tba_invest_etl.utils import sql_manager
+
+CREATE_PRICES = """
+    create temp table bench_prices as
+    select
+        'S' || s symbol,
+        date '2000-01-03' + d date,
+        round((100 + random() * 50)::numeric, 2)::numeric(14,2) open,
+        round((100 + random() * 50)::numeric, 2)::numeric(14,2) high,
+        round((100 + random() * 50)::numeric, 2)::numeric(14,2) low,
+        round((100 + random() * 50)::numeric, 2)::numeric(14,2) close,
+        round((100 + random() * 50)::numeric, 2)::numeric(18,2) adjusted_close,
+        (random() * 1e7)::bigint volume,
+        0::numeric(14,1) dividend_amount,
+        1::numeric(14,1) split_coefficient,
+        now()::timestamp lud
+    from generate_series(1, %(symbols)s) s, generate_series(1, %(days)s) d
+"""
+
+
+def get_sql_params() -> SQLParams:
+    return SQLParams(
+        dbname=os.environ.get("TEST_DB_NAME", "postgres"),
+        username=os.environ.get("TEST_DB_USER", "postgres"),
+        password=os.environ.get("TEST_DB_PASSWORD", ""),
+        host=os.environ["TEST_DB_HOST"],
+        port=int(os.environ.get("TEST_DB_PORT", 5432)),
+    )
+
+
+def select_typed_pandas(sql, query):
+    """select_typed with the pandas csv parser, as without pyarrow"""
+    read_copy_arrow = sql_manager._read_copy_arrow  # pylint: disable=protected-access
+
+    def no_arrow(*args):
+        raise ImportError
+
+    sql_manager._read_copy_arrow = no_arrow  # pylint: disable=protected-access
+    try:
+        return sql.select_typed(query, categories=["symbol"])
+    finally:
+        sql_manager._read_copy_arrow = read_copy_arrow  # pylint: disable=protected-access
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--days", type=int, default=6300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sql = sql_manager.ManagerSQL(get_sql_params(), shared=False)
+    sql.query(CREATE_PRICES, {"symbols": args.symbols, "days": args.days})
+    query = "select * from bench_prices"
+
+    expected = sql.select_query(query)
+    typed = sql.select_typed(query, categories=["symbol"])
+    pd.testing.assert_frame_equal(typed.astype({"symbol": object}), expected)
+
+    print(f"Rows: {len(expected)} ({args.symbols} symbols, {args.days} days)")
+    print(f"Memory: read_sql {expected.memory_usage(deep=True).sum() / 1e6:.1f} MB, ", end="")
+    print(f"select_typed {typed.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    cases = [
+        ("read_sql", lambda: sql.select_query(query)),
+        ("typed", lambda: sql.select_typed(query, categories=["symbol"])),
+        ("typed_pd", lambda: select_typed_pandas(sql, query)),
+    ]
+    results = {}
+    for name, fun in cases:
+        times = timeit.repeat(fun, number=1, repeat=args.repeat)
+        results[name] = min(times)
+        print(f"{name:>10}: best {min(times) * 1e3:8.1f} ms, mean {np.mean(times) * 1e3:8.1f} ms")
+    for name in ["typed", "typed_pd"]:
+        print(f"{name:>10} speedup: {results['read_sql'] / results[name]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
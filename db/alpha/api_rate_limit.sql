@@ -0,0 +1,11 @@
+-- DROP TABLE api_rate_limit
+
+CREATE TABLE api_rate_limit
+(
+	name varchar(50) NOT NULL,
+	max_requests_per_min int NOT NULL,
+	capacity float NOT NULL,
+	tokens float NOT NULL,
+	updated_at timestamptz NOT NULL,
+	PRIMARY KEY (name)
+)
@@ -0,0 +1,6 @@
+-- Types updated_at as timestamptz in an api_rate_limit created before api_rate_limit.sql did.
+-- It is compared to clock_timestamp(), with timestamp the refill depended on the session
+-- TimeZone. Existing values are read as UTC, at worst one refill is off.
+
+ALTER TABLE api_rate_limit
+ALTER COLUMN updated_at TYPE timestamptz USING updated_at AT TIME ZONE 'UTC';
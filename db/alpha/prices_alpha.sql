@@ -19,6 +19,7 @@ CREATE TABLE prices_alpha
 --DROP INDEX symbol_idx;
 CREATE INDEX prices_alpha_symbol_idx ON prices_alpha (symbol);
 CREATE INDEX prices_alpha_date_idx ON prices_alpha (date);
+CREATE UNIQUE INDEX prices_alpha_symbol_date_idx ON prices_alpha (symbol, date);
 
 
 
@@ -0,0 +1,10 @@
+-- Unique index on (symbol, date) needed by the upsert write mode of AlphaTablePrices,
+-- step 1 of 2 for tables created before prices_alpha.sql declared it.
+-- The primary key includes lud, so duplicated dates may exist: keep the latest one.
+-- Can run in a transaction. Then run prices_alpha_upsert_index_02_create.sql.
+
+DELETE FROM prices_alpha p
+USING prices_alpha q
+WHERE p.symbol = q.symbol
+	AND p.date = q.date
+	AND p.lud < q.lud;
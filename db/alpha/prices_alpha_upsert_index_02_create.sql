@@ -0,0 +1,9 @@
+-- Unique index on (symbol, date) needed by the upsert write mode of AlphaTablePrices,
+-- step 2 of 2, after prices_alpha_upsert_index_01_dedupe.sql.
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block: run this script on
+-- its own in autocommit mode, e.g. psql -f without --single-transaction.
+-- If it fails it leaves an INVALID index behind, drop it before running it again:
+-- DROP INDEX CONCURRENTLY IF EXISTS prices_alpha_symbol_date_idx;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS prices_alpha_symbol_date_idx
+ON prices_alpha (symbol, date);
@@ -0,0 +1,32 @@
+-- Per-symbol watermarks of the tables ingested from the API, read by the refresh planners
+-- (AlphaTable.filter_assets_by_max_date) instead of aggregating the tables.
+-- Written by AlphaTable.update_table_watermarks in the transaction of each write.
+
+--DROP TABLE table_watermarks;
+CREATE TABLE table_watermarks
+(
+	table_name varchar(50) NOT NULL,
+	symbol varchar(20) NOT NULL,
+	last_date date,
+	last_lud timestamp,
+	row_count bigint NOT NULL,
+	last_fetch timestamp,
+	last_duration float,  -- Seconds of the last API call and parse, see partition.estimate_costs
+	lud timestamp NOT NULL,
+	PRIMARY KEY (table_name, symbol)
+);
+
+-- Backfill from the existing tables
+INSERT INTO table_watermarks (table_name, symbol, last_date, last_lud, row_count, lud)
+SELECT 'prices_alpha', symbol, max(date), max(lud), count(*), now()::timestamp
+FROM prices_alpha
+GROUP BY symbol
+UNION ALL
+SELECT 'balance_alpha', symbol, max(report_date), max(lud), count(*), now()::timestamp
+FROM balance_alpha
+GROUP BY symbol
+UNION ALL
+SELECT 'income_alpha', symbol, max(report_date), max(lud), count(*), now()::timestamp
+FROM income_alpha
+GROUP BY symbol
+ON CONFLICT (table_name, symbol) DO NOTHING;
@@ -0,0 +1,4 @@
+-- Adds last_duration to a table_watermarks created before table_watermarks.sql declared it.
+-- Seconds of the last API call and parse of each symbol, read by the get_assets cost model.
+
+ALTER TABLE table_watermarks ADD COLUMN IF NOT EXISTS last_duration float;
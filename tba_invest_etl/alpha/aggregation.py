@@ -0,0 +1,150 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Daily columns whose last valid value in the month is kept, source_lud from lud
+LAST_COLUMNS = ["open", "high", "low", "close", "adjusted_close", "lud"]
+
+# Columns returned by get_prices_monthly, as AlphaTablePricesMonthly._get_prices_monthly
+MONTHLY_COLUMNS = [
+    "symbol",
+    "date",
+    "open",
+    "high",
+    "low",
+    "close",
+    "adjusted_close",
+    "monthly_volume",
+    "monthly_return_std",
+    "monthly_return",
+    "day_count",
+    "source_lud",
+    "lud",
+]
+
+
+def to_business_month_ends(dates) -> np.ndarray:
+    """Label of the "BM" resample bin of dates, the first business month end on or after."""
+    days = np.asarray(dates, dtype="datetime64[D]")
+    months = days.astype("datetime64[M]")
+
+    def month_ends(months):
+        last_days = (months + 1).astype("datetime64[D]") - 1
+        return np.busday_offset(last_days, 0, roll="backward")
+
+    labels = month_ends(months)
+
+    # Weekend days after the last business day belong to the next month
+    late = days > labels
+    labels[late] = month_ends(months[late] + 1)
+    return labels
+
+
+def _last_valid(valid: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Position of the last valid row of each segment, -1 if there is none."""
+    positions = np.where(valid, np.arange(len(valid)), -1)
+    last = np.maximum.reduceat(positions, starts)
+    return np.where(last >= starts, last, -1)
+
+
+def _take_last(series: pd.Series, starts: np.ndarray) -> pd.Series:
+    """Last non null value of series in each segment, as resample().last()."""
+    positions = _last_valid(series.notna().to_numpy(), starts)
+    taken = series.iloc[np.maximum(positions, 0)].reset_index(drop=True)
+    return taken.where(positions >= 0)
+
+
+def _segment_std(values: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Sample standard deviation (ddof=1) of the non NaN values of each segment."""
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid.astype(np.int64), starts)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+
+        # Two passes, deviations from the segment mean, as pandas does
+        deviations = np.where(valid, values - np.repeat(means, lengths), 0.0)
+        squares = np.add.reduceat(deviations**2, starts)
+        return np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+
+
+def _is_sorted(symbols: np.ndarray, dates: np.ndarray) -> bool:
+    """Whether rows are already ordered by symbol and date, as read with order by."""
+    same_symbol = symbols[1:] == symbols[:-1]
+    later = np.where(same_symbol, dates[1:] >= dates[:-1], symbols[1:] > symbols[:-1])
+    return bool(later.all())
+
+
+def get_prices_monthly(prices_daily: pd.DataFrame) -> pd.DataFrame:
+    """Aggregates daily prices of one or more symbols into business month bars.
+
+    Vectorized version of AlphaTablePricesMonthly._get_prices_monthly, with the
+    same output. Rows are sorted by symbol and date, unless they already are, then
+    every (symbol, month) is a contiguous segment reduced with ufunc.reduceat, so the
+    cost is a few passes over the panel whatever the number of symbols.
+
+        Parameters
+        ----------
+        prices_daily : pd.DataFrame
+            Daily prices with symbol, date, open, high, low, close, adjusted_close,
+            volume and lud
+
+        Returns
+        -------
+        prices_monthly: pd.DataFrame
+            One row per symbol and month with prices, dated at the last business day
+            of the month. Months without adjusted_close, or with a single day and no
+            return, are dropped
+    """
+    if prices_daily.shape[0] == 0:
+        return pd.DataFrame(columns=MONTHLY_COLUMNS)
+
+    prices_daily = prices_daily.assign(date=pd.to_datetime(prices_daily.date))
+    if not _is_sorted(prices_daily.symbol.to_numpy(), prices_daily.date.to_numpy()):
+        prices_daily = prices_daily.sort_values(by=["symbol", "date"], kind="stable")
+    symbols = prices_daily.symbol.to_numpy()
+    labels = to_business_month_ends(prices_daily.date.to_numpy())
+
+    # Segments start where the symbol or the month changes
+    new_symbol = np.empty(len(symbols), dtype=bool)
+    new_symbol[0] = True
+    new_symbol[1:] = symbols[1:] != symbols[:-1]
+    new_segment = new_symbol.copy()
+    new_segment[1:] |= labels[1:] != labels[:-1]
+    starts = np.flatnonzero(new_segment)
+    lengths = np.diff(np.append(starts, len(symbols)))
+
+    # Daily returns, the first day of a symbol has none
+    adjusted_close = prices_daily.adjusted_close.to_numpy(dtype=np.float64)
+    previous_adjusted_close = np.empty_like(adjusted_close)
+    previous_adjusted_close[0] = np.nan
+    previous_adjusted_close[1:] = adjusted_close[:-1]
+    previous_adjusted_close[new_symbol] = np.nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily_return = adjusted_close / previous_adjusted_close - 1
+        daily_cont_return = np.log(1 + daily_return)
+        monthly_cont_return = np.add.reduceat(
+            np.where(np.isnan(daily_cont_return), 0.0, daily_cont_return), starts
+        )
+    volume = prices_daily.volume
+    prices_monthly = pd.DataFrame(
+        {
+            "symbol": symbols[starts],
+            "date": labels[starts].astype("datetime64[ns]"),
+            **{col: _take_last(prices_daily[col], starts) for col in LAST_COLUMNS},
+            "monthly_volume": np.add.reduceat(volume.fillna(0).to_numpy(), starts),
+            "monthly_return_std": _segment_std(daily_return, starts, lengths),
+            "monthly_return": np.exp(monthly_cont_return) - 1,
+            "day_count": lengths,
+        }
+    )
+
+    # Format and filter columns
+    prices_monthly.rename(columns={"lud": "source_lud"}, inplace=True)
+    prices_monthly["lud"] = datetime.now()
+    missing_data_cond = prices_monthly.adjusted_close.isnull()
+    one_record_cond = (prices_monthly.day_count == 1) & (prices_monthly.monthly_return == 0)
+    prices_monthly = prices_monthly.loc[~missing_data_cond & ~one_record_cond, MONTHLY_COLUMNS]
+
+    return prices_monthly.reset_index(drop=True)
@@ -1,49 +1,163 @@
 import os
+import threading
 import time
-from datetime import datetime
+from statistics import fmean
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from tba_invest_etl.alpha.cache import ResponseCache
+from tba_invest_etl.alpha.rate_limiter import TokenBucket
+from tba_invest_etl.domain_models.io import ApiCallTiming
 
 URL_BASE = "https://www.alphavantage.co/query?function="
 
 
-class AlphaScraper:
-    def __init__(self, api_key=None, wait=True, max_api_requests_per_min=75):
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter reporting how many connections its pools have opened."""
+
+    def num_connections(self) -> int:
+        pools = self.poolmanager.pools
+        return sum(pool.num_connections for pool in map(pools.get, pools.keys()) if pool)
+
+
+class AlphaScraper:  # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        api_key=None,
+        wait=True,
+        max_api_requests_per_min=75,
+        rate_limiter=None,
+        pool_size=10,
+        timeout=(10, 60),
+        cache=None,
+    ):
         if api_key is None:
             self.api_key = os.environ.get("ALPHAVANTAGE_API_KEY")
         else:
             self.api_key = api_key
         self.wait = wait
         self.max_api_requests_per_min = max_api_requests_per_min
-        self.remaining_api_requests = max_api_requests_per_min
-        self.last_increase_time = datetime.today()
+
+        # Shared by every thread using this scraper. Pass the same rate_limiter
+        # to several scrapers to have them share one API quota.
+        if rate_limiter is None:
+            rate_limiter = TokenBucket(max_api_requests_per_min)
+        self.rate_limiter = rate_limiter
+
+        # Long-lived keep-alive session shared by every table using this scraper.
+        # pool_size should be at least the number of concurrent workers.
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        self.adapter = CountingHTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=True
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        # Optional raw response cache, also enabled by setting ALPHA_CACHE_DIR
+        if cache is None and os.environ.get("ALPHA_CACHE_DIR"):
+            cache = ResponseCache(os.environ["ALPHA_CACHE_DIR"])
+        self.cache = cache
+
+        # Per-call timings, see get_timing_summary, and the last one of each thread
+        self.timings = []
+        self.timings_lock = threading.Lock()
+        self.local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.session.close()
 
     def wait_to_hit_api(self):
-        # Remaining api requests
-        if self.remaining_api_requests > 0:
-            self.remaining_api_requests -= 1
-            print(f"Remaining api requests: {self.remaining_api_requests}")
-            return
-
-        # Reached maximum
-        delay = (datetime.today() - self.last_increase_time).total_seconds()
-        if delay < 60:
-            print(f"Maximum limit reached. Sleeping for {60 - delay} seconds")
-            time.sleep(60 - delay)
-
-        print("API limit refreshed after 1 minute")
-        self.remaining_api_requests = self.max_api_requests_per_min - 1
-        self.last_increase_time = datetime.today()
+        waited = self.rate_limiter.acquire()
+        if waited >= 1:
+            print(f"Maximum limit reached. Waited {waited:.2f} seconds")
 
     def hit_api(self, url, **kwargs):
         kwargs["URL_BASE"] = URL_BASE
         kwargs["api_key"] = self.api_key
         url = url.format(**kwargs)
+        function = parse_qs(urlsplit(url).query).get("function", [""])[0]
+        self.local.timing = None
+
+        # Cache hits do not spend API quota
+        if self.cache is not None:
+            content = self.cache.get(url)
+            if content is not None:
+                return ResponseCache.to_response(url, content)
+            if self.cache.offline:
+                raise LookupError(f"No cached {function} response for {kwargs.get('symbol')}")
 
         if self.wait:
             self.wait_to_hit_api()
 
-        with requests.Session() as s:
-            download = s.get(url)
+        # Connections are opened in the calling thread, a call that saw the count grow
+        # opened one. Under concurrency it may be credited with another thread's.
+        opened = self.adapter.num_connections()
+        start = time.perf_counter()
+        download = self.session.get(url, timeout=self.timeout, stream=True)
+        new_connection = self.adapter.num_connections() > opened
+
+        # Reading the content releases the connection back to the pool
+        _ = download.content
+        total = time.perf_counter() - start
+        elapsed = download.elapsed.total_seconds()
+
+        timing = ApiCallTiming(
+            function=function,
+            new_connection=new_connection,
+            elapsed=elapsed,
+            transfer=max(total - elapsed, 0.0),
+            total=total,
+        )
+        with self.timings_lock:
+            self.timings.append(timing)
+        self.local.timing = timing
+
+        if self.cache is not None and ResponseCache.is_cacheable(download):
+            self.cache.put(url, download.content)
 
         return download
+
+    def get_last_timing(self) -> Optional[ApiCallTiming]:
+        """Timing of the last hit_api call of this thread, None if served from the cache.
+
+        Excludes the wait for the rate limiter.
+        """
+        return getattr(self.local, "timing", None)
+
+    def get_timing_summary(self) -> dict:
+        """Aggregates per-call timings, in seconds.
+
+        The time to headers of calls on new connections minus that of calls on
+        reused ones estimates the connect and TLS cost saved per reused call.
+        """
+        with self.timings_lock:
+            timings = list(self.timings)
+
+        elapsed_new = [t.elapsed for t in timings if t.new_connection]
+        elapsed_reused = [t.elapsed for t in timings if not t.new_connection]
+        mean_elapsed_new = fmean(elapsed_new) if elapsed_new else 0.0
+        mean_elapsed_reused = fmean(elapsed_reused) if elapsed_reused else 0.0
+        connect_time_saved = 0.0
+        if elapsed_new and elapsed_reused:
+            connect_time_saved = len(elapsed_reused) * (mean_elapsed_new - mean_elapsed_reused)
+
+        return {
+            "calls": len(timings),
+            "new_connections": self.adapter.num_connections(),
+            "mean_elapsed_new_connection": mean_elapsed_new,
+            "mean_elapsed_reused_connection": mean_elapsed_reused,
+            "mean_transfer": fmean([t.transfer for t in timings]) if timings else 0.0,
+            "total": sum(t.total for t in timings),
+            "connect_time_saved": connect_time_saved,
+        }
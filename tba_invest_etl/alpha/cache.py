@@ -0,0 +1,169 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+# Seconds a cached response stays fresh, per API function
+DEFAULT_TTL_SECONDS = {
+    "TIME_SERIES_DAILY_ADJUSTED": 24 * 3600,
+    "BALANCE_SHEET": 7 * 24 * 3600,
+    "INCOME_STATEMENT": 7 * 24 * 3600,
+    "LISTING_STATUS": 24 * 3600,
+}
+
+# Keys of the small JSON payloads Alpha Vantage returns on errors and throttling
+API_ERROR_KEYS = {"Error Message", "Note", "Information"}
+
+
+class ResponseCache:  # pylint: disable=too-many-instance-attributes
+    """Compressed on-disk cache of raw Alpha Vantage responses.
+
+    Responses are stored under directory/<function>/<sha256>.gz, where the hash covers
+    the request parameters (api key excluded) and the as-of date. Used by
+    AlphaScraper.hit_api as a read-through layer: hits are served without spending
+    API quota. With offline=True the cache is a replay source, misses raise instead
+    of reaching the API and TTLs are ignored.
+
+        Parameters
+        ----------
+        directory: str
+            Root directory of the cache
+        ttl_seconds: dict
+            Freshness per API function, defaults to DEFAULT_TTL_SECONDS
+        default_ttl_seconds: int
+            Freshness of functions missing from ttl_seconds
+        max_bytes: int
+            If given, oldest entries are evicted once the cache grows beyond it
+        offline: bool
+            Replay mode
+        as_of: datetime.date
+            Date included in the keys. Defaults to today, set it to replay a past run
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl_seconds: Optional[dict] = None,
+        default_ttl_seconds: int = 24 * 3600,
+        max_bytes: Optional[int] = None,
+        offline: bool = False,
+        as_of: Optional[date] = None,
+    ):
+        self.directory = Path(directory)
+        self.ttl_seconds = DEFAULT_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.default_ttl_seconds = default_ttl_seconds
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.as_of = as_of
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.total_bytes = 0
+        self.evict()
+
+    def _get_path(self, url: str) -> Path:
+        params = {k: v for k, v in parse_qsl(urlsplit(url).query) if k != "apikey"}
+        function = params.get("function", "UNKNOWN")
+        as_of = (self.as_of or date.today()).isoformat()
+        key_data = json.dumps({"params": sorted(params.items()), "as_of": as_of})
+        key = hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+        return self.directory / function / f"{key}.gz"
+
+    def _get_ttl(self, path: Path) -> int:
+        return self.ttl_seconds.get(path.parent.name, self.default_ttl_seconds)
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Returns cached raw content for url, or None if missing or expired."""
+        path = self._get_path(url)
+        try:
+            age = time.time() - path.stat().st_mtime
+            if self.offline or age <= self._get_ttl(path):
+                content = gzip.decompress(path.read_bytes())
+                with self.lock:
+                    self.hits += 1
+                return content
+        except FileNotFoundError:
+            pass
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, url: str, content: bytes):
+        """Stores raw content for url, replacing any previous entry atomically."""
+        path = self._get_path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = gzip.compress(content, compresslevel=5)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(compressed)
+
+        # A replaced entry no longer counts towards total_bytes
+        try:
+            replaced_bytes = path.stat().st_size
+        except FileNotFoundError:
+            replaced_bytes = 0
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.total_bytes += len(compressed) - replaced_bytes
+            should_evict = self.max_bytes is not None and self.total_bytes > self.max_bytes
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Deletes expired entries, then the oldest ones while above max_bytes."""
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*/*.gz"):
+            try:
+                stat = path.stat()
+                if not self.offline and now - stat.st_mtime > self._get_ttl(path):
+                    path.unlink()
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+
+        total_bytes = sum(size for _, size, _ in entries)
+        if self.max_bytes is not None:
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total_bytes -= size
+
+        with self.lock:
+            self.total_bytes = total_bytes
+
+    @staticmethod
+    def is_cacheable(download: requests.Response) -> bool:
+        """False for failed calls and for Alpha Vantage error or throttling payloads."""
+        if download.status_code != 200:
+            return False
+        content = download.content
+        if len(content) < 2048 and content.lstrip().startswith(b"{"):
+            try:
+                return not API_ERROR_KEYS.intersection(json.loads(content))
+            except ValueError:
+                return False
+        return True
+
+    @staticmethod
+    def to_response(url: str, content: bytes) -> requests.Response:
+        """Wraps cached content so callers can use it like a live download."""
+        download = requests.Response()
+        download.status_code = 200
+        download.url = url
+        download.encoding = "utf-8"
+        download._content = content  # pylint: disable=protected-access
+        return download
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+# Columns that must match at the last db date for db prices to be kept
+COLS_EQUAL = ["close", "adjusted_close", "dividend_amount", "split_coefficient"]
+
+# Ordinals are offset so (symbol code, date) pairs pack into one int64 key
+ORDINAL_OFFSET = 2**31
+
+
+def to_ordinals(dates) -> np.ndarray:
+    """Days since 1970-01-01 of a sequence of dates, as int64."""
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+def _to_keys(codes: np.ndarray, ordinals: np.ndarray) -> np.ndarray:
+    return (codes.astype(np.int64) << 32) | (ordinals + ORDINAL_OFFSET)
+
+
+def _any_by_code(codes: np.ndarray, mask: np.ndarray, n: int) -> np.ndarray:
+    return np.bincount(codes, weights=mask, minlength=n) > 0
+
+
+def get_prices_to_upload(
+    api_prices: pd.DataFrame,
+    watermarks: pd.DataFrame,
+    sizes: dict,
+    watermark_dates: int,
+):
+    """Decides what to upload for every symbol of a batch in one vectorized pass.
+
+    Batch version of AlphaTablePrices.get_api_prices_to_upload, deciding from the
+    watermarks (see AlphaTablePrices._get_db_watermarks) instead of the full db
+    history of each symbol. Dates are compared as integer ordinals keyed by symbol
+    code, so no string casts or merges are needed.
+
+    Symbols are settled as in get_api_prices_to_upload when the db dates spanned by
+    both their API data and their watermark dates have no gaps. Otherwise gaps must
+    be repaired from the db row before the first one: they are flagged with fallback
+    and should go through get_api_prices_to_upload. API dates older than truncated
+    watermark dates, e.g. of a full download, are taken as in the db, so gaps there
+    are not repaired, as with compact downloads.
+
+        Parameters
+        ----------
+        api_prices : pd.DataFrame
+            Concatenated API data of the batch, one or more symbols
+        watermarks: pd.DataFrame
+            One row per symbol with db prices, symbols without are missing
+        sizes: dict
+            API size (compact or full) downloaded per symbol
+        watermark_dates: int
+            Maximum number of dates in the watermarks
+
+        Returns
+        -------
+        decisions: pd.DataFrame
+            Indexed by symbol, with boolean columns
+            should_upload: there are API dates to upload
+            clean_db_table: every db row of the symbol should be deleted
+            price_break: prices changed at the last db date (split or dividend)
+            needs_full: the full history has to be downloaded before uploading
+            fallback: not settled, see above
+        api_prices_upload: pd.DataFrame
+            Rows of api_prices to upload, for settled symbols not needing a full download
+    """
+    symbols = pd.Index(api_prices.symbol.unique())
+    n = len(symbols)
+    codes = symbols.get_indexer(api_prices.symbol)
+    api_ordinals = to_ordinals(api_prices.date)
+
+    # Watermarks aligned to the symbol codes
+    wm = watermarks.loc[watermarks.symbol.isin(symbols)]
+    wm_codes = symbols.get_indexer(wm.symbol)
+    n_dates = wm.dates.map(len).to_numpy(dtype=np.int64)
+    has_wm = np.zeros(n, dtype=bool)
+    has_wm[wm_codes] = True
+    wm_ordinals = np.full(n, np.iinfo(np.int64).min)
+    wm_ordinals[wm_codes] = to_ordinals(wm.date)
+    wm_values = np.full((n, len(COLS_EQUAL)), np.nan)
+    wm_values[wm_codes] = wm[COLS_EQUAL].to_numpy(dtype=float)
+    oldest_ordinals = np.full(n, np.iinfo(np.int64).min)
+    oldest_ordinals[wm_codes] = to_ordinals(wm.dates.map(lambda dates: dates[-1]))
+    complete = np.ones(n, dtype=bool)
+    complete[wm_codes] = n_dates < watermark_dates
+
+    # API dates up to the last db date must be in the watermark dates, over the span
+    # of the watermark dates only if they are truncated
+    db_codes = np.repeat(wm_codes, n_dates)
+    db_ordinals = to_ordinals(np.concatenate([[]] + wm.dates.to_list()))
+    in_db = np.isin(_to_keys(codes, api_ordinals), _to_keys(db_codes, db_ordinals))
+    known = api_ordinals <= wm_ordinals[codes]
+    in_span = complete[codes] | (api_ordinals >= oldest_ordinals[codes])
+    fallback = has_wm & _any_by_code(codes, known & in_span & ~in_db, n)
+
+    # Continuation: the API row at the last db date has the same prices
+    is_new = api_ordinals > wm_ordinals[codes]
+    has_new = _any_by_code(codes, is_new, n)
+    api_values = api_prices[COLS_EQUAL].to_numpy(dtype=float)
+    wm_rows = wm_values[codes]
+    same = ((api_values == wm_rows) | (np.isnan(api_values) & np.isnan(wm_rows))).all(axis=1)
+    continues = _any_by_code(codes, (api_ordinals == wm_ordinals[codes]) & same, n)
+
+    is_full = np.array([sizes[symbol] == "full" for symbol in symbols], dtype=bool)
+    settled = ~fallback
+    should_upload = settled & (~has_wm | has_new)
+    price_break = settled & has_wm & has_new & ~continues
+    clean_db_table = settled & (~has_wm | price_break)
+    needs_full = clean_db_table & ~is_full
+
+    decisions = pd.DataFrame(
+        {
+            "should_upload": should_upload,
+            "clean_db_table": clean_db_table,
+            "price_break": price_break,
+            "needs_full": needs_full,
+            "fallback": fallback,
+        },
+        index=symbols,
+    )
+
+    # Whole API history when cleaning, only the new dates otherwise
+    upload_rows = (should_upload & ~needs_full)[codes] & (clean_db_table[codes] | is_new)
+    api_prices_upload = api_prices.loc[upload_rows]
+
+    return decisions, api_prices_upload
@@ -0,0 +1,205 @@
+import io
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Fields of each day in TIME_SERIES_DAILY_ADJUSTED, in API order
+DAILY_ADJUSTED_FIELDS = [
+    "1. open",
+    "2. high",
+    "3. low",
+    "4. close",
+    "5. adjusted close",
+    "6. volume",
+    "7. dividend amount",
+    "8. split coefficient",
+]
+
+# Columns of TIME_SERIES_DAILY_ADJUSTED with datatype=csv, after timestamp
+DAILY_ADJUSTED_CSV_COLUMNS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "adjusted_close",
+    "volume",
+    "dividend_amount",
+    "split_coefficient",
+]
+
+# Report lists of BALANCE_SHEET and INCOME_STATEMENT payloads, with their report_type
+ACCOUNTING_REPORT_TYPES = {"annualReports": "A", "quarterlyReports": "Q"}
+
+# Columns returned by parse_accounting
+ACCOUNTING_COLUMNS = [
+    "symbol",
+    "report_type",
+    "report_date",
+    "currency",
+    "account_name",
+    "account_value",
+]
+
+
+def loads(content: bytes):
+    """Decodes a JSON payload, with orjson if installed."""
+    if orjson is not None:
+        return orjson.loads(content)  # pylint: disable=no-member
+    return json.loads(content)
+
+
+def parse_daily_adjusted(content: bytes, symbol: str) -> pd.DataFrame:
+    """Parses a raw TIME_SERIES_DAILY_ADJUSTED payload into a prices DataFrame.
+
+    Builds typed NumPy columns straight from the decoded JSON, instead of transposing
+    a DataFrame of strings. Rows keep the API order (most recent first).
+
+        Parameters
+        ----------
+        content : bytes
+            Raw API response
+        symbol : str
+
+        Returns
+        -------
+        pd.DataFrame
+            Columns symbol, date (datetime.date), open, high, low, close, adjusted_close,
+            volume, dividend_amount, split_coefficient (float) and lud
+    """
+    prices_json = loads(content)
+    if "Time Series (Daily)" not in prices_json:
+        raise ValueError(
+            "Json file did not have 'Time Series (Daily)' as key. "
+            f"File content is:\n {prices_json}"
+        )
+    time_series = prices_json["Time Series (Daily)"]
+
+    # Missing fields become NaN
+    fields = DAILY_ADJUSTED_FIELDS
+    for day in time_series.values():
+        if len(day) != len(fields) or any(field not in day for field in fields):
+            fields = list(dict.fromkeys(field for day in time_series.values() for field in day))
+            break
+    flat = (float(day.get(field, "nan")) for day in time_series.values() for field in fields)
+    values = np.fromiter(flat, dtype=float, count=len(time_series) * len(fields))
+    values = values.reshape(len(time_series), len(fields))
+
+    # Remove enumeration at beginning of columns (e.g. "1. open")
+    prices = {"symbol": np.full(len(time_series), symbol, dtype=object)}
+    prices["date"] = np.array(list(time_series), dtype="datetime64[D]").astype(object)
+    for i, field in enumerate(fields):
+        prices[field[3:].replace(" ", "_")] = values[:, i]
+    prices = pd.DataFrame(prices)
+
+    # Last update date
+    prices["lud"] = datetime.now()
+
+    return prices
+
+
+def _raise_if_json_error(content: bytes):
+    """With datatype=csv, errors and throttling notes still come as JSON."""
+    if content.lstrip().startswith(b"{"):
+        raise ValueError(f"Expected csv content. File content is:\n {loads(content)}")
+
+
+def parse_daily_adjusted_csv(content: bytes, symbol: str) -> pd.DataFrame:
+    """Parses a raw TIME_SERIES_DAILY_ADJUSTED payload downloaded with datatype=csv.
+
+    Returns the same DataFrame as parse_daily_adjusted does for the JSON payload.
+    Numbers are parsed with round_trip precision, so they match Python's float.
+    """
+    _raise_if_json_error(content)
+    dtypes = dict.fromkeys(DAILY_ADJUSTED_CSV_COLUMNS, float)
+    dtypes["timestamp"] = str
+    csv_prices = pd.read_csv(io.BytesIO(content), dtype=dtypes, float_precision="round_trip")
+
+    prices = {"symbol": np.full(len(csv_prices), symbol, dtype=object)}
+    prices["date"] = csv_prices.timestamp.to_numpy(dtype="datetime64[D]").astype(object)
+    for col in DAILY_ADJUSTED_CSV_COLUMNS:
+        prices[col] = csv_prices[col].to_numpy()
+    prices = pd.DataFrame(prices)
+
+    # Last update date
+    prices["lud"] = datetime.now()
+
+    return prices
+
+
+def parse_listings(content: bytes) -> pd.DataFrame:
+    """Parses a raw LISTING_STATUS payload (always csv) into a DataFrame of strings.
+
+    Values are kept verbatim, as csv.reader does, e.g. missing dates stay "null".
+    """
+    _raise_if_json_error(content)
+    return pd.read_csv(io.BytesIO(content), dtype=str, keep_default_na=False, na_filter=False)
+
+
+def parse_accounting(payloads: dict, accounts: list) -> pd.DataFrame:
+    """Flattens BALANCE_SHEET or INCOME_STATEMENT payloads into one row per account value.
+
+    Reports of every symbol are flattened in a single pass, annual ones first, and
+    values are converted at once. Values that are not numbers (e.g. "None") are
+    dropped, the rest are truncated to integers. Currencies longer than three
+    characters (e.g. "None") are left empty.
+
+        Parameters
+        ----------
+        payloads : dict
+            Raw (bytes) or decoded API response per symbol
+        accounts : list
+            Accounts to keep, e.g. ["totalAssets", "commonStock"]
+
+        Returns
+        -------
+        pd.DataFrame
+            Columns ACCOUNTING_COLUMNS, account_value as int64
+    """
+    report_keys = []
+    report_sizes = []
+    account_names = []
+    values = []
+    for symbol, payload in payloads.items():
+        if isinstance(payload, (bytes, str)):
+            payload = loads(payload)
+        if not any(key in payload for key in ACCOUNTING_REPORT_TYPES):
+            raise ValueError(f"No reports for {symbol}. File content is:\n {payload}")
+        for key_report, report_type in ACCOUNTING_REPORT_TYPES.items():
+            for report in payload.get(key_report, []):
+                present = [account for account in accounts if account in report]
+                currency = report.get("reportedCurrency", "None")
+                report_keys.append(
+                    (
+                        symbol,
+                        report_type,
+                        report["fiscalDateEnding"],
+                        currency if len(currency) <= 3 else "",
+                    )
+                )
+                report_sizes.append(len(present))
+                account_names.extend(present)
+                values.extend(report[account] for account in present)
+
+    # One row per account value, report columns repeated
+    report_keys = np.array(report_keys, dtype=object).reshape(-1, 4)
+    data = {
+        column: np.repeat(report_keys[:, i], report_sizes)
+        for i, column in enumerate(ACCOUNTING_COLUMNS[:4])
+    }
+    data["account_name"] = np.array(account_names, dtype=object)
+    values = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+    data["account_value"] = values.astype("float64")
+    data = pd.DataFrame(data)
+
+    # Only finite numbers, e.g. "None" is not reported
+    data = data.loc[np.isfinite(data.account_value)].reset_index(drop=True)
+    data["account_value"] = np.trunc(data.account_value).astype("int64")
+
+    return data
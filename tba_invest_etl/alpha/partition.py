@@ -0,0 +1,151 @@
+import heapq
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Cost model of one symbol, in seconds, used when it has no last_duration
+REQUEST_SECONDS = 1.0
+FETCH_ROW_SECONDS = 5e-5
+
+# Seconds to write one row, paid on top of the fetch
+WRITE_ROW_SECONDS = 2e-5
+
+# Rows expected of a symbol without watermark: a full price history, about 25 years,
+# and the accounting rows of a table
+PRICES_ROWS = 6300
+ACCOUNTING_ROWS = 400
+
+# Share of the Lambda timeout a sublist is planned to use
+TIMEOUT_SAFETY = 0.8
+
+# "Wait One Hour" of the update state machines, run alongside every batch but the last.
+# Batches hold at most the API calls allowed in that time, max_assets_in_batch.
+BATCH_WAIT_SECONDS = 3600
+
+
+def get_call_interval(calls_per_minute: int, n_lists: int) -> float:
+    """Seconds between the calls of one sublist when n_lists share the API quota."""
+    return 60 * n_lists / calls_per_minute
+
+
+def estimate_costs(
+    assets: pd.DataFrame,
+    call_interval: float,
+    default_rows: int = PRICES_ROWS,
+    max_rows: Optional[int] = None,
+) -> pd.Series:
+    """Predicted seconds to update each symbol of assets, indexed by symbol.
+
+    The fetch takes the last_duration measured for the symbol, or a per-request and
+    per-row estimate without one, and never less than call_interval, its share of
+    the API quota. Writing the expected rows is added to it.
+
+        Parameters
+        ----------
+        assets : pd.DataFrame
+            symbol, with row_count and last_duration from table_watermarks if known
+        call_interval: float
+            Seconds between calls of one sublist, see get_call_interval
+        default_rows: int
+            Rows expected of symbols without row_count
+        max_rows: int
+            Rows returned by the API at most, e.g. 100 with outputsize=compact
+
+        Returns
+        -------
+        costs: pd.Series
+            Predicted seconds by symbol
+    """
+    rows = pd.Series(default_rows, index=assets.index, dtype=np.float64)
+    if "row_count" in assets:
+        rows = assets.row_count.astype(np.float64).fillna(default_rows)
+    if max_rows is not None:
+        rows = rows.clip(upper=max_rows)
+
+    fetch = REQUEST_SECONDS + rows * FETCH_ROW_SECONDS
+    if "last_duration" in assets:
+        fetch = assets.last_duration.astype(np.float64).fillna(fetch)
+    fetch = np.maximum(fetch.to_numpy(), call_interval)
+
+    costs = fetch + rows.to_numpy() * WRITE_ROW_SECONDS
+    return pd.Series(costs, index=assets.symbol.to_numpy(), name="seconds")
+
+
+def balance_lists(costs: pd.Series, n_lists: int) -> list:
+    """Splits symbols into at most n_lists sublists of similar predicted seconds.
+
+    Longest processing time first: symbols by decreasing cost, each to the sublist
+    with the least seconds so far. The makespan is at most 4/3 of the optimal one.
+    Returns (symbols, predicted seconds) pairs, empty sublists are dropped.
+    """
+    lists = [[] for _ in range(n_lists)]
+    loads = [(0.0, i) for i in range(n_lists)]
+    for symbol, cost in costs.sort_values(ascending=False, kind="stable").items():
+        load, i = heapq.heappop(loads)
+        lists[i].append(symbol)
+        heapq.heappush(loads, (load + cost, i))
+
+    seconds = {i: load for load, i in loads}
+    return [(lists[i], seconds[i]) for i in range(n_lists) if lists[i]]
+
+
+def partition_batches(
+    costs: pd.Series,
+    n_lists: int,
+    max_assets_in_batch: int,
+    max_list_seconds: float,
+) -> list:
+    """Cuts symbols into batches of load balanced sublists.
+
+    Symbols are taken in order, up to max_assets_in_batch per batch, the API calls
+    allowed between batches. A batch is made smaller only when one of its n_lists
+    sublists would need more than max_list_seconds, e.g. the Lambda timeout with
+    some margin. A symbol costing more than that gets a batch of its own.
+
+        Returns
+        -------
+        batches: list
+            One list per batch of (symbols, predicted seconds) sublists, see
+            balance_lists
+    """
+    batch_seconds = n_lists * max_list_seconds
+    batches = []
+    start = 0
+    cum_costs = costs.cumsum().to_numpy()
+    while start < len(costs):
+        # Batches whose sublists fit on average, then shrunk until the longest fits
+        previous = cum_costs[start - 1] if start > 0 else 0.0
+        end = int(np.searchsorted(cum_costs, previous + batch_seconds, side="right"))
+        end = min(max(end, start + 1), start + max_assets_in_batch, len(costs))
+        while True:
+            lists = balance_lists(costs.iloc[start:end], n_lists)
+            longest = max(seconds for _, seconds in lists)
+            if longest <= max_list_seconds or end - start == 1:
+                break
+            size = min(int((end - start) * max_list_seconds / longest), end - start - 1)
+            end = start + max(size, 1)
+        batches.append(lists)
+        start = end
+    return batches
+
+
+def get_run_makespan(batch_makespans: list, wait_seconds: float = BATCH_WAIT_SECONDS) -> float:
+    """Predicted seconds of a state machine run, batches one after the other.
+
+    Every batch but the last lasts at least wait_seconds, 0 if batches do not wait.
+    """
+    waited = [max(seconds, wait_seconds) for seconds in batch_makespans[:-1]]
+    return sum(waited) + sum(batch_makespans[-1:])
+
+
+def get_makespan(predicted_seconds: Optional[float], started: float) -> dict:
+    """Predicted and actual seconds of a sublist, started is a time.monotonic() value.
+
+    The actual makespan of a batch is the maximum over its sublists.
+    """
+    return {
+        "predicted_seconds": predicted_seconds,
+        "actual_seconds": round(time.monotonic() - started, 1),
+    }
@@ -0,0 +1,143 @@
+import threading
+import time
+from typing import Optional
+
+from tba_invest_etl.domain_models.io import SQLParams
+from tba_invest_etl.utils import sql_manager
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting calls to max_requests_per_min.
+
+    Tokens are refilled continuously at max_requests_per_min / 60 per second, up to
+    capacity. With the default capacity of 1 no rolling minute ever sees more than
+    max_requests_per_min + 1 calls, no matter how many threads draw from the bucket.
+    """
+
+    def __init__(self, max_requests_per_min: int, capacity: Optional[int] = None):
+        self.max_requests_per_min = max_requests_per_min
+        self.rate_per_sec = max_requests_per_min / 60
+        self.capacity = 1 if capacity is None else capacity
+        self.tokens = float(self.capacity)
+        self.last_refill_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill_time) * self.rate_per_sec
+        )
+        self.last_refill_time = now
+
+    def acquire(self) -> float:
+        """Takes one token, sleeping until one is available.
+
+        Returns
+        -------
+        float
+            Seconds spent waiting for the token
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate_per_sec
+
+            # Sleep outside the lock so other threads can check the bucket
+            time.sleep(delay)
+            waited += delay
+
+
+class PostgresRateLimiter:
+    """Token bucket stored in a Postgres table, shared by every process using the same name.
+
+    Each acquire refills and takes a token in a single statement holding the bucket's
+    row lock, so any number of Lambda workers can draw from one API quota without
+    exceeding it. The database clock is used, so workers need not agree on time.
+    The api_rate_limit table is created by db/alpha/api_rate_limit.sql. Close the
+    limiter, or use it as a context manager, to release its connection.
+    """
+
+    REGISTER_QUERY = """
+        insert into api_rate_limit (name, max_requests_per_min, capacity, tokens, updated_at)
+        values (%(name)s, %(max_requests_per_min)s, %(capacity)s, %(capacity)s, clock_timestamp())
+        on conflict (name) do update
+        set max_requests_per_min = excluded.max_requests_per_min,
+            capacity = excluded.capacity,
+            tokens = least(api_rate_limit.tokens, excluded.capacity)
+    """
+
+    ACQUIRE_QUERY = """
+        with refill as (
+            select name, max_requests_per_min, clock_timestamp() as refill_time,
+                least(
+                    capacity,
+                    tokens + max_requests_per_min / 60.0
+                        * greatest(extract(epoch from clock_timestamp() - updated_at), 0)
+                ) as tokens
+            from api_rate_limit
+            where name = %(name)s
+            for update
+        )
+        update api_rate_limit a
+        set tokens = case when r.tokens >= 1 then r.tokens - 1 else r.tokens end,
+            updated_at = r.refill_time
+        from refill r
+        where a.name = r.name
+        returning r.tokens >= 1 as granted, (1 - r.tokens) * 60.0 / r.max_requests_per_min
+    """
+
+    def __init__(
+        self,
+        sql_params: SQLParams,
+        name: str = "alpha_vantage",
+        max_requests_per_min: int = 75,
+        capacity: int = 1,
+    ):
+        self.name = name
+        self.max_requests_per_min = max_requests_per_min
+        self.capacity = capacity
+        # Private connexion, it is used from every thread drawing from this limiter
+        self.sql = sql_manager.ManagerSQL(sql_params, shared=False)
+        self.lock = threading.Lock()
+
+        self.sql.query(
+            self.REGISTER_QUERY,
+            {"name": name, "max_requests_per_min": max_requests_per_min, "capacity": capacity},
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.sql.cnxn.close()
+
+    def acquire(self) -> float:
+        """Takes one token from the shared bucket, sleeping until one is available.
+
+        Returns
+        -------
+        float
+            Seconds spent waiting for the token
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                rows = self.sql.query_fetchall(self.ACQUIRE_QUERY, {"name": self.name})
+            if not rows:
+                raise ValueError(f"Rate limiter {self.name} is not registered in api_rate_limit")
+
+            granted, delay = rows[0]
+            if granted:
+                return waited
+
+            # Sleep outside the lock so other threads can check the bucket
+            delay = float(delay)
+            time.sleep(delay)
+            waited += delay
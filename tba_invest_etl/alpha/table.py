@@ -1,63 +1,222 @@
-import csv
+# pylint: disable=too-many-lines
+import time
 from abc import ABC
+from collections import Counter
+from concurrent import futures
 from datetime import datetime
+from typing import TYPE_CHECKING, Optional
 
 import numpy as np
 import pandas as pd
 
-from tba_invest_etl.alpha import api
+from tba_invest_etl.alpha import aggregation, continuity, parsers
 from tba_invest_etl.domain_models.io import SQLParams
 from tba_invest_etl.utils import date_utils, sql_manager, utils
 
+# Only for annotations, so handlers that do not scrape skip importing requests
+if TYPE_CHECKING:
+    from tba_invest_etl.alpha import api
+
 URL_BASE = "https://www.alphavantage.co/query?function="
 
 
+def select_list(columns: Optional[list]) -> str:
+    """Select list of a projected query, every column when columns is empty."""
+    return ", ".join(columns) if columns else "*"
+
+
 class AlphaTable(ABC):
+    # Columns read by _get_db_data, every column when None. See get_db_columns
+    DB_COLUMNS: Optional[list] = None
+
+    # Date column whose maximum is kept as last_date in table_watermarks
+    DATE_COLUMN = "date"
+
     def __init__(
         self,
         table_name: str,
         primary_keys: list,
-        scraper: api.AlphaScraper,
+        scraper: "api.AlphaScraper",
         sql_params: SQLParams,
     ):
         self.table_name = table_name
         self.primary_keys = primary_keys
         self.scraper = scraper
         self.sql = sql_manager.ManagerSQL(sql_params)
+        self.sql.prepare(
+            f"{table_name}_by_symbol",
+            f"select {select_list(self.get_db_columns())} from {table_name} where symbol = $1",
+            ["text"],
+        )
+
+        # Seconds of the last successful get_api_data of each symbol, both downloads
+        # when it was fetched twice
+        self.fetch_seconds = {}
+
+        # Whether table_watermarks exists, checked on first use, see has_table_watermarks
+        self._has_table_watermarks = None
+
+        # Watermarks of written symbols, recomputed from their rows only
+        self.sql.prepare(
+            f"{table_name}_update_watermarks",
+            f"""
+            insert into table_watermarks (
+                table_name, symbol, last_date, last_lud, row_count, last_fetch, last_duration, lud
+            )
+            select
+                '{table_name}', s.symbol, t.last_date, t.last_lud, t.row_count, $2, s.duration, $2
+            from unnest($1::text[], $3::float8[]) s(symbol, duration)
+            cross join lateral (
+                select max({self.DATE_COLUMN}) last_date, max(lud) last_lud, count(*) row_count
+                from {table_name} t
+                where t.symbol = s.symbol
+            ) t
+            on conflict (table_name, symbol) do update set
+                last_date = excluded.last_date,
+                last_lud = excluded.last_lud,
+                row_count = excluded.row_count,
+                last_fetch = excluded.last_fetch,
+                last_duration = coalesce(excluded.last_duration, table_watermarks.last_duration),
+                lud = excluded.lud
+            """,
+            ["text[]", "timestamp", "float8[]"],
+        )
+        self.sql.prepare(
+            f"{table_name}_touch_watermarks",
+            f"""
+            update table_watermarks w set
+                last_fetch = $2,
+                last_duration = coalesce(s.duration, w.last_duration)
+            from unnest($1::text[], $3::float8[]) s(symbol, duration)
+            where w.table_name = '{table_name}'
+                and w.symbol = s.symbol
+            """,
+            ["text[]", "timestamp", "float8[]"],
+        )
+
+    def get_db_columns(self) -> Optional[list]:
+        """Columns the update path compares against the API data."""
+        return self.DB_COLUMNS
 
     def _get_db_data(self, symbol: str) -> pd.DataFrame:
-        query = f"select * from {self.table_name} where symbol = '{symbol}'"
-        db_data = self.sql.select_query(query)
+        db_data = self.sql.select_prepared(f"{self.table_name}_by_symbol", [symbol])
         return db_data
 
+    def get_api_data_concurrently(
+        self, symbols: list, max_workers: int, symbol_kwargs: Optional[dict] = None, **kwargs
+    ):
+        """Yields (symbol, api data) pairs as downloads complete.
+
+        Up to max_workers calls to get_api_data are in flight at once. They all draw
+        from the scraper's rate limiter, so the API quota is still honoured.
+        symbol_kwargs optionally maps each symbol to its own get_api_data arguments.
+        """
+        symbol_kwargs = symbol_kwargs or {}
+        get_api_data = self.get_api_data  # pylint: disable=no-member
+        ex = futures.ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            future_to_symbol = {}
+            for symbol in symbols:
+                future = ex.submit(get_api_data, symbol, **kwargs, **symbol_kwargs.get(symbol, {}))
+                future_to_symbol[future] = symbol
+            for future in futures.as_completed(future_to_symbol):
+                yield future_to_symbol[future], future.result()
+        finally:
+            # If the consumer raises or stops iterating, queued downloads would only
+            # spend API quota, cancel them and wait for those already in flight
+            ex.shutdown(wait=True, cancel_futures=True)
+
     def get_assets_to_refresh(self, asset_types):
-        """Returns DataFrame with unique tickers from asset_table"""
-
-        # Get full assets table
-        query = "select * from assets_alpha"
-        assets = self.sql.select_query(query)
-
-        # Filter and drop duplicates
-        assets = (
-            assets.loc[assets.asset_type.isin(asset_types)]
-            .sort_values(by=["symbol", "status", "delisting_date"])
-            .drop_duplicates(subset="symbol", keep="first")
-            .reset_index(drop=True)
-        )
+        """Returns DataFrame with unique tickers from asset_table, with their delisting_date.
+
+        Filtered and de-duplicated in the database, keeping the first row of each
+        symbol by status and delisting_date. Byte order ("C") matches a pandas sort.
+        """
+        query = """
+            select distinct on (symbol collate "C") symbol, delisting_date
+            from assets_alpha
+            where asset_type = any(%(asset_types)s)
+            order by symbol collate "C", status collate "C", delisting_date
+        """
+        assets = self.sql.select_query(query, {"asset_types": list(asset_types)})
 
         return assets
 
-    def filter_assets_by_max_date(self, assets, date_col, last_reference_date_fun):
-        # Get last available date in db prices table
-        query = f"""
-            select symbol, max({date_col}) max_date
-            from {self.table_name}
-            group by symbol
+    def _record_fetch_seconds(self, symbol: str, parse_started: float):
+        """Adds the seconds of the last API call of symbol and of its parsing.
+
+        Waits for the rate limiter depend on the other workers of the run, they are
+        left out. Nothing is recorded for responses served from the cache.
+        """
+        timing = self.scraper.get_last_timing()
+        if timing is None:
+            return
+        seconds = timing.total + time.monotonic() - parse_started
+        self.fetch_seconds[symbol] = self.fetch_seconds.get(symbol, 0.0) + seconds
+
+    def has_table_watermarks(self) -> bool:
+        """Whether table_watermarks exists, see db/alpha/table_watermarks.sql.
+
+        Until it is created, planning aggregates the table as before and watermarks
+        are not written, so deploying ahead of the migration does not fail the writes.
         """
-        assets_max_date = self.sql.select_query(query)
+        if self._has_table_watermarks is None:
+            exists = self.sql.query_fetchall("select to_regclass('table_watermarks')")[0][0]
+            self._has_table_watermarks = exists is not None
+            if not self._has_table_watermarks:
+                print(
+                    "Warning: table_watermarks does not exist, apply "
+                    "db/alpha/table_watermarks.sql. Planning from the aggregated "
+                    f"{self.table_name} and skipping watermark writes"
+                )
+        return self._has_table_watermarks
+
+    def update_table_watermarks(self, symbols: list):
+        """Recomputes the table_watermarks rows of symbols after a successful fetch.
+
+        Call it in the transaction that writes their rows, so watermarks and rows
+        are committed together. last_duration is taken from fetch_seconds.
+        """
+        if len(symbols) > 0 and self.has_table_watermarks():
+            durations = [self.fetch_seconds.get(symbol) for symbol in symbols]
+            self.sql.query_prepared(
+                f"{self.table_name}_update_watermarks",
+                [list(symbols), datetime.now(), durations],
+            )
+
+    def touch_table_watermarks(self, symbols: list):
+        """Records a successful fetch of symbols that left their rows unchanged."""
+        if len(symbols) > 0 and self.has_table_watermarks():
+            durations = [self.fetch_seconds.get(symbol) for symbol in symbols]
+            self.sql.query_prepared(
+                f"{self.table_name}_touch_watermarks",
+                [list(symbols), datetime.now(), durations],
+            )
 
-        assets = assets.merge(assets_max_date, how="left", left_on="symbol", right_on="symbol")
+    def get_table_watermarks(self) -> pd.DataFrame:
+        """Returns the table_watermarks of this table, last_date as max_date.
 
+        Aggregated from the table, without last_duration, if table_watermarks does
+        not exist.
+        """
+        if not self.has_table_watermarks():
+            query = f"""
+                select symbol, max({self.DATE_COLUMN}) max_date, count(*) row_count,
+                    null::float8 last_duration
+                from {self.table_name}
+                group by symbol
+            """
+            return self.sql.select_query(query)
+
+        query = """
+            select symbol, last_date max_date, row_count, last_duration
+            from table_watermarks
+            where table_name = %(table_name)s
+        """
+        return self.sql.select_query(query, {"table_name": self.table_name})
+
+    def filter_assets_by_max_date(self, assets, last_reference_date_fun):
+        """Drops assets already up to date, assets has the columns of get_table_watermarks."""
         # if active, last date in db (max_date) == self.last_business_date
         cond_last_bd = assets.max_date >= last_reference_date_fun(datetime.today())
         cond_delisted = assets.max_date >= assets.delisting_date.map(last_reference_date_fun)
@@ -107,8 +266,8 @@ class AlphaTableAssets(AlphaTable):
 
             Side effects
             ------------
-            Deletes assets_alpha content and then updates the table
-            with data from the API using date_input
+            Replaces assets_alpha content atomically with data from
+            the API using date_input
         """
 
         # Date
@@ -118,9 +277,8 @@ class AlphaTableAssets(AlphaTable):
         # Download listing status
         data = self.get_api_data(date_input)
 
-        # Update assets table
-        self.sql.clean_table(self.table_name)
-        self.sql.upload_df_chunks(self.table_name, data)
+        # Replace assets table
+        self.sql.refresh_table(self.table_name, data)
 
     def get_api_data(self, date_input):
         # Download active
@@ -130,7 +288,7 @@ class AlphaTableAssets(AlphaTable):
         data_delist = self._download_delisted(date_input)
 
         # Concatenate
-        data = data_active.append(data_delist).reset_index(drop=True)
+        data = pd.concat([data_active, data_delist], ignore_index=True)
 
         # Rename columns
         data.columns = [utils.camel_to_snake(col) for col in data.columns]
@@ -155,10 +313,7 @@ class AlphaTableAssets(AlphaTable):
         url = "{URL_BASE}LISTING_STATUS&apikey=demo"
 
         download = self.scraper.hit_api(url)
-        decoded_content = download.content.decode("utf-8")
-        cr = csv.reader(decoded_content.splitlines(), delimiter=",")
-        my_list = list(cr)
-        data = pd.DataFrame(my_list[1:], columns=my_list[0])
+        data = parsers.parse_listings(download.content)
 
         return data
 
@@ -180,28 +335,299 @@ class AlphaTableAssets(AlphaTable):
         url = "{URL_BASE}LISTING_STATUS&date={dte}&state=delisted&apikey={api_key}"
         dte = date_input.strftime("%Y-%m-%d")
         download = self.scraper.hit_api(url, dte=dte)
-        decoded_content = download.content.decode("utf-8")
-        cr = csv.reader(decoded_content.splitlines(), delimiter=",")
-        my_list = list(cr)
-        data = pd.DataFrame(my_list[1:], columns=my_list[0])
+        data = parsers.parse_listings(download.content)
 
         return data
 
 
 class AlphaTablePrices(AlphaTable):
-    def get_assets(self, validate: bool, asset_types: list):
-        assets = self.get_assets_to_refresh(asset_types)
+    # Keys and the columns compared by get_api_prices_to_upload
+    DB_COLUMNS = ["symbol", "date", *continuity.COLS_EQUAL]
+
+    # Number of data points returned by the API with outputsize=compact
+    COMPACT_SIZE = 100
+
+    # Number of recent db dates kept in each watermark, covers a compact download
+    WATERMARK_DATES = 120
+
+    def __init__(self, *args, datatype: str = "json", write_mode: str = "replace", **kwargs):
+        super().__init__(*args, **kwargs)
+        assert datatype in ("json", "csv"), f"Unknown datatype {datatype}"
+        assert write_mode in ("upsert", "replace"), f"Unknown write_mode {write_mode}"
+        self.datatype = datatype
+        self.write_mode = write_mode
+        self.fetch_stats = Counter()
+
+        # Statements run for every batch, parsed once per connection
+        self.sql.prepare(
+            f"{self.table_name}_watermarks",
+            f"""
+            select p.*, d.dates
+            from unnest($1::text[]) s(symbol)
+            cross join lateral (
+                select symbol, date, close, adjusted_close, dividend_amount, split_coefficient
+                from {self.table_name} p
+                where p.symbol = s.symbol
+                order by date desc, lud desc
+                limit 1
+            ) p
+            cross join lateral (
+                select array_agg(date order by date desc) dates
+                from (
+                    select distinct date
+                    from {self.table_name} q
+                    where q.symbol = s.symbol
+                    order by date desc
+                    limit $2
+                ) q
+            ) d
+            """,
+            ["text[]", "int"],
+        )
+        self.sql.prepare(
+            f"{self.table_name}_delete_symbols",
+            f"delete from {self.table_name} where symbol = any($1)",
+            ["text[]"],
+        )
+        self.sql.prepare(
+            f"{self.table_name}_delete_from_dates",
+            f"""
+            delete from {self.table_name} p
+            using unnest($1::text[], $2::date[]) d(symbol, date)
+            where p.symbol = d.symbol
+                and p.date >= d.date
+            """,
+            ["text[]", "date[]"],
+        )
+
+    def _get_db_data(self, symbol: str) -> pd.DataFrame:
+        # Full price histories, read as typed columns instead of Decimal objects
+        columns = select_list(self.get_db_columns())
+        query = f"select {columns} from {self.table_name} where symbol = %(symbol)s"
+        return self.sql.select_typed(query, {"symbol": symbol})
+
+    def get_assets(self, validate: bool, asset_types: list, assets: Optional[pd.DataFrame] = None):
+        """Assets to update, assets from get_assets_to_refresh are read if not given."""
+        if assets is None:
+            assets = self.get_assets_to_refresh(asset_types)
+        assets = assets.merge(self.get_table_watermarks(), how="left", on="symbol")
         if not validate:
-            assets = self.filter_assets_by_max_date(
-                assets, "date", date_utils.get_last_business_date
-            )
+            assets = self.filter_assets_by_max_date(assets, date_utils.get_last_business_date)
         assets = assets.reset_index(drop=True)
         return assets
 
-    def update_list(self, symbols: list, size: str):
+    def update_list(
+        self,
+        symbols: list,
+        size: str,
+        max_workers: int = 1,
+        corporate_actions: Optional[set] = None,
+    ) -> dict:
+        """Updates prices for symbols, choosing compact or full per symbol up front.
+
+        Returns fetch statistics of the run, see plan_sizes.
+        """
         print(f"Updating prices for {symbols}")
+        self.fetch_stats = Counter()
+
+        # Decide compact or full once, so a symbol is not downloaded twice
+        watermarks = self._get_db_watermarks(symbols)
+        sizes = self.plan_sizes(symbols, size, watermarks, corporate_actions)
+
+        api_data = self._get_api_prices(symbols, sizes, max_workers)
+        api_frames = {
+            symbol: api_prices
+            for symbol, api_prices in api_data
+            if api_prices is not None and api_prices.shape[0] > 0
+        }
+        if api_frames:
+            self.update_from_batch_api_data(api_frames, sizes, watermarks, max_workers)
+
+        fetch_stats = dict(self.fetch_stats)
+        print(f"fetch_stats = {fetch_stats}")
+        return fetch_stats
+
+    def _get_api_prices(self, symbols: list, sizes: dict, max_workers: int):
+        """Yields (symbol, prices) downloaded with the size planned for each symbol."""
+        if max_workers > 1:
+            symbol_kwargs = {symbol: {"size": sizes[symbol]} for symbol in symbols}
+            return self.get_api_data_concurrently(symbols, max_workers, symbol_kwargs)
+        return ((symbol, self.get_api_data(symbol, sizes[symbol])) for symbol in symbols)
+
+    def update_from_batch_api_data(
+        self,
+        api_frames: dict,
+        sizes: dict,
+        watermarks: pd.DataFrame,
+        max_workers: int = 1,
+    ):
+        """Uploads what is missing in the db from the API prices of a batch of symbols.
+
+        Decisions for the whole batch are taken at once by continuity.get_prices_to_upload.
+        Symbols it cannot settle go through update_from_api_data, symbols needing the
+        full history are downloaded again and the rest is written with one delete per
+        kind and one upload.
+        """
+        api_prices = pd.concat(api_frames.values(), ignore_index=True)
+        decisions, api_prices_upload = continuity.get_prices_to_upload(
+            api_prices, watermarks, sizes, self.WATERMARK_DATES
+        )
+        print(f"Decisions for {len(decisions)} symbols:\n{decisions}")
+
+        # Not settled by the watermarks, e.g. gaps in the db
+        for symbol in decisions.index[decisions.fallback]:
+            print(f"Updating prices for {symbol} from its db history")
+            self.fetch_stats["watermark_fallbacks"] += 1
+            self.update_from_api_data(symbol, sizes[symbol], api_frames[symbol])
+
+        # No db prices or split or dividend with a compact download
+        refetch = list(decisions.index[decisions.needs_full])
+        if refetch:
+            self.fetch_stats["double_fetches"] += len(refetch)
+            full_sizes = {symbol: "full" for symbol in refetch}
+            full_frames = [
+                api_prices_full
+                for _, api_prices_full in self._get_api_prices(refetch, full_sizes, max_workers)
+                if api_prices_full is not None and api_prices_full.shape[0] > 0
+            ]
+            api_prices_upload = pd.concat([api_prices_upload] + full_frames, ignore_index=True)
+
+        up_to_date = decisions.index[~decisions.should_upload & ~decisions.fallback]
+        if len(up_to_date) > 0:
+            print(f"Database already up to date for {list(up_to_date)}")
+            self.touch_table_watermarks(list(up_to_date))
+
+        clean_symbols = decisions.index[decisions.clean_db_table]
+        self.write_prices(api_prices_upload, list(clean_symbols))
+
+    def write_prices(self, api_prices_upload: pd.DataFrame, clean_symbols: list):
+        """Writes api_prices_upload, replacing the db rows it supersedes.
+
+        Every db row of clean_symbols is replaced, other symbols are replaced
+        from their first date in api_prices_upload. With write_mode="replace", the
+        default, the rows are deleted and then uploaded. With "upsert" this is applied
+        with an upsert, see _upsert_prices, which needs the unique (symbol, date) index
+        of db/alpha/prices_alpha_upsert_index_*.sql. Either way the writes and the table_watermarks
+        rows of the symbols are committed in a single transaction.
+        """
+        if api_prices_upload.empty:
+            return
+
+        uploaded = set(api_prices_upload.symbol.unique())
+        clean_symbols = [symbol for symbol in clean_symbols if symbol in uploaded]
+        print(f"Writing {api_prices_upload.shape[0]} dates for {len(uploaded)} symbols")
+        with self.sql.transaction():
+            if self.write_mode == "upsert":
+                self._upsert_prices(api_prices_upload, clean_symbols)
+            else:
+                self._replace_prices(api_prices_upload, clean_symbols)
+            self.update_table_watermarks(sorted(uploaded))
+
+    def _replace_prices(self, api_prices_upload: pd.DataFrame, clean_symbols: list):
+        """Deletes the rows api_prices_upload supersedes and then uploads it."""
+        if clean_symbols:
+            print(f"Cleaning {clean_symbols}")
+            self.sql.query_prepared(f"{self.table_name}_delete_symbols", [clean_symbols])
+
+        dates_min = (
+            api_prices_upload.loc[~api_prices_upload.symbol.isin(clean_symbols)]
+            .groupby("symbol")
+            .date.min()
+        )
+        if not dates_min.empty:
+            print(f"Selective cleaning {list(dates_min.index)}")
+            self.sql.query_prepared(
+                f"{self.table_name}_delete_from_dates", [list(dates_min.index), list(dates_min)]
+            )
+
+        self.sql.upload_df_copy(self.table_name, api_prices_upload)
+
+    def _upsert_prices(self, api_prices_upload: pd.DataFrame, clean_symbols: list):
+        """Upserts api_prices_upload on (symbol, date) and deletes the rows it supersedes.
+
+        Only changed rows are written, unchanged ones keep their lud. Db rows in the
+        replaced range but missing from api_prices_upload are deleted, so the result
+        is the same as deleting and then uploading.
+        """
+        with self.sql.transaction():
+            staging = self.sql.upsert_df(
+                self.table_name, api_prices_upload, ["symbol", "date"], ignore_columns=["lud"]
+            )
+            query = f"""
+                delete from {self.table_name} p
+                using (select symbol, min(date) date_min from {staging} group by symbol) s
+                where p.symbol = s.symbol
+                    and (p.symbol = any(%(clean_symbols)s) or p.date >= s.date_min)
+                    and not exists (
+                        select 1 from {staging} u where u.symbol = p.symbol and u.date = p.date
+                    )
+            """
+            self.sql.query(query, {"clean_symbols": clean_symbols})
+
+    def _get_db_watermarks(self, symbols: list) -> pd.DataFrame:
+        """Returns the watermark of each symbol that has prices, in one query.
+
+        The watermark is the last db row, with only the columns compared by
+        get_api_prices_to_upload, plus the WATERMARK_DATES most recent db dates
+        (column dates, descending) used to detect gaps in the db history.
+        Each symbol is resolved with backwards index scans of bounded length.
+        """
+        params = [list(symbols), self.WATERMARK_DATES]
+        return self.sql.select_prepared(f"{self.table_name}_watermarks", params)
+
+    def plan_sizes(
+        self,
+        symbols: list,
+        size: str,
+        watermarks: pd.DataFrame,
+        corporate_actions: Optional[set] = None,
+    ) -> dict:
+        """Returns the API size (compact or full) to fetch for each symbol.
+
+        A compact download is only useful if it reaches back to the last date in the db,
+        otherwise get_api_prices_to_upload asks for the full history and the symbol is
+        downloaded twice. Such symbols are planned as full from the start: those without
+        db prices, those whose last db date is older than the compact window and those
+        with a known split or dividend (corporate_actions) since their last db date.
+
+            Parameters
+            ----------
+            symbols: list
+            size: str
+                Requested size, compact or full
+            watermarks: pd.DataFrame
+                Last db row per symbol, see _get_db_watermarks
+            corporate_actions: set
+                Symbols with a split or dividend since their last db date, if known
+
+        Side effects
+        ------------
+        Counts planned sizes in self.fetch_stats. planned_full is the number of
+        double fetches avoided.
+        """
+        if size == "full":
+            self.fetch_stats["full"] += len(symbols)
+            return {symbol: "full" for symbol in symbols}
+
+        corporate_actions = corporate_actions or set()
+        max_dates = dict(zip(watermarks.symbol, watermarks.date))
+        last_business_date = date_utils.get_last_business_date(datetime.today())
+
+        sizes = {}
         for symbol in symbols:
-            self.update(symbol, size)
+            max_date = max_dates.get(symbol)
+            if max_date is None or symbol in corporate_actions:
+                sizes[symbol] = "full"
+            else:
+                # Business days are an upper bound of trading days after the db watermark
+                days_after = np.busday_count(max_date, last_business_date)
+                sizes[symbol] = "full" if days_after >= self.COMPACT_SIZE - 1 else size
+
+            self.fetch_stats[sizes[symbol]] += 1
+            if sizes[symbol] == "full":
+                self.fetch_stats["planned_full"] += 1
+
+        return sizes
 
     def update(self, symbol: str, size: str):
         print(f"Updating prices for {symbol}")
@@ -209,49 +635,39 @@ class AlphaTablePrices(AlphaTable):
         # Get API prices
         api_prices = self.get_api_data(symbol, size)
 
+        self.update_from_api_data(symbol, size, api_prices)
+
+    def update_from_api_data(
+        self,
+        symbol: str,
+        size: str,
+        api_prices: pd.DataFrame,
+    ):
+        """Uploads what is missing in the db from api_prices."""
         if api_prices is not None:
             if api_prices.shape[0] > 0:
-                # Get database prices
-                db_prices = self._get_db_data(symbol)
-
                 # Check whether and what to upload
-                (
-                    should_upload,
-                    clean_db_table,
-                    api_prices_upload,
-                ) = self.get_api_prices_to_upload(api_prices, db_prices, size)
+                db_prices = self._get_db_data(symbol)
+                to_upload = self.get_api_prices_to_upload(api_prices, db_prices, size)
+                should_upload, clean_db_table, api_prices_upload = to_upload
                 print(f"should_upload = {should_upload}")
                 print(f"clean_db_table = {clean_db_table}")
 
                 if should_upload:
                     if api_prices_upload.empty:
                         # Fetch full history
+                        self.fetch_stats["double_fetches"] += 1
                         api_prices_upload = self.get_api_data(symbol, size="full")
+                        if api_prices_upload is None:
+                            return
 
-                    if clean_db_table:
-                        # DB information has to be deleted for symbol
-
-                        # Clean symbol rows
-                        query = f"delete from {self.table_name} where symbol = '{symbol}'"
-                        print(f"Cleaning {symbol}: {query}")
-                        self.sql.query(query)
-                    else:
-                        date_min = api_prices_upload.date.min()
-                        query = f"""
-                        delete from {self.table_name} 
-                        where symbol = '{symbol}'
-                            and date >= '{date_min}'
-                        """
-                        print(f"Selective cleaning {symbol}: {query}")
-                        self.sql.query(query)
-
-                    # Upload to database
+                    # Upload to database, all symbol rows are replaced if clean_db_table
                     assert api_prices_upload.shape[0] > 0
-                    print(f"Uploading {api_prices_upload.shape[0]} dates for {symbol}")
-                    self.sql.upload_df_chunks(self.table_name, api_prices_upload)
+                    self.write_prices(api_prices_upload, [symbol] if clean_db_table else [])
 
                 else:
                     print(f"Database already up to date for {symbol}")
+                    self.touch_table_watermarks([symbol])
 
     def get_api_data(self, symbol, size="full"):
         """Hit AlphaVantage API to get prices of symbol
@@ -273,45 +689,21 @@ class AlphaTablePrices(AlphaTable):
             "{URL_BASE}TIME_SERIES_DAILY_ADJUSTED"
             "&symbol={symbol}&outputsize={size}&apikey={api_key}"
         )
+        if self.datatype == "csv":
+            url += "&datatype=csv"
 
         try:
             # Hit API
             download = self.scraper.hit_api(url, symbol=symbol, size=size)
-            prices_json = download.json()
 
             # Transform into formatted pandas DataFrame
-            if "Time Series (Daily)" in prices_json:
-                prices = pd.DataFrame(prices_json["Time Series (Daily)"], dtype="float").T
-
-                # Remove enumeration at beginning of columns (e.g. "1. open")
-                col_rename = {col: col[3:].replace(" ", "_") for col in prices.columns}
-                prices.rename(columns=col_rename, inplace=True)
-
-                # Date as a column
-                prices = prices.reset_index().rename(columns={"index": "date"})
-
-                # Include symbol and put as first column
-                prices["symbol"] = symbol
-                cols = list(prices.columns[-1:]) + list(prices.columns[:-1])
-                prices = prices[cols]
-
-                # Change to appropriate variable types
-                dtypes = {
-                    "symbol": "object",
-                    "date": "datetime64[ns]",
-                }
-                prices = prices.astype(dtypes)
-                prices["date"] = prices.date.dt.date
-
-                # Last update date
-                prices["lud"] = datetime.now()
-
-                return prices
-
-            raise ValueError(
-                "Json file did not have 'Time Series (Daily)' as key. "
-                "File content is:\n {prices_json}"
-            )
+            started = time.monotonic()
+            if self.datatype == "csv":
+                data = parsers.parse_daily_adjusted_csv(download.content, symbol)
+            else:
+                data = parsers.parse_daily_adjusted(download.content, symbol)
+            self._record_fetch_seconds(symbol, started)
+            return data
 
         except Exception as e:
             print(f"Download failed for {symbol}. \nurl: {url}")
@@ -444,40 +836,346 @@ class AlphaTablePrices(AlphaTable):
 
 
 class AlphaTablePricesMonthly(ABC):
-    def __init__(self, table_name: str, sql_params: SQLParams):
+    # Daily columns used by _get_prices_monthly
+    DAILY_COLUMNS = [
+        "symbol",
+        "date",
+        "open",
+        "high",
+        "low",
+        "close",
+        "adjusted_close",
+        "volume",
+        "lud",
+    ]
+
+    def __init__(
+        self,
+        table_name: str,
+        sql_params: SQLParams,
+        incremental: bool = False,
+        engine: str = "numpy",
+    ):
+        assert engine in ("numpy", "pandas", "sql"), f"Unknown engine {engine}"
         self.table_name = table_name
         self.sql = sql_manager.ManagerSQL(sql_params)
+        self.incremental = incremental
+        self.engine = engine
+        self.stats = Counter()
+        self.sql.prepare(
+            f"{table_name}_delete_symbols",
+            f"delete from {table_name} where symbol = any($1)",
+            ["text[]"],
+        )
+        self.sql.prepare(
+            f"{table_name}_delete_from_dates",
+            f"""
+            delete from {table_name} m
+            using unnest($1::text[], $2::date[]) d(symbol, date)
+            where m.symbol = d.symbol
+                and m.date >= d.date
+            """,
+            ["text[]", "date[]"],
+        )
+
+        # Earliest daily date with a lud newer than those already aggregated, source_lud
+        self.sql.prepare(
+            f"{table_name}_changes",
+            f"""
+            select s.symbol, m.months, m.last_date, c.cutoff, k.months_kept
+            from unnest($1::text[]) s(symbol)
+            cross join lateral (
+                select count(*) months, max(date) last_date, max(source_lud) source_lud
+                from {table_name} m
+                where m.symbol = s.symbol
+            ) m
+            cross join lateral (
+                select date_trunc('month', min(date))::date cutoff
+                from prices_alpha p
+                where p.symbol = s.symbol
+                    and p.lud > coalesce(m.source_lud, '-infinity')
+            ) c
+            cross join lateral (
+                select count(*) months_kept
+                from {table_name} k
+                where k.symbol = s.symbol
+                    and k.date < c.cutoff
+            ) k
+            """,
+            ["text[]"],
+        )
+
+    def plan_incremental(self, symbols: list) -> dict:
+        """Returns the first month to recompute for each symbol, None for all months.
+
+        Daily rows keep their lud unless they change, so the earliest daily date with
+        a lud newer than the newest one aggregated (source_lud) bounds the months to
+        recompute. The monthly lud is not used: daily lud is stamped before the write
+        commits, a write committed after a later monthly run would be missed. Months
+        before it are skipped. A change before the last month already aggregated
+        means adjusted history was rewritten (a split or a dividend) and all months
+        are recomputed. Symbols without changes are left out.
+        """
+        changes = self.sql.select_prepared(f"{self.table_name}_changes", [list(symbols)])
+        cutoffs = {}
+        for row in changes.itertuples(index=False):
+            if row.months == 0:
+                cutoffs[row.symbol] = None
+            elif row.cutoff is None:
+                self.stats["symbols_unchanged"] += 1
+                self.stats["months_skipped"] += row.months
+            elif row.cutoff < row.last_date.replace(day=1):
+                self.stats["history_rewrites"] += 1
+                cutoffs[row.symbol] = None
+            else:
+                self.stats["months_skipped"] += row.months_kept
+                cutoffs[row.symbol] = row.cutoff
+        return cutoffs
+
+    def update_list(self, symbols: list, chunk_size: int = 100000) -> dict:
+        """Updates monthly prices of symbols from one streamed read of their daily prices.
 
-    def update_list(self, symbols: list):
+        Daily prices are read in chunks of about chunk_size rows, regrouped so that
+        a symbol is never split, so memory is bounded by the chunk size plus the
+        history of one symbol. In incremental mode only the months from
+        plan_incremental are read and recomputed.
+
+        Returns statistics of the run: symbols recomputed fully or incrementally,
+        months recomputed and skipped, and daily rows read.
+        """
         print(f"Updating prices for {symbols}")
-        for symbol in symbols:
-            self.update(symbol)
+        self.stats = Counter()
+        if self.incremental:
+            cutoffs = self.plan_incremental(symbols)
+        else:
+            cutoffs = dict.fromkeys(symbols)
+
+        full = [symbol for symbol, cutoff in cutoffs.items() if cutoff is None]
+        partial = {symbol: cutoff for symbol, cutoff in cutoffs.items() if cutoff is not None}
+        if full:
+            self.stats["symbols_full"] += len(full)
+        if partial:
+            self.stats["symbols_incremental"] += len(partial)
+
+        if self.engine == "sql":
+            self.update_in_db(cutoffs)
+        else:
+            self._update_from_daily_chunks(full, partial, chunk_size)
+
+        stats = dict(self.stats)
+        print(f"monthly_stats = {stats}")
+        return stats
+
+    def _update_from_daily_chunks(self, full: list, partial: dict, chunk_size: int):
+        found = set()
+        if full:
+            query = f"""
+                select {select_list(self.DAILY_COLUMNS)} from prices_alpha
+                where symbol = any(%(symbols)s)
+                order by symbol, date
+            """
+            chunks = self.sql.select_chunks(query, {"symbols": full}, chunk_size)
+            for prices_daily in sql_manager.chunks_by_key(chunks, "symbol"):
+                found.update(prices_daily.symbol.unique())
+                self.update_from_prices_daily(prices_daily)
+
+        if partial:
+            # The last day before the cutoff gives the first daily return of the month
+            query = f"""
+                select {select_list([f"p.{col}" for col in self.DAILY_COLUMNS])}
+                from prices_alpha p
+                join unnest(%(symbols)s::text[], %(cutoffs)s::date[]) c(symbol, cutoff)
+                    on p.symbol = c.symbol
+                where p.date >= coalesce(
+                    (
+                        select max(q.date) from prices_alpha q
+                        where q.symbol = c.symbol and q.date < c.cutoff
+                    ),
+                    c.cutoff
+                )
+                order by p.symbol, p.date
+            """
+            params = {"symbols": list(partial), "cutoffs": list(partial.values())}
+            chunks = self.sql.select_chunks(query, params, chunk_size)
+            for prices_daily in sql_manager.chunks_by_key(chunks, "symbol"):
+                found.update(prices_daily.symbol.unique())
+                self.update_from_prices_daily(prices_daily, partial)
+
+        for symbol in [*full, *partial]:
+            if symbol not in found:
+                print(f"No daily prices found for {symbol}")
+
+    def update_in_db(self, cutoffs: dict):
+        """Computes and writes monthly prices inside Postgres, in one INSERT ... SELECT.
+
+        Same months as aggregation.get_prices_monthly, without moving daily rows out
+        of the database. cutoffs maps each symbol to its first month to recompute, or
+        to None to recompute all its months, see plan_incremental. Computed months are
+        upserted and the other monthly rows from the cutoff on are deleted, except for
+        symbols without any valid month in a full recompute, which are left as they are.
+        A zero adjusted_close gives no daily return instead of an infinite one.
+        """
+        if not cutoffs:
+            return
+
+        # Daily rows labelled with their "BM" bin: weekend days move to the next Monday,
+        # then to the last business day of its month
+        cols = ", ".join(aggregation.MONTHLY_COLUMNS)
+        updates = ", ".join(
+            f"{col} = excluded.{col}"
+            for col in aggregation.MONTHLY_COLUMNS
+            if col not in ("symbol", "date")
+        )
+        last_values = ",\n".join(
+            f"(array_agg({col} order by date desc) filter (where {col} is not null))[1] {alias}"
+            for col, alias in [
+                ("open", "open"),
+                ("high", "high"),
+                ("low", "low"),
+                ("close", "close"),
+                ("adjusted_close", "adjusted_close"),
+                ("lud", "source_lud"),
+            ]
+        )
+        query = f"""
+            with c as (
+                select * from unnest(%(symbols)s::text[], %(cutoffs)s::date[]) c(symbol, cutoff)
+            ),
+            daily as (
+                select p.symbol, p.date, p.open, p.high, p.low, p.close, p.adjusted_close,
+                    p.volume, p.lud, c.cutoff,
+                    p.adjusted_close::float8 / nullif(
+                        lag(p.adjusted_close::float8) over (partition by p.symbol order by p.date),
+                        0
+                    ) - 1 daily_return,
+                    p.date + case extract(isodow from p.date) when 6 then 2 when 7 then 1 else 0
+                        end business_date
+                from prices_alpha p
+                join c on p.symbol = c.symbol
+                where p.date >= coalesce(
+                    (
+                        select max(q.date) from prices_alpha q
+                        where q.symbol = c.symbol and q.date < c.cutoff
+                    ),
+                    c.cutoff,
+                    '-infinity'
+                )
+            ),
+            labelled as (
+                select d.*,
+                    l.month_end - case extract(isodow from l.month_end) when 6 then 1 when 7 then 2
+                        else 0 end month_label
+                from daily d
+                cross join lateral (
+                    select (
+                        date_trunc('month', d.business_date) + interval '1 month - 1 day'
+                    )::date month_end
+                ) l
+            ),
+            monthly as (
+                select symbol, month_label date,
+                    {last_values},
+                    sum(volume) monthly_volume,
+                    stddev_samp(daily_return) monthly_return_std,
+                    exp(coalesce(sum(ln(1 + daily_return)) filter (where daily_return > -1), 0))
+                        - 1 monthly_return,
+                    count(*) day_count,
+                    %(lud)s::timestamp lud
+                from labelled
+                where month_label >= coalesce(cutoff, '-infinity')
+                group by symbol, month_label
+            ),
+            computed as (
+                select * from monthly
+                where adjusted_close is not null
+                    and not (day_count = 1 and monthly_return = 0)
+            ),
+            deleted as (
+                delete from {self.table_name} m
+                using c
+                where m.symbol = c.symbol
+                    and m.date >= coalesce(c.cutoff, '-infinity')
+                    and (c.cutoff is not null or m.symbol in (select symbol from computed))
+                    and (m.symbol, m.date) not in (select symbol, date from computed)
+            ),
+            upserted as (
+                insert into {self.table_name} ({cols})
+                select {cols} from computed
+                on conflict (symbol, date) do update set {updates}
+                returning symbol
+            )
+            select symbol, count(*) months from upserted group by symbol
+        """
+        params = {
+            "symbols": list(cutoffs),
+            "cutoffs": list(cutoffs.values()),
+            "lud": datetime.now(),
+        }
+        months = dict(self.sql.query_fetchall(query, params))
+        self.stats["months_recomputed"] += sum(months.values())
+        print(f"Upserted {sum(months.values())} months for {sorted(months)}")
+        for symbol in cutoffs:
+            if symbol not in months:
+                print(f"No valid monthly prices can be computed for {symbol}")
 
     def update(self, symbol: str):
+        if self.incremental or self.engine == "sql":
+            return self.update_list([symbol])
+
         print(f"Updating monthly prices for {symbol}")
 
         # Get daily prices
-        prices_daily = self.sql.select_query(
-            f"select * from prices_alpha where symbol = '{symbol}'"
-        )
+        columns = select_list(self.DAILY_COLUMNS)
+        query = f"select {columns} from prices_alpha where symbol = %(symbol)s"
+        prices_daily = self.sql.select_typed(query, {"symbol": symbol})
 
         if prices_daily.shape[0] > 0:
-            prices_monthly = self._get_prices_monthly(prices_daily)
+            self.update_from_prices_daily(prices_daily)
 
-            if prices_monthly.shape[0] > 0:
-                # Clean symbol in monthly table
-                delete_query = f"delete from {self.table_name} where symbol = '{symbol}'"
-                self.sql.query(delete_query)
+        else:
+            print(f"No daily prices found for {symbol}")
 
-                # Upload to database
-                print(f"Uploading {prices_monthly.shape[0]} months for {symbol}")
-                self.sql.upload_df_chunks(self.table_name, prices_monthly)
+        return dict(self.stats)
 
-            else:
-                print(f"No valid monthly prices can be computed for {symbol}")
+    def update_from_prices_daily(self, prices_daily: pd.DataFrame, cutoffs: Optional[dict] = None):
+        """Replaces the monthly prices of the symbols in prices_daily, one or more.
 
+        With cutoffs, a first month per symbol, only months from the cutoff on are
+        replaced and prices_daily may start at the last day before it.
+        """
+        self.stats["daily_rows_read"] += prices_daily.shape[0]
+        if self.engine == "numpy":
+            prices_monthly = aggregation.get_prices_monthly(prices_daily)
         else:
-            print(f"No daily prices found for {symbol}")
+            prices_monthly = self._get_prices_monthly(prices_daily)
+
+        # Deleted months are replaced in the same transaction, readers never miss them
+        with self.sql.transaction():
+            if cutoffs is not None:
+                symbols = list(prices_daily.symbol.unique())
+                cutoff = pd.to_datetime(prices_monthly.symbol.map(cutoffs))
+                prices_monthly = prices_monthly.loc[prices_monthly.date >= cutoff]
+                self.sql.query_prepared(
+                    f"{self.table_name}_delete_from_dates",
+                    [symbols, [cutoffs[symbol] for symbol in symbols]],
+                )
+
+            else:
+                computed = set(prices_monthly.symbol.unique())
+                for symbol in prices_daily.symbol.unique():
+                    if symbol not in computed:
+                        print(f"No valid monthly prices can be computed for {symbol}")
+
+                if prices_monthly.shape[0] > 0:
+                    # Clean symbols in monthly table
+                    self.sql.query_prepared(f"{self.table_name}_delete_symbols", [sorted(computed)])
+
+            if prices_monthly.shape[0] > 0:
+                # Upload to database
+                symbols = sorted(prices_monthly.symbol.unique())
+                print(f"Uploading {prices_monthly.shape[0]} months for {symbols}")
+                self.sql.upload_df_copy(self.table_name, prices_monthly)
+                self.stats["months_recomputed"] += prices_monthly.shape[0]
 
     def _get_prices_monthly(self, prices_daily):
         # Compute monthly
@@ -550,12 +1248,14 @@ class AlphaTableAccounting(AlphaTable):
     Class to update balance_alpha and income_alpha tables
     """
 
+    DATE_COLUMN = "report_date"
+
     def __init__(
         self,
         table_name: str,
         url_table_name: str,
         primary_keys: list,
-        scraper: api.AlphaScraper,
+        scraper: "api.AlphaScraper",
         accounts: list,
         **kwargs,
     ):
@@ -563,20 +1263,31 @@ class AlphaTableAccounting(AlphaTable):
         self.accounts = accounts
         self.url_table_name = url_table_name
 
-    def get_assets(self, validate: bool, asset_types: list):
+    def get_db_columns(self) -> list:
+        # get_db_dates_missing only compares the keys
+        return self.primary_keys
+
+    def get_assets(self, validate: bool, asset_types: list, assets: Optional[pd.DataFrame] = None):
+        """Assets to update, assets from get_assets_to_refresh are read if not given."""
         # Get available assets from db
-        assets = self.get_assets_to_refresh(asset_types)
+        if assets is None:
+            assets = self.get_assets_to_refresh(asset_types)
+        assets = assets.merge(self.get_table_watermarks(), how="left", on="symbol")
         if not validate:
-            assets = self.filter_assets_by_max_date(
-                assets, "report_date", date_utils.get_last_quarter_date
-            )
+            assets = self.filter_assets_by_max_date(assets, date_utils.get_last_quarter_date)
         assets = assets.reset_index(drop=True)
         return assets
 
-    def update_list(self, symbols: list):
+    def update_list(self, symbols: list, max_workers: int = 1):
         print(f"Updating {self.table_name} for {symbols}")
-        for symbol in symbols:
-            self.update(symbol)
+        if max_workers > 1:
+            # Downloads run concurrently, database writes stay in this thread
+            for symbol, api_balance in self.get_api_data_concurrently(symbols, max_workers):
+                print(f"Updating {self.table_name} for {symbol}")
+                self.update_from_api_data(symbol, api_balance)
+        else:
+            for symbol in symbols:
+                self.update(symbol)
 
     def update(self, symbol: str):
         print(f"Updating {self.table_name} for {symbol}")
@@ -584,6 +1295,9 @@ class AlphaTableAccounting(AlphaTable):
         # Get API balance
         api_balance = self.get_api_data(symbol)
 
+        self.update_from_api_data(symbol, api_balance)
+
+    def update_from_api_data(self, symbol: str, api_balance: pd.DataFrame):
         if api_balance is not None:
             if not api_balance.empty:
                 # Get database balance
@@ -606,10 +1320,13 @@ class AlphaTableAccounting(AlphaTable):
                     # Upload to database
                     assert api_balance.shape[0] > 0
                     print(f"Uploading {api_balance.shape[0]} rows for {symbol}")
-                    self.sql.upload_df_chunks(self.table_name, api_balance)
+                    with self.sql.transaction():
+                        self.sql.upload_df_copy(self.table_name, api_balance)
+                        self.update_table_watermarks([symbol])
 
                 else:
                     print(f"Database already up to date for {symbol}")
+                    self.touch_table_watermarks([symbol])
 
             else:
                 print(f"api_balance was empty for {symbol}")
@@ -632,68 +1349,14 @@ class AlphaTableAccounting(AlphaTable):
 
         try:
             download = self.scraper.hit_api(url, symbol=symbol, url_table_name=self.url_table_name)
-            data_json = download.json()
-
-            final_cols = [
-                "symbol",
-                "report_type",
-                "report_date",
-                "currency",
-                "account_name",
-                "account_value",
-            ]
-            key_report_map = {"annualReports": "A", "quarterlyReports": "Q"}
-
-            data_annual = self.wrangle_json(
-                symbol,
-                data_json,
-                "annualReports",
-                key_report_map,
-                self.accounts,
-                final_cols,
-            )
-            data_quarter = self.wrangle_json(
-                symbol,
-                data_json,
-                "quarterlyReports",
-                key_report_map,
-                self.accounts,
-                final_cols,
-            )
-            data = data_annual.append(data_quarter)
+            started = time.monotonic()
+            data = parsers.parse_accounting({symbol: download.content}, self.accounts)
             data["lud"] = datetime.now()
-            data.drop_duplicates(subset=self.primary_keys, inplace=True)
+            data = data.drop_duplicates(subset=self.primary_keys, ignore_index=True)
+            self._record_fetch_seconds(symbol, started)
             return data
 
         except Exception as e:
             print(f"Download failed for {symbol}. \nurl: {url}")
             print(e)
             return None
-
-    def wrangle_json(self, symbol, data_json, key_report, key_report_map, accounts, final_cols):
-        data = pd.DataFrame()
-
-        if key_report in data_json:
-            for report in data_json[key_report]:
-                data_report_lst = [
-                    [k, int(float(v))]
-                    for k, v in report.items()
-                    if k in accounts and v != "None" and utils.is_number(v)
-                ]
-                currency = report["reportedCurrency"]
-                fiscal_date = report["fiscalDateEnding"]
-                data_report = pd.DataFrame(
-                    data_report_lst, columns=["account_name", "account_value"]
-                )
-                data_report["symbol"] = symbol
-                data_report["report_type"] = key_report_map[key_report]
-                data_report["report_date"] = fiscal_date
-                if len(currency) <= 3:
-                    data_report["currency"] = currency
-                else:
-                    # Includes case when currency = 'None'
-                    data_report["currency"] = ""
-                data_report = data_report[final_cols]
-                data = data.append(data_report)
-
-        return data
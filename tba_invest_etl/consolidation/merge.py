@@ -5,12 +5,8 @@ from tba_invest_etl.utils import sql_manager
 def merge_alpha_and_wrds_assets(sql_params: SQLParams):
     sql = sql_manager.ManagerSQL(sql_params)
 
-    # Delete table
-    sql.query("drop table if exists assets")
-
     # Read query for creating assets table
     query = """
-create table assets as
 select 
 concat(case when w.ticker is null then coalesce(a.symbol, '0') else w.ticker end
 	   , '-', coalesce(cast(permno as TEXT), '0')) as id
@@ -55,19 +51,15 @@ and w.rnk=1
 and a.symbol = w.ticker    
     """
 
-    # Create assets table
-    sql.query(query)
+    # Replace assets table atomically
+    sql.refresh_table("assets", query=query)
 
 
 def merge_alpha_and_wrds_returns(sql_params: SQLParams):
     sql = sql_manager.ManagerSQL(sql_params)
 
-    # Delete table
-    sql.query("drop table if exists returns_monthly")
-
     # Read query for creating prices_monthly table
     query = """
-create table returns_monthly as
 select 
 	id, symbol, period, date, source
 	, close, adjusted_close, shares_outstanding
@@ -120,5 +112,5 @@ from (
 where date is not NULL
 	"""
 
-    # Create prices_montly table
-    sql.query(query)
+    # Replace prices_montly table atomically
+    sql.refresh_table("returns_monthly", query=query)
@@ -18,3 +18,14 @@ def convert_dict_to_sql_params(db_credentials: dict) -> SQLParams:
     }
     sql_params = SQLParams(**filtered_db_credentials)
     return sql_params
+
+
+@dataclass
+class ApiCallTiming:
+    """Timings of one API call, in seconds."""
+
+    function: str
+    new_connection: bool
+    elapsed: float  # Request sent until headers received, includes connect if new_connection
+    transfer: float  # Body download and decompression
+    total: float
@@ -1,46 +1,47 @@
 from ast import literal_eval
 
-import numpy as np
 import pandas as pd
 
-from tba_invest_etl.alpha import api, table
+from tba_invest_etl.alpha import api, partition, table
 from tba_invest_etl.domain_models.io import convert_dict_to_sql_params
-from tba_invest_etl.utils import aws, utils
+from tba_invest_etl.utils import aws, sql_manager, utils
 
 
-def lambda_handler(event, context):  # pylint: disable=unused-argument
-    """Get assets"""
-    print("event", event)
-
-    # Example
-    # {"ref_table": "prices_alpha"}
-
-    # Inputs
-    assert "ref_table" in event
-    ref_table = event["ref_table"]
-    validate = utils.str2bool(event.get("validate", "false"))
-    asset_types = event.get("asset_types", "Stock").split(",")
-    max_assets_in_batch = int(event.get("max_assets_in_batch", 75 * 60))
-    n_lists_in_batch = int(event.get("n_lists_in_batch", 10))
-    size = event.get("size", "full")
-    print(f"ref_table = {ref_table}")
-    print(f"validate = {validate}")
-    print(f"asset_types = {asset_types}")
-    print(f"max_assets_in_batch = {max_assets_in_batch}")
-    print(f"n_lists_in_batch = {n_lists_in_batch}")
-    print(f"size = {size}")
+def format_batches(batches: list, params: dict) -> list:
+    """Batches of partition.partition_batches as events of the update Lambdas.
 
-    # Decrypts secret using the associated KMS key.
-    sql_params = convert_dict_to_sql_params(literal_eval(aws.get_secret("prod/awsportfolio/key")))
-    api_key = literal_eval(aws.get_secret("prod/AlphaApi/key"))["ALPHAVANTAGE_API_KEY"]
+    Every sublist gets params, e.g. size, and its predicted_seconds.
+    """
+    assets_sublists = []
+    for i, batch in enumerate(batches):
+        assets_sublists.append(
+            {
+                "batch": [
+                    {
+                        "symbols": ",".join(symbols),
+                        **params,
+                        "predicted_seconds": round(seconds, 1),
+                    }
+                    for symbols, seconds in batch
+                ],
+                "is_last_batch": i == len(batches) - 1,
+                "predicted_makespan": round(max(seconds for _, seconds in batch), 1),
+            }
+        )
+    return assets_sublists
 
-    alpha_scraper = api.AlphaScraper(api_key=api_key)
 
-    assets = pd.DataFrame()
+def get_costs(  # pylint: disable=too-many-arguments
+    ref_table, validate, asset_types, size, call_interval, alpha_scraper, sql_params
+) -> pd.Series:
+    """Predicted seconds to update each asset of ref_table, see partition.estimate_costs."""
+    costs = pd.Series(dtype=float)
     if ref_table == "prices_alpha":
         keys = ["symbol", "date"]
         alpha_prices = table.AlphaTablePrices(ref_table, keys, alpha_scraper, sql_params=sql_params)
         assets = alpha_prices.get_assets(validate, asset_types)
+        max_rows = alpha_prices.COMPACT_SIZE if size == "compact" else None
+        costs = partition.estimate_costs(assets, call_interval, max_rows=max_rows)
     else:
         accounting_keys = [
             "symbol",
@@ -71,37 +72,106 @@ def lambda_handler(event, context):  # pylint: disable=unused-argument
             income_accounts,
             sql_params=sql_params,
         )
+        accounting_tables = []
         if ref_table == "balance_alpha":
-            assets = alpha_balance.get_assets(validate, asset_types)
+            accounting_tables = [alpha_balance]
         elif ref_table == "income_alpha":
-            assets = alpha_income.get_assets(validate, asset_types)
+            accounting_tables = [alpha_income]
         elif ref_table == "accounting":
-            assets_balance = alpha_balance.get_assets(validate, asset_types)
-            assets_income = alpha_income.get_assets(validate, asset_types)
-            assets = list(set(assets_balance.symbol).union(set(assets_income.symbol)))
-            assets.sort()
+            accounting_tables = [alpha_balance, alpha_income]
 
-    assets_sublists = []
-    if assets.shape[0] > 0:
-        total_batches = len(range(0, len(assets), max_assets_in_batch))
-        for i, batch_start in enumerate(range(0, len(assets), max_assets_in_batch)):
-            symbols_batch: pd.Series = assets.loc[
-                batch_start : batch_start + max_assets_in_batch - 1
-            ].symbol
-            partition_batch = np.array_split(symbols_batch, n_lists_in_batch)
-            is_last_batch = i == total_batches - 1
-            assets_sublists.append(
-                {
-                    "batch": [
-                        {"symbols": ",".join(list(sublist)), "size": size}
-                        for sublist in partition_batch
-                    ],
-                    "is_last_batch": is_last_batch,
-                }
+        # Both tables refresh the same assets, read them once
+        assets_to_refresh = alpha_balance.get_assets_to_refresh(asset_types)
+        for alpha_accounting in accounting_tables:
+            assets = alpha_accounting.get_assets(validate, asset_types, assets_to_refresh)
+            table_costs = partition.estimate_costs(
+                assets, call_interval, default_rows=partition.ACCOUNTING_ROWS
             )
+            costs = costs.add(table_costs, fill_value=0)
+
+    return costs
+
+
+def lambda_handler(event, context):  # pylint: disable=unused-argument
+    """Get assets"""
+    print("event", event)
+
+    # Example
+    # {"ref_table": "prices_alpha"}
+    # 'max_workers', 'wait' and 'shared_rate_limit' are passed on to the update Lambdas
+    # with every sublist. With 'shared_rate_limit': 'true' batches do not wait an hour.
+
+    # Inputs
+    assert "ref_table" in event
+    ref_table = event["ref_table"]
+    validate = utils.str2bool(event.get("validate", "false"))
+    asset_types = event.get("asset_types", "Stock").split(",")
+    max_assets_in_batch = int(event.get("max_assets_in_batch", 75 * 60))
+    n_lists_in_batch = int(event.get("n_lists_in_batch", 10))
+    size = event.get("size", "full")
+    max_api_requests_per_min = int(event.get("max_api_requests_per_min", 75))
+    lambda_timeout_seconds = float(event.get("lambda_timeout_seconds", 900))
+    max_workers = int(event.get("max_workers", 1))
+    wait = utils.str2bool(str(event.get("wait", False)))
+    shared_rate_limit = utils.str2bool(str(event.get("shared_rate_limit", False)))
+    print(f"ref_table = {ref_table}")
+    print(f"validate = {validate}")
+    print(f"asset_types = {asset_types}")
+    print(f"max_assets_in_batch = {max_assets_in_batch}")
+    print(f"n_lists_in_batch = {n_lists_in_batch}")
+    print(f"size = {size}")
+    print(f"max_api_requests_per_min = {max_api_requests_per_min}")
+    print(f"lambda_timeout_seconds = {lambda_timeout_seconds}")
+    print(f"max_workers = {max_workers}")
+    print(f"wait = {wait}")
+    print(f"shared_rate_limit = {shared_rate_limit}")
+
+    # Decrypts secret using the associated KMS key.
+    sql_params = convert_dict_to_sql_params(literal_eval(aws.get_secret("prod/awsportfolio/key")))
+    api_key = literal_eval(aws.get_secret("prod/AlphaApi/key"))["ALPHAVANTAGE_API_KEY"]
+
+    alpha_scraper = api.AlphaScraper(api_key=api_key)
+
+    # Sublists of a batch run at once. They only pace their calls to share the per-minute
+    # quota if the update Lambdas wait on the rate limiter: update_prices_alpha with wait,
+    # several workers or the shared limiter, update_accounting always. Otherwise the
+    # quota is spent by the hourly wait between batches.
+    call_interval = 0.0
+    if ref_table != "prices_alpha" or wait or shared_rate_limit or max_workers > 1:
+        call_interval = partition.get_call_interval(max_api_requests_per_min, n_lists_in_batch)
+
+    costs = get_costs(
+        ref_table, validate, asset_types, size, call_interval, alpha_scraper, sql_params
+    )
+
+    # Load balanced sublists, batches of the hourly quota, smaller if a sublist would
+    # not fit the Lambda timeout
+    batches = partition.partition_batches(
+        costs,
+        n_lists_in_batch,
+        max_assets_in_batch,
+        lambda_timeout_seconds * partition.TIMEOUT_SAFETY,
+    )
+    params = {
+        "size": size,
+        "max_workers": max_workers,
+        "wait": wait,
+        "shared_rate_limit": shared_rate_limit,
+    }
+    assets_sublists = format_batches(batches, params)
+    predicted_makespan = partition.get_run_makespan(
+        [batch["predicted_makespan"] for batch in assets_sublists],
+        0.0 if shared_rate_limit else partition.BATCH_WAIT_SECONDS,
+    )
+    print(f"Predicted makespan of {len(costs)} symbols: {predicted_makespan:.0f} s")
+
+    db_pool = sql_manager.get_pool_stats()
+    print(f"db_pool = {db_pool}")
 
     return {
         "statusCode": 200,
-        "body": f"Returning {len(assets_sublists)} batches with {n_lists_in_batch} sublists each.",
+        "body": f"Returning {len(assets_sublists)} batches of up to {n_lists_in_batch} sublists.",
         "assets": assets_sublists,
+        "predicted_makespan": predicted_makespan,
+        "db_pool": db_pool,
     }
@@ -1,27 +1,33 @@
 import json
+import time
 from ast import literal_eval
 
-from tba_invest_etl.alpha import api, table
+from tba_invest_etl.alpha import api, partition, table
 from tba_invest_etl.domain_models.io import convert_dict_to_sql_params
-from tba_invest_etl.utils import aws
+from tba_invest_etl.utils import aws, sql_manager
 
 
 def lambda_handler(event, context):  # pylint: disable=unused-argument
     """Update accounting tables"""
+    started = time.monotonic()
     print("event", event)
 
     # Example
-    # {'symbols': 'AMZN,AAPL,MSFT'}
+    # {'symbols': 'AMZN,AAPL,MSFT', 'max_workers': '8'}
 
     # Gather parameters
     symbols = event["symbols"].split(",") if "symbols" in event else []
+    max_workers = int(event.get("max_workers", 1))
+    predicted_seconds = event.get("predicted_seconds")
     print(f"symbols = {symbols}")
+    print(f"max_workers = {max_workers}")
+    print(f"predicted_seconds = {predicted_seconds}")
 
     # Decrypts secret using the associated KMS key.
     sql_params = convert_dict_to_sql_params(literal_eval(aws.get_secret("prod/awsportfolio/key")))
     api_key = literal_eval(aws.get_secret("prod/AlphaApi/key"))["ALPHAVANTAGE_API_KEY"]
 
-    alpha_scraper = api.AlphaScraper(api_key=api_key)
+    alpha_scraper = api.AlphaScraper(api_key=api_key, pool_size=max_workers)
     accounting_keys = [
         "symbol",
         "report_type",
@@ -50,10 +56,17 @@ def lambda_handler(event, context):  # pylint: disable=unused-argument
 
     if symbols:
         print("Update balance sheet")
-        alpha_balance.update_list(symbols)
+        alpha_balance.update_list(symbols, max_workers=max_workers)
 
         print("Update income statement")
-        alpha_income.update_list(symbols)
+        alpha_income.update_list(symbols, max_workers=max_workers)
+
+    makespan = partition.get_makespan(predicted_seconds, started)
+    print(f"makespan = {makespan}")
+    api_timings = alpha_scraper.get_timing_summary()
+    print(f"api_timings = {api_timings}")
+    db_pool = sql_manager.get_pool_stats()
+    print(f"db_pool = {db_pool}")
 
     return {
         "statusCode": 200,
@@ -62,4 +75,7 @@ def lambda_handler(event, context):  # pylint: disable=unused-argument
                 "message": f"Accounting updated for symbols = {symbols}",
             }
         ),
+        "api_timings": api_timings,
+        "db_pool": db_pool,
+        "makespan": makespan,
     }
@@ -1,36 +1,93 @@
 import json
+import time
 from ast import literal_eval
 
-from tba_invest_etl.alpha import api, table
+from tba_invest_etl.alpha import api, partition, rate_limiter, table
 from tba_invest_etl.domain_models.io import convert_dict_to_sql_params
-from tba_invest_etl.utils import aws
+from tba_invest_etl.utils import aws, sql_manager, utils
 
 
 def lambda_handler(event, context):  # pylint: disable=unused-argument
     """Update prices_alpha for symbols given in event."""
+    started = time.monotonic()
     print("event", event)
 
     # Example
-    # {'size': 'compact', 'symbols': 'AMZN,AAPL,MSFT'}
+    # {'size': 'compact', 'symbols': 'AMZN,AAPL,MSFT', 'max_workers': '8', 'wait': 'true'}
+    # With 'max_workers' above 1 every worker draws from the scraper's token bucket
+    # With 'shared_rate_limit': 'true' every worker draws from one quota stored in the db
+    # With 'datatype': 'csv' prices are downloaded as csv instead of json
+    # With 'write_mode': 'upsert' prices are upserted instead of deleted and inserted,
+    # which needs the unique index of db/alpha/prices_alpha_upsert_index_*.sql
 
     # Gather parameters
     size = event.get("size", "full")
     symbols = event["symbols"].split(",") if "symbols" in event else []
+    max_workers = int(event.get("max_workers", 1))
+    predicted_seconds = event.get("predicted_seconds")
+    corporate_actions = (
+        set(event["corporate_actions"].split(",")) if "corporate_actions" in event else set()
+    )
+    wait = utils.str2bool(str(event.get("wait", False)))
+    shared_rate_limit = utils.str2bool(str(event.get("shared_rate_limit", False)))
+    max_api_requests_per_min = int(event.get("max_api_requests_per_min", 75))
+    datatype = event.get("datatype", "json")
+    write_mode = event.get("write_mode", "replace")
     print(f"size = {size}")
     print(f"symbols = {symbols}")
+    print(f"max_workers = {max_workers}")
+    print(f"predicted_seconds = {predicted_seconds}")
+    print(f"corporate_actions = {corporate_actions}")
+    print(f"wait = {wait}")
+    print(f"shared_rate_limit = {shared_rate_limit}")
+    print(f"max_api_requests_per_min = {max_api_requests_per_min}")
+    print(f"datatype = {datatype}")
+    print(f"write_mode = {write_mode}")
 
     # Decrypts secret using the associated KMS key.
     sql_params = convert_dict_to_sql_params(literal_eval(aws.get_secret("prod/awsportfolio/key")))
     api_key = literal_eval(aws.get_secret("prod/AlphaApi/key"))["ALPHAVANTAGE_API_KEY"]
 
-    alpha_scraper = api.AlphaScraper(api_key=api_key, wait=False)
+    limiter = None
+    if shared_rate_limit:
+        limiter = rate_limiter.PostgresRateLimiter(
+            sql_params, max_requests_per_min=max_api_requests_per_min
+        )
+    alpha_scraper = api.AlphaScraper(
+        api_key=api_key,
+        wait=wait or shared_rate_limit or max_workers > 1,
+        max_api_requests_per_min=max_api_requests_per_min,
+        rate_limiter=limiter,
+        pool_size=max_workers,
+    )
     prices_keys = ["symbol", "date"]
     alpha_prices = table.AlphaTablePrices(
-        "prices_alpha", prices_keys, alpha_scraper, sql_params=sql_params
+        "prices_alpha",
+        prices_keys,
+        alpha_scraper,
+        sql_params=sql_params,
+        datatype=datatype,
+        write_mode=write_mode,
     )
 
-    if symbols:
-        alpha_prices.update_list(symbols, size=size)
+    fetch_stats = {}
+    try:
+        if symbols:
+            fetch_stats = alpha_prices.update_list(
+                symbols, size=size, max_workers=max_workers, corporate_actions=corporate_actions
+            )
+    finally:
+        if limiter is not None:
+            limiter.close()
+
+    makespan = partition.get_makespan(predicted_seconds, started)
+    print(f"makespan = {makespan}")
+    api_timings = alpha_scraper.get_timing_summary()
+    print(f"api_timings = {api_timings}")
+    db_pool = sql_manager.get_pool_stats()
+    print(f"db_pool = {db_pool}")
+    prepared_stats = alpha_prices.sql.get_prepared_stats()
+    print(f"prepared_stats = {prepared_stats}")
 
     return {
         "statusCode": 200,
@@ -41,4 +98,9 @@ def lambda_handler(event, context):  # pylint: disable=unused-argument
         ),
         "symbols": ",".join(symbols),
         "size": size,
+        "api_timings": api_timings,
+        "db_pool": db_pool,
+        "prepared_stats": prepared_stats,
+        "fetch_stats": fetch_stats,
+        "makespan": makespan,
     }
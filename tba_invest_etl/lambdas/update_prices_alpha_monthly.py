@@ -3,28 +3,41 @@ from ast import literal_eval
 
 from tba_invest_etl.alpha import table
 from tba_invest_etl.domain_models.io import convert_dict_to_sql_params
-from tba_invest_etl.utils import aws
+from tba_invest_etl.utils import aws, utils
+
+# Engines of AlphaTablePricesMonthly run by the lambda, "pandas" is a test reference
+ENGINES = ("numpy", "sql")
 
 
 def lambda_handler(event, context):  # pylint: disable=unused-argument
     print("event", event)
 
     # Example
-    # {'symbols': 'AMZN,AAPL,MSFT'}
+    # {'symbols': 'AMZN,AAPL,MSFT', 'incremental': True, 'engine': 'sql'}
 
     # Gather parameters
     symbols = event["symbols"].split(",") if "symbols" in event else []
     print(f"symbols = {symbols}")
+    incremental = utils.str2bool(str(event.get("incremental", False)))
+    print(f"incremental = {incremental}")
+    engine = event.get("engine", "numpy")
+    print(f"engine = {engine}")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}, expected one of {ENGINES}")
 
     # Decrypts secret using the associated KMS key.
     sql_params = convert_dict_to_sql_params(literal_eval(aws.get_secret("prod/awsportfolio/key")))
 
     alpha_prices_monthly = table.AlphaTablePricesMonthly(
-        "prices_alpha_monthly", sql_params=sql_params
+        "prices_alpha_monthly", sql_params=sql_params, incremental=incremental, engine=engine
     )
 
+    monthly_stats = {}
     if symbols:
-        alpha_prices_monthly.update_list(symbols)
+        monthly_stats = alpha_prices_monthly.update_list(symbols)
+
+    prepared_stats = alpha_prices_monthly.sql.get_prepared_stats()
+    print(f"prepared_stats = {prepared_stats}")
 
     return {
         "statusCode": 200,
@@ -33,4 +46,6 @@ def lambda_handler(event, context):  # pylint: disable=unused-argument
                 "message": "Monthly prices updated for symbols provided",
             }
         ),
+        "monthly_stats": monthly_stats,
+        "prepared_stats": prepared_stats,
     }
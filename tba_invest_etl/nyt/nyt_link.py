@@ -39,12 +39,21 @@ MANUAL_ORG_TO_STOCK_MAP = [
 class NytNewsLinker:
     """Linking NYT news to assets"""
 
-    def __init__(self, org_to_asset_table: str, news_to_asset_table: str, sql_params: SQLParams):
+    def __init__(
+        self,
+        org_to_asset_table: str,
+        news_to_asset_table: str,
+        sql_params: SQLParams,
+        chunk_size: int = 50000,
+    ):
         # Initial parameters
         self.org_to_asset_table = org_to_asset_table
         self.news_to_asset_table = news_to_asset_table
         self.sql_manager = sql_manager.ManagerSQL(sql_params)
 
+        # Articles read at once, bounds memory use, see read_news
+        self.chunk_size = chunk_size
+
     def update_news_links(self):
         # Read stock info
         stocks = self.sql_manager.select_query(
@@ -54,11 +63,8 @@ class NytNewsLinker:
         """
         )
 
-        # Read news info
-        nyt_news = self.sql_manager.select_query("select * from nyt_archive")
-
         # Get list of unique NYT organizations with their frequency on news articles
-        org_counts = self.get_org_counts(nyt_news)
+        org_counts = self.get_org_counts(self.read_news())
 
         # Base link between orgs and stocks based on name
         org_merged_base = self.get_org_to_asset_link_based_on_name(org_counts, stocks)
@@ -72,19 +78,36 @@ class NytNewsLinker:
         # Upload org to stock map
         self.upload_org_to_asset(org_merged)
 
-        # Link news to stocks
-        news_to_asset = self.get_news_to_asset_link(nyt_news, org_merged)
+        # Link news to stocks, a second pass over the articles
+        news_to_asset = (
+            self.get_news_to_asset_link(nyt_news, org_merged) for nyt_news in self.read_news()
+        )
 
         # Upload news to stock map
         self.upload_news_to_asset(news_to_asset)
 
+    def read_news(self):
+        """Yields the articles, only the columns used for linking, in chunks of chunk_size."""
+        return self.sql_manager.select_chunks(
+            "select web_url, year_month, organizations from nyt_archive",
+            chunk_size=self.chunk_size,
+        )
+
     @staticmethod
     def get_org_counts(nyt_news):
-        exploded_orgs = nyt_news.organizations.str.split(r" \| ").explode()
+        """Counts articles per organization. nyt_news is a DataFrame or an iterable of them."""
+        if isinstance(nyt_news, pd.DataFrame):
+            nyt_news = [nyt_news]
+        counts = pd.Series(dtype="int64")
+        for chunk in nyt_news:
+            exploded_orgs = chunk.organizations.str.split(r" \| ").explode()
+            counts = counts.add(exploded_orgs.value_counts(), fill_value=0)
         org_counts = (
-            exploded_orgs.value_counts()
+            counts.astype("int64")
+            .sort_values(ascending=False, kind="stable")
+            .rename_axis("organization")
+            .rename("count")
             .reset_index()
-            .rename(columns={"index": "organization", "organizations": "count"})
         )
         return org_counts
 
@@ -188,12 +211,13 @@ class NytNewsLinker:
 
     def upload_org_to_asset(self, org_merged: pd.DataFrame):
         org_to_asset_cols = ["organization", "count", "asset_ids"]
-        self.sql_manager.query(f"delete from {self.org_to_asset_table}")
-        self.sql_manager.upload_df_chunks(self.org_to_asset_table, org_merged[org_to_asset_cols])
+        self.sql_manager.refresh_table(self.org_to_asset_table, org_merged[org_to_asset_cols])
 
-    def upload_news_to_asset(self, news_to_asset: pd.DataFrame):
+    def upload_news_to_asset(self, news_to_asset):
+        """news_to_asset is a DataFrame or an iterable of them."""
+        if isinstance(news_to_asset, pd.DataFrame):
+            news_to_asset = [news_to_asset]
         news_to_asset_cols = ["web_url", "year_month", "organization", "asset_ids"]
-        self.sql_manager.query(f"delete from {self.news_to_asset_table}")
-        self.sql_manager.upload_df_chunks(
-            self.news_to_asset_table, news_to_asset[news_to_asset_cols]
+        self.sql_manager.refresh_table(
+            self.news_to_asset_table, (chunk[news_to_asset_cols] for chunk in news_to_asset)
         )
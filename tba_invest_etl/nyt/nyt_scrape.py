@@ -18,6 +18,11 @@ class NytNewsScraper:
         self.table_name = table_name
         self.api_key = api_key
         self.sql_manager = sql_manager.ManagerSQL(db_credentials)
+        self.sql_manager.prepare(
+            "nyt_archive_has_year_month",
+            "select exists (select 1 from nyt_archive where year_month = $1) has_year_month",
+            ["varchar"],
+        )
 
     def nyt_upload_all_articles(self, year_start=2001, clean_tables=False, verbose=False):
         if clean_tables:
@@ -34,10 +39,10 @@ class NytNewsScraper:
         try:
             # Verify data has not been downloaded
             year_month = f"{year}{month:02}"
-            db_year_month_list = self.sql_manager.select_distinct_column_list(
-                "year_month", "nyt_archive"
+            db_year_month = self.sql_manager.select_prepared(
+                "nyt_archive_has_year_month", [year_month]
             )
-            if year_month in db_year_month_list:
+            if db_year_month.has_year_month.iloc[0]:
                 if verbose:
                     print(f"Database already has NYT articles for {year}-{month}")
                 return
@@ -60,7 +65,7 @@ class NytNewsScraper:
             if verbose:
                 print(f"Uploading NYT {year_month}")
             t0 = datetime.now()
-            self.sql_manager.upload_df_chunks("nyt_archive", df)
+            self.sql_manager.upload_df_copy("nyt_archive", df)
             t1 = datetime.now()
             if verbose > 0:
                 print(f"Uploaded NYT {year_month} ({(t1 - t0).total_seconds():.2f} sec)")
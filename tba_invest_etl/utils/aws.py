@@ -1,18 +1,53 @@
-import boto3
-from botocore.exceptions import ClientError
+import functools
+import threading
+import time
 
+# Seconds a secret is served from the in-process cache before being fetched again
+SECRETS_TTL_SECONDS = 15 * 60
 
-def get_secret(secret_name, region_name="us-east-2"):
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
+# Secrets fetched by this process, survive warm Lambda invocations
+_SECRETS = {}
+_SECRETS_LOCK = threading.Lock()
 
-    try:
-        secret_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        raise e
 
-    return secret_response["SecretString"]
+@functools.lru_cache(maxsize=None)
+def get_client(service_name: str, region_name: str = None):
+    """Returns a boto3 client, created once per process.
+
+    boto3 is imported here rather than at module load, it is one of the heaviest
+    imports of the package and handlers only need it on a cold start.
+    """
+    import boto3  # pylint: disable=import-outside-toplevel
+
+    return boto3.session.Session().client(service_name=service_name, region_name=region_name)
+
+
+def get_secret(secret_name, region_name="us-east-2", ttl_seconds=None):
+    """Returns a Secrets Manager secret string, cached in process for ttl_seconds.
+
+    ttl_seconds defaults to SECRETS_TTL_SECONDS, pass 0 to force a fetch.
+    """
+    if ttl_seconds is None:
+        ttl_seconds = SECRETS_TTL_SECONDS
+    key = (secret_name, region_name)
+    with _SECRETS_LOCK:
+        cached = _SECRETS.get(key)
+    if cached is not None and time.monotonic() - cached[0] < ttl_seconds:
+        return cached[1]
+
+    client = get_client("secretsmanager", region_name)
+    secret_response = client.get_secret_value(SecretId=secret_name)
+    secret = secret_response["SecretString"]
+    with _SECRETS_LOCK:
+        _SECRETS[key] = (time.monotonic(), secret)
+
+    return secret
+
+
+def clear_secrets():
+    """Empties the secrets cache, e.g. after a rotation."""
+    with _SECRETS_LOCK:
+        _SECRETS.clear()
 
 
 def get_s3_file(s3_path: str) -> str:
@@ -23,6 +58,8 @@ def get_s3_file(s3_path: str) -> str:
     Returns:
         str: Contents of the file
     """
+    import boto3  # pylint: disable=import-outside-toplevel
+
     # Get the default bucket from SageMaker session
     session = boto3.Session()
     account_id = session.client("sts").get_caller_identity().get("Account")
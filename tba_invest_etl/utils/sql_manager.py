@@ -1,30 +1,278 @@
-from typing import Optional
+import io
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from dataclasses import astuple
+from itertools import count
+from typing import Iterable, Iterator, Optional
 
 import pandas as pd
 import psycopg2
-from sqlalchemy import create_engine
+import psycopg2.extensions
 
 from tba_invest_etl.domain_models.io import SQLParams
 
+# Connections and engines shared by every ManagerSQL with the same SQLParams. They live
+# at module level, so warm Lambda invocations reuse them. See get_connection and get_engine.
+_POOL = {}
+_ENGINES = {}
+_POOL_LOCK = threading.Lock()
+POOL_STATS = {"connects": 0, "reuses": 0, "reconnects": 0, "connect_seconds": 0.0}
 
-class ManagerSQL:
-    def __init__(self, sql_params: SQLParams):
-        # Basic db parameters
-        db_name = sql_params.dbname
-        user = sql_params.username
-        password = sql_params.password
-        host = sql_params.host
-        port = sql_params.port
+# Dtypes of streamed columns by Postgres type oid (float4, float8, numeric, timestamp), so
+# every chunk gets the same dtypes, even when one has only nulls. See select_chunks.
+CHUNK_DTYPES = {700: "float64", 701: "float64", 1700: "float64", 1114: "datetime64[ns]"}
 
-        # Connexion for downloading data
-        self.cnxn = psycopg2.connect(
-            database=db_name, user=user, password=password, host=host, port=port
-        )
+# Postgres type oids by kind, used to type the csv output of select_typed
+INT_OIDS = {20, 21, 23}
+FLOAT_OIDS = {700, 701, 1700}
+DATE_OID = 1082
+TIMESTAMP_OID = 1114
+TIMESTAMPTZ_OID = 1184
+BOOL_OID = 16
+
+# First server version (14) with plan counts in pg_prepared_statements
+PLAN_COUNTS_VERSION = 140000
+
+# Names of server-side cursors
+_CURSOR_IDS = count()
+
+# Statements prepared on each connection (name: statement), see ManagerSQL.prepare
+_PREPARED = weakref.WeakKeyDictionary()
+
+# Connections inside a transaction block, opened by any ManagerSQL sharing them.
+# See ManagerSQL.transaction
+_TRANSACTIONS = weakref.WeakSet()
+
+
+def _get_db_url(sql_params: SQLParams) -> str:
+    return (
+        "postgresql://"
+        + sql_params.username
+        + ":"
+        + sql_params.password
+        + "@"
+        + sql_params.host
+        + ":"
+        + str(sql_params.port)
+        + "/"
+        + sql_params.dbname
+    )
+
+
+def _connect(sql_params: SQLParams):
+    start = time.perf_counter()
+    cnxn = psycopg2.connect(
+        database=sql_params.dbname,
+        user=sql_params.username,
+        password=sql_params.password,
+        host=sql_params.host,
+        port=sql_params.port,
+    )
+    with _POOL_LOCK:
+        POOL_STATS["connects"] += 1
+        POOL_STATS["connect_seconds"] += time.perf_counter() - start
+    return cnxn
+
+
+def _is_alive(cnxn) -> bool:
+    """Checks cnxn with a round trip, leaving an open transaction untouched."""
+    if cnxn.closed:
+        return False
+    if cnxn in _TRANSACTIONS:
+        # In use by a transaction block, a broken connection makes the block raise
+        return True
+    try:
+        status = cnxn.info.transaction_status
+        if status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            cnxn.rollback()
+        with cnxn.cursor() as cursor:
+            cursor.execute("select 1")
+        if status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            cnxn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_connection(sql_params: SQLParams):
+    """Returns the shared psycopg2 connection for sql_params.
+
+    The connection is validated before being handed out and replaced if it is
+    no longer usable, e.g. after the server closed it between invocations.
+    """
+    key = astuple(sql_params)
+    with _POOL_LOCK:
+        cnxn = _POOL.get(key)
+    if cnxn is not None and _is_alive(cnxn):
+        with _POOL_LOCK:
+            POOL_STATS["reuses"] += 1
+        return cnxn
+
+    if cnxn is not None:
+        with _POOL_LOCK:
+            POOL_STATS["reconnects"] += 1
+    cnxn = _connect(sql_params)
+    with _POOL_LOCK:
+        _POOL[key] = cnxn
+    return cnxn
+
+
+def _create_engine(db_url: str, **kwargs):
+    # SQLAlchemy is only needed by to_sql uploads, so it is imported on first use
+    from sqlalchemy import create_engine  # pylint: disable=import-outside-toplevel
+
+    return create_engine(db_url, **kwargs)
+
+
+def get_engine(db_url: str):
+    """Returns the shared SQLAlchemy engine for db_url, created on first use."""
+    with _POOL_LOCK:
+        engine = _ENGINES.get(db_url)
+    if engine is None:
+        engine = _create_engine(db_url, pool_pre_ping=True)
+        with _POOL_LOCK:
+            engine = _ENGINES.setdefault(db_url, engine)
+    return engine
+
+
+def get_pool_stats() -> dict:
+    """Connection pool counters since the module was loaded (i.e. the cold start).
+
+    connect_time_saved estimates the time reused connections did not spend connecting.
+    """
+    with _POOL_LOCK:
+        stats = dict(POOL_STATS)
+    connects = stats["connects"]
+    stats["mean_connect_seconds"] = stats["connect_seconds"] / connects if connects else 0.0
+    stats["connect_time_saved"] = stats["reuses"] * stats["mean_connect_seconds"]
+    return stats
+
+
+def chunks_by_key(chunks: Iterable[pd.DataFrame], key: str) -> Iterator[pd.DataFrame]:
+    """Regroups chunks sorted by key so that the rows of a key are never split.
+
+    Rows of the last key of each chunk are carried over to the next one.
+    """
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            carry = chunk
+            continue
+        last = chunk[key].iat[-1]
+        is_last = (chunk[key] == last).to_numpy()
+        carry = chunk.loc[is_last]
+        if not is_last.all():
+            yield chunk.loc[~is_last].reset_index(drop=True)
+    if carry is not None and not carry.empty:
+        yield carry.reset_index(drop=True)
+
+
+def _read_copy_arrow(buffer, fields, categories, date_as_object) -> pd.DataFrame:
+    # Imported on first use, pyarrow is optional and slow to import
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    from pyarrow import csv as pa_csv  # pylint: disable=import-outside-toplevel
+
+    column_types = {}
+    for name, oid in fields:
+        if oid in INT_OIDS:
+            column_types[name] = pa.int64()
+        elif oid in FLOAT_OIDS:
+            column_types[name] = pa.float64()
+        elif oid == DATE_OID:
+            column_types[name] = pa.date32()
+        elif oid == TIMESTAMP_OID:
+            column_types[name] = pa.timestamp("us")
+        elif oid == BOOL_OID:
+            column_types[name] = pa.bool_()
+        elif name in categories:
+            column_types[name] = pa.dictionary(pa.int32(), pa.string())
+        else:
+            column_types[name] = pa.string()
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types,
+        null_values=["\\N"],
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False,
+        true_values=["t"],
+        false_values=["f"],
+    )
+    table = pa_csv.read_csv(buffer, convert_options=convert_options)
+    return table.to_pandas(date_as_object=date_as_object)
+
+
+def _read_copy_pandas(buffer, fields, categories, date_as_object) -> pd.DataFrame:
+    dtypes = {}
+    for name, oid in fields:
+        if oid in INT_OIDS:
+            dtypes[name] = "Int64"
+        elif oid in FLOAT_OIDS:
+            dtypes[name] = "float64"
+        elif name in categories:
+            dtypes[name] = "category"
+        else:
+            dtypes[name] = "object"
+    df = pd.read_csv(buffer, dtype=dtypes, na_values=["\\N"], keep_default_na=False)
+
+    for name, oid in fields:
+        if oid in INT_OIDS:
+            df[name] = df[name].astype("float64" if df[name].hasnans else "int64")
+        elif oid == DATE_OID:
+            df[name] = pd.to_datetime(df[name], format="%Y-%m-%d")
+            if date_as_object:
+                df[name] = df[name].dt.date.astype(object).where(df[name].notna(), None)
+        elif oid == TIMESTAMP_OID:
+            df[name] = pd.to_datetime(df[name])
+        elif oid == BOOL_OID:
+            df[name] = df[name].map({"t": True, "f": False})
+        elif dtypes[name] == "object":
+            # Nulls as None, as with pyarrow and select_query
+            df[name] = df[name].where(df[name].notna(), None)
+    return df
+
+
+class ManagerSQL:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
+    def __init__(self, sql_params: SQLParams, shared: bool = True):
+        # Connexions are shared with every ManagerSQL on the same database, unless
+        # shared=False. Use a private one for use from several threads.
+        self.shared = shared
+        if shared:
+            self.cnxn = get_connection(sql_params)
+        else:
+            self.cnxn = _connect(sql_params)
         self.cursor = self.cnxn.cursor()
+        self.db_url = _get_db_url(sql_params)
+
+        # Engine for to_sql uploads, created on first use, see con
+        self._con = None
+
+        # Column types per table, see get_column_types
+        self.column_types = {}
+
+        # Output columns (name, type oid) per query, see select_typed
+        self.typed_fields = {}
 
-        # Connexion for uploading data
-        self.db_url = "postgresql://" + user + ":" + password + "@" + host + "/" + db_name
-        self.con = create_engine(self.db_url)
+        # Prepared statements declared on this manager and their usage, see prepare
+        self.statements = {}
+        self.prepared_stats = {}
+
+    @property
+    def in_transaction(self) -> bool:
+        """Whether the connection is inside a transaction block, see transaction.
+
+        The state belongs to the connection, so it holds for every manager sharing it.
+        """
+        return self.cnxn in _TRANSACTIONS
+
+    @property
+    def con(self):
+        """SQLAlchemy engine for uploading data."""
+        if self._con is None:
+            self._con = get_engine(self.db_url) if self.shared else _create_engine(self.db_url)
+        return self._con
 
     def select(self, table):
         """Returns table as DataFrame."""
@@ -32,9 +280,97 @@ class ManagerSQL:
         df = pd.read_sql(sql, self.cnxn)
         return df
 
-    def select_query(self, query):
-        """Returns query output as DataFrame."""
-        df = pd.read_sql(query, self.cnxn)
+    def select_query(self, query, params: Optional[dict] = None):
+        """Returns query output as DataFrame. Accepts optional named parameters."""
+        df = pd.read_sql(query, self.cnxn, params=params)
+        return df
+
+    def select_chunks(
+        self, query: str, params: Optional[dict] = None, chunk_size: int = 10000
+    ) -> Iterator[pd.DataFrame]:
+        """Yields query output as DataFrames of at most chunk_size rows.
+
+        Rows are fetched chunk by chunk from a named server-side cursor, so memory
+        is bounded by chunk_size instead of the size of the output. Float, numeric
+        and timestamp columns are typed from the cursor description (see CHUNK_DTYPES).
+        Yields one empty DataFrame when there are no rows. The cursor is declared
+        with hold, so commits while consuming (e.g. uploads) do not close it.
+        """
+        name = f"chunks_{next(_CURSOR_IDS)}"
+        try:
+            with self.cnxn.cursor(name, withhold=True) as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query, params)
+                columns = None
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if columns is None:
+                        columns = [column.name for column in cursor.description]
+                        dtypes = {
+                            column.name: CHUNK_DTYPES[column.type_code]
+                            for column in cursor.description
+                            if column.type_code in CHUNK_DTYPES
+                        }
+                    elif not rows:
+                        break
+                    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                    yield df.astype(dtypes)
+                    if len(rows) < chunk_size:
+                        break
+            self._commit()
+        except Exception as e:
+            self._rollback()
+            raise e
+
+    def select_typed(
+        self,
+        query: str,
+        params: Optional[dict] = None,
+        categories: Optional[list] = None,
+        date_as_object: bool = True,
+    ) -> pd.DataFrame:
+        """Returns query output as a DataFrame of typed columns, read with COPY TO STDOUT.
+
+        Faster than select_query on large outputs: rows come as csv, parsed in bulk
+        (with pyarrow if installed, else pandas) into NumPy columns typed from the
+        Postgres types. numeric becomes float64, integers int64 (float64 with nulls),
+        timestamps datetime64 and text object, or categorical for the columns in
+        categories. Dates are datetime.date objects as with select_query, or
+        datetime64 with date_as_object=False. query cannot be a prepared statement.
+
+        The output columns of query are looked up on its first call and cached, so
+        later calls with other params take a single round trip. COPY cannot run a
+        prepared statement, so query is still parsed and planned on every call.
+        """
+        categories = set(categories or [])
+        try:
+            with self.cnxn.cursor() as cursor:
+                statement = cursor.mogrify(query, params).decode()
+                if query not in self.typed_fields:
+                    cursor.execute(f"select * from ({statement}) q limit 0")
+                    self.typed_fields[query] = [
+                        (column.name, column.type_code) for column in cursor.description
+                    ]
+                fields = self.typed_fields[query]
+                buffer = io.BytesIO()
+                cursor.copy_expert(
+                    f"copy ({statement}) to stdout with (format csv, header, null '\\N')", buffer
+                )
+            self._commit()
+        except Exception as e:
+            self._rollback()
+            raise e
+
+        buffer.seek(0)
+        try:
+            df = _read_copy_arrow(buffer, fields, categories, date_as_object)
+        except ImportError:
+            df = _read_copy_pandas(buffer, fields, categories, date_as_object)
+
+        # Timestamps with time zone, in UTC
+        for name, oid in fields:
+            if oid == TIMESTAMPTZ_OID:
+                df[name] = pd.to_datetime(df[name], utc=True)
         return df
 
     def select_column_list(self, column, table):
@@ -101,17 +437,394 @@ class ManagerSQL:
         for chunk in chunks:
             df.loc[chunk, :].to_sql(name=table, con=self.con, if_exists="append", index=False)
 
+    def _commit(self):
+        if not self.in_transaction:
+            self.cnxn.commit()
+
+    def _rollback(self):
+        # Inside a transaction block the error aborts it, the block rolls it back
+        if not self.in_transaction:
+            self.cnxn.rollback()
+
+    @contextmanager
+    def transaction(self):
+        """Runs the queries and uploads of the block in a single transaction.
+
+        Commits when the block ends and rolls everything back if it raises.
+        Nested blocks, also those of other managers sharing the connection, join the
+        outer transaction. An error caught inside the block still aborts it: the
+        block then raises instead of committing.
+        """
+        if self.in_transaction:
+            yield
+            return
+
+        _TRANSACTIONS.add(self.cnxn)
+        try:
+            yield
+            if self.cnxn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+                raise psycopg2.InternalError("Transaction aborted by an error inside the block")
+            self.cnxn.commit()
+        except Exception as e:
+            self.cnxn.rollback()
+            raise e
+        finally:
+            _TRANSACTIONS.discard(self.cnxn)
+
+    def get_column_types(self, table: str) -> dict:
+        """Returns {column: postgres data type} of table, in table order. Cached per table.
+
+        Works for any table in the search path, including temporary tables.
+        """
+        if table not in self.column_types:
+            query = """
+                select attname, atttypid::regtype::text
+                from pg_attribute
+                where attrelid = %(table)s::regclass
+                    and attnum > 0
+                    and not attisdropped
+                order by attnum
+            """
+            rows = self.query_fetchall(query, {"table": table})
+            self.column_types[table] = dict(rows)
+        return self.column_types[table]
+
+    def _to_copy_df(self, table: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Casts df columns so their text form is accepted by COPY into table."""
+        column_types = self.get_column_types(table)
+        unknown = [col for col in df.columns if col not in column_types]
+        if unknown:
+            raise ValueError(f"Columns {unknown} are not in table {table}")
+
+        df = df.copy()
+        for col in df.columns:
+            data_type = column_types[col]
+            if data_type in ("smallint", "integer", "bigint") and pd.api.types.is_float_dtype(
+                df[col]
+            ):
+                # Floats would be written as 1.0, rounded as an insert would do
+                df[col] = df[col].round().astype("Int64")
+            elif data_type == "timestamp without time zone" and isinstance(
+                df[col].dtype, pd.DatetimeTZDtype
+            ):
+                # Time zones are ignored by timestamp columns, store the UTC time
+                df[col] = df[col].dt.tz_convert("UTC").dt.tz_localize(None)
+        return df
+
+    def upload_df_copy(self, table: str, df: pd.DataFrame):
+        """
+        Uploads data frame to table with COPY FROM STDIN. Appends information.
+
+        Much faster than upload_df_chunks for large frames: the frame is written as
+        csv to an in-memory buffer and streamed in a single statement. Columns are
+        matched by name and cast according to the table's column types. Missing
+        values (None, NaN, NaT) are stored as null.
+        """
+        if df.empty:
+            return
+
+        df = self._to_copy_df(table, df)
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, na_rep="\\N")
+        buffer.seek(0)
+
+        columns = ", ".join(f'"{col}"' for col in df.columns)
+        query = f"copy {table} ({columns}) from stdin with (format csv, null '\\N')"
+        try:
+            with self.cnxn.cursor() as cursor:
+                cursor.copy_expert(query, buffer)
+            self._commit()
+        except Exception as e:
+            self._rollback()
+            raise e
+
+    def upsert_df(
+        self,
+        table: str,
+        df: pd.DataFrame,
+        key_columns: list,
+        ignore_columns: Optional[list] = None,
+    ) -> str:
+        """
+        Inserts data frame into table, updating the rows whose key_columns already exist.
+
+        The frame is loaded with COPY into a temporary staging table like table,
+        then merged with insert ... on conflict (key_columns) do update. Rows equal
+        to the db ones, ignoring ignore_columns (e.g. lud), are left untouched.
+        table needs a unique index on key_columns.
+
+        Returns the name of the staging table, which is dropped on commit. To use
+        it in further queries call upsert_df inside a transaction block. It is
+        qualified with pg_temp, so permanent tables are never dropped or read instead.
+        """
+        staging = "pg_temp._upsert_" + table.replace(".", "_")
+        columns = list(df.columns)
+        update_columns = [col for col in columns if col not in key_columns]
+        compare_columns = [col for col in update_columns if col not in (ignore_columns or [])]
+
+        cols = ", ".join(f'"{col}"' for col in columns)
+        keys = ", ".join(f'"{col}"' for col in key_columns)
+        query = f"""
+            insert into {table} as t ({cols})
+            select {cols} from {staging}
+            on conflict ({keys}) do update
+            set {", ".join(f'"{col}" = excluded."{col}"' for col in update_columns)}
+        """
+        if compare_columns:
+            query += f"""
+            where ({", ".join(f't."{col}"' for col in compare_columns)})
+                is distinct from ({", ".join(f'excluded."{col}"' for col in compare_columns)})
+            """
+
+        with self.transaction():
+            self.query(f"drop table if exists {staging}")
+            self.query(
+                f"create temp table {staging} (like {table} including defaults) on commit drop"
+            )
+            self.upload_df_copy(staging, df)
+            self.query(query)
+        return staging
+
+    def refresh_table(
+        self,
+        table: str,
+        df=None,
+        query: Optional[str] = None,
+    ):
+        """
+        Replaces the content of table with df, or with the output of query, atomically.
+        df is a DataFrame or an iterable of DataFrames, loaded one at a time.
+
+        The new content is loaded into {table}_staging, indexes and constraints of
+        table are rebuilt on it, and both tables are swapped by renaming in a single
+        transaction, so readers see either the old or the new content, never an
+        empty or partial table, and no dead rows are left behind. Views depending
+        on table are recreated on the new table.
+
+        With df, table must exist and the staging table is created like it.
+        With query (a select), table is created from it if it does not exist.
+        Privileges and foreign keys referencing table are not carried over.
+
+        Concurrent refreshes of table are serialized with an advisory lock, and
+        {table}_staging and {table}_old left behind by an interrupted refresh are
+        dropped before loading.
+        """
+        assert (df is None) != (query is None), "Pass either df or query"
+        lock = {"namespace": "refresh_table", "table": table}
+        self.query_fetchall(
+            "select pg_advisory_lock(hashtext(%(namespace)s), hashtext(%(table)s))", lock
+        )
+        try:
+            self._refresh_table(table, df, query)
+        finally:
+            self.query_fetchall(
+                "select pg_advisory_unlock(hashtext(%(namespace)s), hashtext(%(table)s))", lock
+            )
+
+    def _refresh_table(self, table: str, df, query: Optional[str]):
+        """Loads and swaps table for refresh_table, holding its advisory lock."""
+        staging = f"{table}_staging"
+        old = f"{table}_old"
+        exists = self.query_fetchall("select to_regclass(%(table)s)", {"table": table})[0][0]
+
+        # Load, then build indexes on the loaded table
+        self.query(f"drop table if exists {staging}, {old}")
+        if df is not None:
+            self.query(f"create table {staging} (like {table} including defaults)")
+            for chunk in [df] if isinstance(df, pd.DataFrame) else df:
+                self.upload_df_copy(staging, chunk)
+        else:
+            self.query(f"create table {staging} as {query}")
+        self.column_types.pop(staging, None)
+        indexes = self._build_staging_indexes(table, staging) if exists else {}
+        self.query(f"analyze {staging}")
+
+        with self.transaction():
+            views = []
+            if exists:
+                self.query(f"lock table {table} in access exclusive mode")
+                views = self._drop_dependent_views(table)
+                self.query(f"alter table {table} rename to {old}")
+                for name in indexes:
+                    self.query(f"alter index {name} rename to {name}_old")
+            self.query(f"alter table {staging} rename to {table}")
+            for name, staging_name in indexes.items():
+                self.query(f"alter index {staging_name} rename to {name}")
+            for view, kind, definition in views:
+                self.query(f"create {kind} {view} as {definition}")
+            if exists:
+                self.query(f"drop table {old}")
+        self.column_types.pop(table, None)
+        # Queries reading table may output other columns
+        self.typed_fields.clear()
+
+    def _build_staging_indexes(self, table: str, staging: str) -> dict:
+        """Creates the indexes and key constraints of table on staging.
+
+        Returns {index name in table: index name in staging}.
+        """
+        query = """
+            select i.relname, c.conname, pg_get_constraintdef(c.oid), pg_get_indexdef(i.oid)
+            from pg_index x
+            join pg_class i on i.oid = x.indexrelid
+            left join pg_constraint c on c.conindid = x.indexrelid and c.conrelid = x.indrelid
+            where x.indrelid = %(table)s::regclass
+        """
+        indexes = {}
+        for index_name, constraint_name, constraint_def, index_def in self.query_fetchall(
+            query, {"table": table}
+        ):
+            staging_name = f"{index_name}_staging"
+            if constraint_name is not None:
+                # Primary keys and unique constraints, named after their index
+                self.query(f"alter table {staging} add constraint {staging_name} {constraint_def}")
+            else:
+                on_table = index_def.index(" ON ")
+                using = index_def.index(" USING ")
+                self.query(
+                    index_def[:on_table].replace(index_name, staging_name, 1)
+                    + f" ON {staging}"
+                    + index_def[using:]
+                )
+            indexes[index_name] = staging_name
+        return indexes
+
+    def _drop_dependent_views(self, table: str) -> list:
+        """Drops the views selecting from table, and the views selecting from those.
+
+        Returns [(view, kind, definition)] to recreate them, in dependency order.
+        """
+        query = """
+            with recursive dependents(oid, depth) as (
+                select %(table)s::regclass::oid, 0
+                union all
+                select v.oid, dependents.depth + 1
+                from dependents
+                join pg_depend d on d.refobjid = dependents.oid
+                join pg_rewrite r on r.oid = d.objid
+                join pg_class v on v.oid = r.ev_class
+                where d.classid = 'pg_rewrite'::regclass
+                    and v.oid <> d.refobjid
+            )
+            select v.oid::regclass::text,
+                case when v.relkind = 'm' then 'materialized view' else 'view' end,
+                pg_get_viewdef(v.oid)
+            from dependents
+            join pg_class v on v.oid = dependents.oid
+            where dependents.depth > 0
+            group by v.oid, v.relkind
+            order by max(dependents.depth)
+        """
+        views = self.query_fetchall(query, {"table": table})
+        for view, kind, _ in reversed(views):
+            self.query(f"drop {kind} {view}")
+        return views
+
     def query(self, query: str, params: Optional[dict] = None):
         """Execute a query with optional named parameters."""
         try:
             with self.cnxn.cursor() as cursor:
                 cursor.execute(query, params)
-                self.cnxn.commit()
+                self._commit()
         except Exception as e:
-            self.cnxn.rollback()
+            self._rollback()
+            raise e
+
+    def query_fetchall(self, query: str, params: Optional[dict] = None) -> list:
+        """Execute a query with optional named parameters and return its rows."""
+        try:
+            with self.cnxn.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                self._commit()
+            return rows
+        except Exception as e:
+            self._rollback()
+            raise e
+
+    def prepare(self, name: str, statement: str, types: list):
+        """Declares a named server-side prepared statement.
+
+        statement takes positional parameters $1, $2, ... of the given Postgres types,
+        e.g. ["text[]", "int"], lists are bound to array types. It is prepared on the
+        connection on first execution and then reused, so Postgres parses it once and
+        can switch to a cached generic plan. Names are per connection, which is shared,
+        so they should include the table name.
+        """
+        self.statements[name] = (statement, list(types))
+
+    def _execute_prepared(self, cursor, name: str, params: list):
+        statement, types = self.statements[name]
+        prepared = _PREPARED.setdefault(self.cnxn, {})
+        stats = self.prepared_stats.setdefault(name, {"prepares": 0, "executions": 0})
+        if prepared.get(name) != statement:
+            if name in prepared:
+                cursor.execute(f"deallocate {name}")
+            cursor.execute(f"prepare {name} ({', '.join(types)}) as {statement}")
+            prepared[name] = statement
+            stats["prepares"] += 1
+        # Casts type parameters psycopg2 cannot, e.g. a list of None is text[]
+        placeholders = ", ".join(f"%s::{type_}" for type_ in types)
+        cursor.execute(f"execute {name} ({placeholders})", list(params))
+        stats["executions"] += 1
+
+    def select_prepared(self, name: str, params: list) -> pd.DataFrame:
+        """Returns the output of prepared statement name as DataFrame, see prepare."""
+        try:
+            with self.cnxn.cursor() as cursor:
+                self._execute_prepared(cursor, name, params)
+                columns = [column.name for column in cursor.description]
+                df = pd.DataFrame.from_records(
+                    cursor.fetchall(), columns=columns, coerce_float=True
+                )
+            return df
+        except Exception as e:
+            self._rollback()
+            raise e
+
+    def query_prepared(self, name: str, params: list):
+        """Executes prepared statement name, see prepare."""
+        try:
+            with self.cnxn.cursor() as cursor:
+                self._execute_prepared(cursor, name, params)
+                self._commit()
+        except Exception as e:
+            self._rollback()
             raise e
 
+    def get_prepared_stats(self) -> dict:
+        """Usage of the prepared statements of this manager, with server plan counts.
+
+        parse_hits are executions that reused a prepared statement. generic_plans and
+        custom_plans come from pg_prepared_statements and count the whole connection,
+        generic_plans are executions that reused the cached plan. They are None before
+        Postgres 14, which does not count plans.
+        """
+        plans = {}
+        has_plan_counts = self.cnxn.server_version >= PLAN_COUNTS_VERSION
+        if self.prepared_stats and has_plan_counts:
+            query = """
+                select name, generic_plans, custom_plans
+                from pg_prepared_statements
+                where name = any(%(names)s)
+            """
+            rows = self.query_fetchall(query, {"names": list(self.prepared_stats)})
+            plans = {name: (generic, custom) for name, generic, custom in rows}
+
+        stats = {}
+        for name, counts in self.prepared_stats.items():
+            generic_plans, custom_plans = plans.get(
+                name, (0, 0) if has_plan_counts else (None, None)
+            )
+            stats[name] = {
+                **counts,
+                "parse_hits": counts["executions"] - counts["prepares"],
+                "generic_plans": generic_plans,
+                "custom_plans": custom_plans,
+            }
+        return stats
+
     def clean_table(self, table):
         """Delete all information from the table."""
         self.cursor.execute(f"delete from {table}")
-        self.cnxn.commit()
+        self._commit()
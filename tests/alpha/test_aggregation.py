@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tba_invest_etl.alpha import aggregation
+from tba_invest_etl.alpha.table import AlphaTablePricesMonthly
+
+
+def make_prices_daily(n_symbols: int, seed: int = 0) -> pd.DataFrame:
+    """Shuffled daily prices of symbols listed on different dates, with gaps"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n_symbols):
+        dates = pd.bdate_range("2022-01-01", "2024-03-14")[rng.integers(0, 300) :]
+        # Saturday after the last business day of September, binned into October
+        dates = dates.append(pd.DatetimeIndex(["2023-09-30"]))
+        adjusted_close = 100 + rng.normal(size=len(dates)).cumsum().round(2)
+        adjusted_close[rng.uniform(size=len(dates)) < 0.02] = np.nan
+        frames.append(
+            pd.DataFrame(
+                {
+                    "symbol": f"S{i}",
+                    "date": dates,
+                    "open": rng.normal(size=len(dates)),
+                    "high": 1.0,
+                    "low": 1.0,
+                    "close": 1.0,
+                    "adjusted_close": adjusted_close,
+                    "volume": rng.integers(0, 1000, len(dates)),
+                    "lud": pd.Timestamp("2024-03-14")
+                    + pd.to_timedelta(rng.integers(0, 1000, len(dates)), "s"),
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=seed)
+
+
+def test_to_business_month_ends():
+    """Dates are labelled as resample("BM") does"""
+    dates = pd.to_datetime(["2024-03-01", "2024-03-29", "2024-03-30", "2024-06-03", "2023-12-31"])
+    labels = aggregation.to_business_month_ends(dates.to_numpy())
+
+    assert list(pd.to_datetime(labels)) == [
+        pd.Timestamp("2024-03-29"),
+        pd.Timestamp("2024-03-29"),
+        pd.Timestamp("2024-04-30"),
+        pd.Timestamp("2024-06-28"),
+        pd.Timestamp("2024-01-31"),
+    ]
+
+
+@pytest.mark.parametrize("n_symbols", [1, 20])
+def test_get_prices_monthly_matches_resample(n_symbols):
+    """Same months as AlphaTablePricesMonthly._get_prices_monthly"""
+    prices_daily = make_prices_daily(n_symbols)
+    expected = AlphaTablePricesMonthly._get_prices_monthly(  # pylint: disable=protected-access
+        None, prices_daily.copy()
+    ).reset_index(drop=True)
+
+    actual = aggregation.get_prices_monthly(prices_daily)
+
+    pd.testing.assert_frame_equal(
+        actual.drop(columns="lud"), expected.drop(columns="lud"), check_exact=False, rtol=1e-12
+    )
+
+
+def test_get_prices_monthly_empty():
+    prices_daily = make_prices_daily(1).iloc[:0]
+
+    assert list(aggregation.get_prices_monthly(prices_daily).columns) == (
+        aggregation.MONTHLY_COLUMNS
+    )
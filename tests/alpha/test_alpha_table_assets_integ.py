@@ -0,0 +1,53 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from tba_invest_etl.alpha import table
+
+# Listings of test symbols, some listed twice or with other asset types
+ASSETS = [
+    ("TEST_ASSET_A", "Stock", "Active", None),
+    ("TEST_ASSET_B", "Stock", "Delisted", date(2020, 5, 1)),
+    ("TEST_ASSET_B", "Stock", "Active", None),
+    ("TEST_ASSET_C", "ETF", "Active", None),
+    ("TEST_ASSET_D", "Stock", "Delisted", date(2021, 1, 4)),
+    ("TEST_ASSET_D", "Stock", "Delisted", date(2019, 3, 1)),
+    ("TEST_ASSET_E", "Stock", "Delisted", None),
+]
+
+
+@pytest.fixture
+def assets_alpha(sql):
+    assets = pd.DataFrame(ASSETS, columns=["symbol", "asset_type", "status", "delisting_date"])
+    assets["name"] = assets.symbol
+    assets["exchange"] = "NYSE"
+    assets["ipo_date"] = date(2000, 1, 3)
+    assets["lud"] = datetime.now()
+    clean = "delete from assets_alpha where symbol like 'TEST_ASSET_%%'"
+    sql.query(clean)
+    sql.upload_df_copy("assets_alpha", assets)
+
+    yield assets
+
+    sql.query(clean)
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("asset_types", [["Stock"], ["Stock", "ETF"]])
+def test_get_assets_to_refresh(asset_types, assets_alpha, sql_params):
+    """De-duplicated in Postgres as previously in pandas"""
+    alpha_table = table.AlphaTable("prices_alpha", ["symbol", "date"], None, sql_params=sql_params)
+
+    assets = alpha_table.get_assets_to_refresh(asset_types)
+    assets = assets.loc[assets.symbol.str.startswith("TEST_ASSET_")].reset_index(drop=True)
+
+    expected = (
+        assets_alpha.loc[assets_alpha.asset_type.isin(asset_types)]
+        .sort_values(by=["symbol", "status", "delisting_date"])
+        .drop_duplicates(subset="symbol", keep="first")
+        .reset_index(drop=True)
+    )
+    assert list(assets.columns) == ["symbol", "delisting_date"]
+    assert list(assets.symbol) == list(expected.symbol)
+    assert list(assets.delisting_date) == list(expected.delisting_date)
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tba_invest_etl.alpha import table
+
+SYMBOLS = ["TEST_MONTHLY_A", "TEST_MONTHLY_B"]
+
+MONTHLY_QUERY = """
+    select symbol, date, open, high, low, close, adjusted_close, monthly_volume,
+        monthly_return_std, monthly_return, day_count, source_lud
+    from prices_alpha_monthly
+    where symbol = any(%(symbols)s)
+    order by symbol, date
+"""
+
+
+def make_prices_daily(symbol: str, dates: pd.DatetimeIndex, rng) -> pd.DataFrame:
+    adjusted_close = np.round(100 * np.exp(rng.normal(0, 0.02, len(dates)).cumsum()), 2)
+    adjusted_close[rng.uniform(size=len(dates)) < 0.02] = np.nan
+    return pd.DataFrame(
+        {
+            "symbol": symbol,
+            "date": dates.date,
+            "open": np.round(rng.uniform(90, 110, len(dates)), 2),
+            "high": 110.0,
+            "low": 90.0,
+            "close": 100.0,
+            "adjusted_close": adjusted_close,
+            "volume": rng.integers(0, 10**6, len(dates)),
+            "dividend_amount": 0.0,
+            "split_coefficient": 1.0,
+            "lud": datetime.now(),
+        }
+    )
+
+
+@pytest.fixture
+def prices_daily(sql):
+    """Daily prices of test symbols, with a weekend day and missing closes"""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2022-01-03", "2024-03-14").append(pd.DatetimeIndex(["2023-09-30"]))
+    clean = "delete from {table} where symbol = any(%(symbols)s)"
+    for table_name in ["prices_alpha", "prices_alpha_monthly"]:
+        sql.query(clean.format(table=table_name), {"symbols": SYMBOLS})
+    for symbol in SYMBOLS:
+        sql.upload_df_copy("prices_alpha", make_prices_daily(symbol, dates, rng))
+
+    yield
+
+    for table_name in ["prices_alpha", "prices_alpha_monthly"]:
+        sql.query(clean.format(table=table_name), {"symbols": SYMBOLS})
+
+
+@pytest.mark.integration
+@pytest.mark.usefixtures("prices_daily")
+class TestAlphaTablePricesMonthlyIntegration:
+    def test_sql_engine_matches_pandas(self, sql_params, sql):
+        """INSERT ... SELECT in Postgres writes the same months as the pandas engine"""
+        table.AlphaTablePricesMonthly(
+            "prices_alpha_monthly", sql_params, engine="pandas"
+        ).update_list(SYMBOLS)
+        expected = sql.select_typed(MONTHLY_QUERY, {"symbols": SYMBOLS})
+
+        sql.query(
+            "delete from prices_alpha_monthly where symbol = any(%(symbols)s)", {"symbols": SYMBOLS}
+        )
+        stats = table.AlphaTablePricesMonthly(
+            "prices_alpha_monthly", sql_params, engine="sql"
+        ).update_list(SYMBOLS)
+        actual = sql.select_typed(MONTHLY_QUERY, {"symbols": SYMBOLS})
+
+        assert stats["months_recomputed"] == len(expected)
+        pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-10)
+
+    def test_sql_engine_incremental(self, sql_params, sql):
+        """Appended days only recompute their months, as a full recompute would"""
+        monthly = table.AlphaTablePricesMonthly(
+            "prices_alpha_monthly", sql_params, incremental=True, engine="sql"
+        )
+        monthly.update_list(SYMBOLS)
+        new_dates = pd.bdate_range("2024-03-15", "2024-04-10")
+        rng = np.random.default_rng(1)
+        sql.upload_df_copy("prices_alpha", make_prices_daily(SYMBOLS[0], new_dates, rng))
+
+        stats = monthly.update_list(SYMBOLS)
+        actual = sql.select_typed(MONTHLY_QUERY, {"symbols": SYMBOLS})
+        table.AlphaTablePricesMonthly(
+            "prices_alpha_monthly", sql_params, engine="pandas"
+        ).update_list(SYMBOLS)
+        expected = sql.select_typed(MONTHLY_QUERY, {"symbols": SYMBOLS})
+
+        assert stats["symbols_incremental"] == 1
+        assert stats["symbols_unchanged"] == 1
+        assert stats["months_recomputed"] == 2
+        pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-10)
+
+    def test_incremental_daily_committed_late(self, sql_params, sql):
+        """Daily rows stamped before a monthly run but committed after it are aggregated"""
+        monthly = table.AlphaTablePricesMonthly(
+            "prices_alpha_monthly", sql_params, incremental=True, engine="sql"
+        )
+        late_lud = datetime.now()
+        monthly.update_list(SYMBOLS)
+        new_dates = pd.bdate_range("2024-03-15", "2024-04-10")
+        late_prices = make_prices_daily(SYMBOLS[0], new_dates, np.random.default_rng(1))
+        sql.upload_df_copy("prices_alpha", late_prices.assign(lud=late_lud))
+
+        stats = monthly.update_list(SYMBOLS)
+        actual = sql.select_typed(MONTHLY_QUERY, {"symbols": SYMBOLS})
+
+        assert stats["symbols_incremental"] == 1
+        assert actual.date.max() == pd.Timestamp("2024-04-30").date()
@@ -1,23 +1,36 @@
-from datetime import date
-from unittest.mock import Mock
+import json
+import time
+from datetime import date, timedelta
+from unittest.mock import MagicMock, Mock
 
 import pandas as pd
 import pytest
 
+from tba_invest_etl.alpha import continuity
 from tba_invest_etl.alpha.api import AlphaScraper
-from tba_invest_etl.alpha.table import AlphaTablePrices
-from tba_invest_etl.domain_models.io import SQLParams
+from tba_invest_etl.alpha.table import AlphaTablePrices, AlphaTablePricesMonthly
+from tba_invest_etl.domain_models.io import ApiCallTiming, SQLParams
+
+
+def mock_api_response(payload: dict) -> Mock:
+    """Mocks a download of payload from the API"""
+    mock_response = Mock()
+    mock_response.json.return_value = payload
+    mock_response.content = json.dumps(payload).encode("utf-8")
+    return mock_response
 
 
 # Fixtures
 @pytest.fixture
 def mock_scraper():
-    return Mock(spec=AlphaScraper)
+    scraper = Mock(spec=AlphaScraper)
+    scraper.get_last_timing.return_value = ApiCallTiming("TEST", False, 0.5, 0.25, 0.75)
+    return scraper
 
 
 @pytest.fixture
 def mock_sql():
-    return Mock()
+    return MagicMock()
 
 
 @pytest.fixture
@@ -32,6 +45,13 @@ def price_table(mock_scraper, mock_sql, sql_params: SQLParams):
     return table
 
 
+@pytest.fixture
+def monthly_table(mock_sql, sql_params: SQLParams):
+    table = AlphaTablePricesMonthly("prices_alpha_monthly", sql_params, incremental=True)
+    table.sql = mock_sql
+    return table
+
+
 @pytest.fixture
 def sample_api_prices():
     """Create a sample DataFrame that matches the structure expected by the API"""
@@ -79,21 +99,22 @@ class TestAlphaTablePrices:
     def test_get_api_data_success(self, price_table, mock_scraper):
         """Test successful API data retrieval"""
         # Mock API response
-        mock_response = Mock()
-        mock_response.json.return_value = {
-            "Time Series (Daily)": {
-                "2024-01-02": {
-                    "1. open": "100.0",
-                    "2. high": "101.0",
-                    "3. low": "99.0",
-                    "4. close": "100.5",
-                    "5. adjusted_close": "100.5",
-                    "6. volume": "1000000",
-                    "7. dividend_amount": "0.0",
-                    "8. split_coefficient": "1.0",
+        mock_response = mock_api_response(
+            {
+                "Time Series (Daily)": {
+                    "2024-01-02": {
+                        "1. open": "100.0",
+                        "2. high": "101.0",
+                        "3. low": "99.0",
+                        "4. close": "100.5",
+                        "5. adjusted_close": "100.5",
+                        "6. volume": "1000000",
+                        "7. dividend_amount": "0.0",
+                        "8. split_coefficient": "1.0",
+                    }
                 }
             }
-        }
+        )
         mock_scraper.hit_api.return_value = mock_response
 
         # Test
@@ -105,11 +126,21 @@ class TestAlphaTablePrices:
         assert result.symbol.iloc[0] == "AAPL"
         assert result.close.iloc[0] == 100.5
 
+    def test_get_api_data_fetch_seconds(self, price_table, mock_scraper):
+        """Fetch seconds are those of the API call and parsing, cache hits are skipped"""
+        mock_scraper.hit_api.return_value = mock_api_response({"Time Series (Daily)": {}})
+
+        price_table.get_api_data("AAPL", size="compact")
+        mock_scraper.get_last_timing.return_value = None
+        price_table.get_api_data("MSFT", size="compact")
+
+        assert 0.75 <= price_table.fetch_seconds["AAPL"] < 1.75
+        assert "MSFT" not in price_table.fetch_seconds
+
     def test_get_api_data_failure(self, price_table, mock_scraper):
         """Test API data retrieval failure"""
         # Mock API response with error
-        mock_response = Mock()
-        mock_response.json.return_value = {"Error Message": "Invalid API call"}
+        mock_response = mock_api_response({"Error Message": "Invalid API call"})
         mock_scraper.hit_api.return_value = mock_response
 
         # Test
@@ -118,6 +149,22 @@ class TestAlphaTablePrices:
         # Assertions
         assert result is None
 
+    def test_get_api_data_csv(self, price_table, mock_scraper):
+        """Test csv datatype is requested and parsed"""
+        mock_response = Mock()
+        mock_response.content = (
+            b"timestamp,open,high,low,close,adjusted_close,volume,dividend_amount,"
+            b"split_coefficient\r\n2024-01-02,100.0,101.0,99.0,100.5,100.5,1000000,0.0,1.0\r\n"
+        )
+        mock_scraper.hit_api.return_value = mock_response
+        price_table.datatype = "csv"
+
+        result = price_table.get_api_data("AAPL", size="compact")
+
+        assert "datatype=csv" in mock_scraper.hit_api.call_args.args[0]
+        assert result.date.iloc[0] == date(2024, 1, 2)
+        assert result.close.iloc[0] == 100.5
+
     def test_get_api_prices_to_upload_full_history(self, price_table, sample_api_prices):
         """Test logic for determining what data needs to be uploaded - full history case"""
         # Create empty DataFrame with same columns as api_prices
@@ -166,21 +213,22 @@ class TestAlphaTablePrices:
     def test_update_method(self, price_table, mock_scraper, symbol, size):
         """Test update method with different symbols and sizes"""
         # Mock API response
-        mock_response = Mock()
-        mock_response.json.return_value = {
-            "Time Series (Daily)": {
-                "2024-01-02": {
-                    "1. open": "100.0",
-                    "2. high": "101.0",
-                    "3. low": "99.0",
-                    "4. close": "100.5",
-                    "5. adjusted_close": "100.5",
-                    "6. volume": "1000000",
-                    "7. dividend_amount": "0.0",
-                    "8. split_coefficient": "1.0",
+        mock_response = mock_api_response(
+            {
+                "Time Series (Daily)": {
+                    "2024-01-02": {
+                        "1. open": "100.0",
+                        "2. high": "101.0",
+                        "3. low": "99.0",
+                        "4. close": "100.5",
+                        "5. adjusted_close": "100.5",
+                        "6. volume": "1000000",
+                        "7. dividend_amount": "0.0",
+                        "8. split_coefficient": "1.0",
+                    }
                 }
             }
-        }
+        )
         mock_scraper.hit_api.return_value = mock_response
 
         # Mock the database response with an empty DataFrame with correct structure
@@ -199,7 +247,7 @@ class TestAlphaTablePrices:
                 "lud",
             ]
         )
-        price_table.sql.select_query.return_value = db_prices
+        price_table.sql.select_typed.return_value = db_prices
 
         # Execute update
         price_table.update(symbol, size)
@@ -211,4 +259,242 @@ class TestAlphaTablePrices:
         assert call_args["size"] == "full"  # If db has no data, it should fetch full history
 
         # Verify database operations
-        assert price_table.sql.upload_df_chunks.called, "Data should be uploaded to database"
+        assert price_table.sql.upload_df_copy.called, "Data should be uploaded to database"
+
+    def test_update_list_concurrent(self, price_table, mock_scraper):
+        """Test concurrent update_list downloads every symbol once and uploads in batch"""
+        mock_response = mock_api_response(
+            {
+                "Time Series (Daily)": {
+                    "2024-01-02": {
+                        "1. open": "100.0",
+                        "2. high": "101.0",
+                        "3. low": "99.0",
+                        "4. close": "100.5",
+                        "5. adjusted_close": "100.5",
+                        "6. volume": "1000000",
+                        "7. dividend_amount": "0.0",
+                        "8. split_coefficient": "1.0",
+                    }
+                }
+            }
+        )
+        mock_scraper.hit_api.return_value = mock_response
+        price_table.sql.select_prepared.return_value = pd.DataFrame(
+            columns=["symbol", "date", *continuity.COLS_EQUAL, "dates"]
+        )
+
+        symbols = ["AAPL", "MSFT", "GOOGL", "AMZN"]
+        price_table.update_list(symbols, "compact", max_workers=3)
+
+        assert mock_scraper.hit_api.call_count == len(symbols)
+        price_table.sql.upload_df_copy.assert_called_once()
+        uploaded = price_table.sql.upload_df_copy.call_args.args[1]
+        assert sorted(uploaded.symbol) == sorted(symbols)
+
+    def test_update_list_failed_downloads(self, price_table, mock_scraper):
+        """Symbols whose download fails are skipped"""
+        mock_response = mock_api_response({"Error Message": "Invalid API call"})
+        mock_scraper.hit_api.return_value = mock_response
+        price_table.sql.select_prepared.return_value = pd.DataFrame(columns=["symbol", "date"])
+
+        price_table.update_list(["AAPL", "MSFT"], "compact", max_workers=2)
+
+        assert mock_scraper.hit_api.call_count == 2
+        assert not price_table.sql.upload_df_copy.called
+
+    def test_get_api_data_concurrently_early_exit(self, price_table):
+        """Downloads still queued when the consumer stops iterating are cancelled"""
+        calls = []
+
+        def get_api_data(symbol):
+            calls.append(symbol)
+            time.sleep(0.01)
+            return symbol
+
+        price_table.get_api_data = get_api_data
+        symbols = [f"S{i}" for i in range(20)]
+        results = price_table.get_api_data_concurrently(symbols, max_workers=1)
+        next(results)
+        results.close()
+
+        assert len(calls) < len(symbols)
+
+    def test_update_from_batch_api_data_full(self, price_table):
+        """Full downloads of symbols with a long db history are settled in batch"""
+        dates = pd.Series(pd.bdate_range("2023-01-02", periods=301)).dt.date.to_numpy()
+        api_frames = {
+            symbol: pd.DataFrame(
+                {
+                    "symbol": symbol,
+                    "date": dates,
+                    "close": 100.0,
+                    "adjusted_close": 100.0,
+                    "dividend_amount": 0.0,
+                    "split_coefficient": 1.0,
+                }
+            )
+            for symbol in ["AAPL", "MSFT"]
+        }
+        watermarks = pd.DataFrame(
+            [
+                {
+                    "symbol": symbol,
+                    "date": dates[-2],
+                    **{col: frame[col].iloc[-2] for col in continuity.COLS_EQUAL},
+                    "dates": list(dates[-2::-1][: price_table.WATERMARK_DATES]),
+                }
+                for symbol, frame in api_frames.items()
+            ]
+        )
+        price_table._get_db_data = Mock()  # pylint: disable=protected-access
+
+        price_table.update_from_batch_api_data(
+            api_frames, dict.fromkeys(api_frames, "full"), watermarks
+        )
+
+        assert price_table.fetch_stats["watermark_fallbacks"] == 0
+        assert not price_table._get_db_data.called  # pylint: disable=protected-access
+        uploaded = price_table.sql.upload_df_copy.call_args.args[1]
+        assert list(uploaded.date) == [dates[-1]] * 2
+
+    def test_plan_sizes(self, price_table):
+        """Compact is kept only when it reaches back to the last db date"""
+        watermarks = pd.DataFrame(
+            {
+                "symbol": ["AAPL", "MSFT", "IBM"],
+                "date": [date.today() - timedelta(days=3), date(2020, 1, 2), date.today()],
+            }
+        )
+        sizes = price_table.plan_sizes(
+            ["AAPL", "MSFT", "IBM", "NEW"], "compact", watermarks, corporate_actions={"IBM"}
+        )
+
+        assert sizes == {"AAPL": "compact", "MSFT": "full", "IBM": "full", "NEW": "full"}
+        assert price_table.fetch_stats["planned_full"] == 3
+        assert price_table.fetch_stats["compact"] == 1
+
+    def test_get_db_data_projection(self, price_table):
+        """Only the keys and the continuity columns are read"""
+        price_table._get_db_data("AAPL")  # pylint: disable=protected-access
+
+        query, params = price_table.sql.select_typed.call_args.args
+        columns = query.split("select ", 1)[1].split(" from ", 1)[0]
+        assert columns.split(", ") == ["symbol", "date", *continuity.COLS_EQUAL]
+        assert params == {"symbol": "AAPL"}
+
+    def test_get_assets_to_refresh(self, price_table):
+        """Asset types are bound parameters of a single de-duplicating query"""
+        price_table.get_assets_to_refresh(("Stock", "ETF"))
+
+        query, params = price_table.sql.select_query.call_args.args
+        assert "distinct on" in query
+        assert params == {"asset_types": ["Stock", "ETF"]}
+
+    def test_get_assets_given(self, price_table):
+        """Assets passed in are not read again, only their watermarks"""
+        assets = pd.DataFrame({"symbol": ["AAPL", "MSFT"], "delisting_date": [None, None]})
+        price_table.sql.select_query.return_value = pd.DataFrame(
+            {"symbol": ["AAPL"], "max_date": [date(2024, 1, 2)], "row_count": [10]}
+        )
+
+        result = price_table.get_assets(True, ["Stock"], assets)
+
+        assert list(result.symbol) == ["AAPL", "MSFT"]
+        assert list(result.row_count.fillna(0)) == [10, 0]
+        query, _ = price_table.sql.select_query.call_args.args
+        assert "table_watermarks" in query
+
+    def test_write_prices_replace(self, price_table, sample_api_prices):
+        """Replace mode deletes the superseded rows and then uploads"""
+        price_table.write_mode = "replace"
+
+        price_table.write_prices(sample_api_prices, [])
+
+        delete, watermarks = price_table.sql.query_prepared.call_args_list
+        name, params = delete.args
+        assert name == "prices_alpha_delete_from_dates"
+        assert params[0] == list(sample_api_prices.symbol.unique())
+        price_table.sql.upload_df_copy.assert_called_once()
+        assert not price_table.sql.upsert_df.called
+
+        # Watermarks are written in the same transaction
+        name, params = watermarks.args
+        assert name == "prices_alpha_update_watermarks"
+        assert params[0] == ["AAPL"]
+        price_table.sql.transaction.assert_called_once()
+
+    def test_write_prices_upsert(self, price_table, sample_api_prices):
+        """Upsert mode merges on (symbol, date) instead of deleting first"""
+        price_table.write_mode = "upsert"
+
+        price_table.write_prices(sample_api_prices, [])
+
+        price_table.sql.upsert_df.assert_called_once()
+        assert not price_table.sql.upload_df_copy.called
+
+
+class TestAlphaTablePricesMonthly:
+    def test_plan_incremental(self, monthly_table):
+        """Months from the first changed date are recomputed, rewrites recompute all"""
+        monthly_table.sql.select_prepared.return_value = pd.DataFrame(
+            {
+                "symbol": ["NEW", "SAME", "SPLIT", "AAPL"],
+                "months": [0, 120, 120, 120],
+                "last_date": [None, date(2024, 3, 29), date(2024, 3, 29), date(2024, 3, 29)],
+                "cutoff": [None, None, date(2023, 6, 1), date(2024, 3, 1)],
+                "months_kept": [0, 120, 110, 119],
+            }
+        )
+
+        cutoffs = monthly_table.plan_incremental(["NEW", "SAME", "SPLIT", "AAPL"])
+
+        assert cutoffs == {"NEW": None, "SPLIT": None, "AAPL": date(2024, 3, 1)}
+        assert monthly_table.stats["symbols_unchanged"] == 1
+        assert monthly_table.stats["history_rewrites"] == 1
+        assert monthly_table.stats["months_skipped"] == 120 + 119
+
+    def test_update_from_prices_daily_incremental(self, monthly_table):
+        """Recomputed months match a full recompute from the cutoff on"""
+        dates = pd.bdate_range("2024-01-01", "2024-03-15")
+        prices_daily = pd.DataFrame(
+            {
+                "symbol": "AAPL",
+                "date": dates,
+                "open": 100.0,
+                "high": 100.0,
+                "low": 100.0,
+                "close": 100.0,
+                "adjusted_close": 100.0 + (pd.Series(range(len(dates))) % 7),
+                "volume": 1000,
+                "lud": pd.Timestamp("2024-03-15"),
+            }
+        )
+        expected = monthly_table._get_prices_monthly(  # pylint: disable=protected-access
+            prices_daily.copy()
+        )
+        cutoff = date(2024, 2, 1)
+        expected = expected.loc[expected.date >= pd.Timestamp(cutoff)]
+
+        # Daily prices from the last day before the cutoff
+        partial = prices_daily.loc[prices_daily.date >= pd.Timestamp("2024-01-31")]
+        monthly_table.update_from_prices_daily(partial.copy(), {"AAPL": cutoff})
+
+        name, params = monthly_table.sql.query_prepared.call_args.args
+        assert name == "prices_alpha_monthly_delete_from_dates"
+        assert params == [["AAPL"], [cutoff]]
+        _, uploaded = monthly_table.sql.upload_df_copy.call_args.args
+        pd.testing.assert_frame_equal(
+            uploaded.drop(columns="lud").reset_index(drop=True),
+            expected.drop(columns="lud").reset_index(drop=True),
+        )
+        assert monthly_table.stats["months_recomputed"] == 2
+
+        # Stale months are deleted and replaced in one transaction
+        assert [call[0] for call in monthly_table.sql.mock_calls] == [
+            "transaction",
+            "transaction().__enter__",
+            "query_prepared",
+            "upload_df_copy",
+            "transaction().__exit__",
+        ]
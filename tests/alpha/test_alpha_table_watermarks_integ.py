@@ -0,0 +1,93 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from tba_invest_etl.alpha import table
+
+SYMBOL = "TEST_WATERMARK"
+
+WATERMARK_QUERY = """
+    select last_date, last_lud, row_count, last_fetch
+    from table_watermarks
+    where table_name = 'prices_alpha' and symbol = %(symbol)s
+"""
+
+AGGREGATE_QUERY = """
+    select max(date) last_date, max(lud) last_lud, count(*) row_count
+    from prices_alpha
+    where symbol = %(symbol)s
+"""
+
+
+def make_prices(dates: pd.DatetimeIndex) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "symbol": SYMBOL,
+            "date": dates.date,
+            "open": 100.0,
+            "high": 100.0,
+            "low": 100.0,
+            "close": 100.0,
+            "adjusted_close": 100.0,
+            "volume": 1000,
+            "dividend_amount": 0.0,
+            "split_coefficient": 1.0,
+            "lud": datetime.now(),
+        }
+    )
+
+
+@pytest.fixture
+def clean_symbol(sql):
+    for table_name in ["prices_alpha", "table_watermarks"]:
+        sql.query(f"delete from {table_name} where symbol = %(symbol)s", {"symbol": SYMBOL})
+
+    yield
+
+    for table_name in ["prices_alpha", "table_watermarks"]:
+        sql.query(f"delete from {table_name} where symbol = %(symbol)s", {"symbol": SYMBOL})
+
+
+@pytest.mark.integration
+@pytest.mark.usefixtures("clean_symbol")
+@pytest.mark.parametrize("write_mode", ["upsert", "replace"])
+def test_write_prices_updates_watermarks(write_mode, sql_params, sql):
+    """Watermarks match the table after writes, and the planner reads them"""
+    alpha_prices = table.AlphaTablePrices(
+        "prices_alpha", ["symbol", "date"], None, sql_params=sql_params, write_mode=write_mode
+    )
+    alpha_prices.write_prices(make_prices(pd.bdate_range("2024-01-01", "2024-02-29")), [])
+    alpha_prices.write_prices(make_prices(pd.bdate_range("2024-02-15", "2024-03-14")), [])
+
+    watermark = sql.select_query(WATERMARK_QUERY, {"symbol": SYMBOL})
+    expected = sql.select_query(AGGREGATE_QUERY, {"symbol": SYMBOL})
+    pd.testing.assert_frame_equal(watermark.drop(columns="last_fetch"), expected)
+    assert watermark.last_date[0] == date(2024, 3, 14)
+    assert watermark.row_count[0] == len(pd.bdate_range("2024-01-01", "2024-03-14"))
+    assert watermark.last_fetch[0] is not None
+
+    assets = pd.DataFrame({"symbol": [SYMBOL], "delisting_date": [date(2024, 3, 14)]})
+    assets = alpha_prices.get_assets(False, ["Stock"], assets)
+    assert assets.empty
+
+
+class Rollback(Exception):
+    """Rolls back the test transaction"""
+
+
+@pytest.mark.integration
+@pytest.mark.usefixtures("clean_symbol")
+def test_write_prices_without_watermarks(sql_params, sql):
+    """Before table_watermarks is created, writes skip it and planning aggregates"""
+    alpha_prices = table.AlphaTablePrices("prices_alpha", ["symbol", "date"], None, sql_params)
+    assets = pd.DataFrame({"symbol": [SYMBOL], "delisting_date": [date(2024, 3, 14)]})
+    with pytest.raises(Rollback):
+        with sql.transaction():
+            sql.query("alter table table_watermarks rename to table_watermarks_pending")
+            alpha_prices.write_prices(make_prices(pd.bdate_range("2024-01-01", "2024-03-14")), [])
+
+            assert not alpha_prices.has_table_watermarks()
+            assert sql.select_query(AGGREGATE_QUERY, {"symbol": SYMBOL}).row_count[0] > 0
+            assert alpha_prices.get_assets(False, ["Stock"], assets).empty
+            raise Rollback
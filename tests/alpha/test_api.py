@@ -0,0 +1,94 @@
+import http.server
+import threading
+from concurrent import futures
+
+import pytest
+
+from tba_invest_etl.alpha.api import AlphaScraper
+from tba_invest_etl.alpha.cache import ResponseCache
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"Time Series (Daily)": {}}'
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def local_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/query?function=TEST&apikey={{api_key}}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestAlphaScraper:
+    def test_hit_api_reuses_connection(self, local_url):
+        """Consecutive calls share one keep-alive connection and record timings"""
+        with AlphaScraper(api_key="test", wait=False) as scraper:
+            for _ in range(5):
+                download = scraper.hit_api(local_url)
+                assert download.json() == {"Time Series (Daily)": {}}
+
+            summary = scraper.get_timing_summary()
+
+        assert summary["calls"] == 5
+        assert scraper.get_last_timing() is scraper.timings[-1]
+        assert summary["new_connections"] == 1
+        assert [t.function for t in scraper.timings] == ["TEST"] * 5
+        assert all(t.total >= t.elapsed for t in scraper.timings)
+
+    def test_hit_api_concurrent_connections(self, local_url):
+        """Concurrent calls open at most one connection per worker"""
+        with AlphaScraper(api_key="test", wait=False, pool_size=4) as scraper:
+            with futures.ThreadPoolExecutor(max_workers=4) as ex:
+                downloads = list(ex.map(lambda _: scraper.hit_api(local_url), range(12)))
+            summary = scraper.get_timing_summary()
+
+        assert all(d.status_code == 200 for d in downloads)
+        assert summary["calls"] == 12
+        assert 1 <= summary["new_connections"] <= 4
+        assert any(t.new_connection for t in scraper.timings)
+
+    def test_hit_api_reads_through_cache(self, local_url, tmp_path):
+        """Second identical call is served from the cache without reaching the API"""
+        cache = ResponseCache(str(tmp_path))
+        with AlphaScraper(api_key="test", wait=False, cache=cache) as scraper:
+            first = scraper.hit_api(local_url + "&symbol={symbol}", symbol="AAPL")
+            second = scraper.hit_api(local_url + "&symbol={symbol}", symbol="AAPL")
+
+        assert first.json() == second.json()
+        assert len(scraper.timings) == 1
+        assert scraper.get_last_timing() is None
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert len(list(tmp_path.glob("TEST/*.gz"))) == 1
+
+        # Replay offline: cached symbol is served, anything else raises
+        offline = AlphaScraper(
+            api_key="other", wait=False, cache=ResponseCache(str(tmp_path), offline=True)
+        )
+        assert offline.hit_api(local_url + "&symbol={symbol}", symbol="AAPL").json() == first.json()
+        with pytest.raises(LookupError):
+            offline.hit_api(local_url + "&symbol={symbol}", symbol="MSFT")
+
+
+class TestResponseCache:
+    def test_put_replace_keeps_total_bytes(self, tmp_path):
+        """Overwriting an entry counts its size once"""
+        cache = ResponseCache(str(tmp_path))
+        url = "https://example.com/query?function=TEST&symbol=AAPL&apikey=test"
+        for _ in range(3):
+            cache.put(url, b"x" * 1000)
+
+        size = sum(path.stat().st_size for path in tmp_path.glob("TEST/*.gz"))
+        assert cache.total_bytes == size
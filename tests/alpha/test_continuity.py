@@ -0,0 +1,156 @@
+import json
+from datetime import date
+from unittest.mock import Mock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tba_invest_etl.alpha import continuity
+from tba_invest_etl.alpha.table import AlphaTablePrices
+
+SCENARIOS = [1, 2, 3, 4, 5, 6]
+
+
+def load_scenario(scenario: int):
+    """Returns api_prices, db_prices and size of a price scenario, renamed to its own symbol"""
+    prices_path = f"tests/unit/data/prices/scenario_{scenario}"
+    api_prices = pd.read_csv(f"{prices_path}/api_prices.csv")
+    db_prices = pd.read_csv(f"{prices_path}/db_prices.csv")
+    for df in (api_prices, db_prices):
+        df["date"] = pd.to_datetime(df.date, format="%m/%d/%y").dt.date
+        df["symbol"] = f"S{scenario}"
+    with open(f"{prices_path}/output_vars.json", encoding="utf-8") as vars_json:
+        size = json.load(vars_json)["size"]
+    return api_prices, db_prices, size
+
+
+def get_watermarks(db_prices: pd.DataFrame, n_dates: int) -> pd.DataFrame:
+    """Same output as AlphaTablePrices._get_db_watermarks"""
+    rows = []
+    for _, prices in db_prices.groupby("symbol"):
+        prices = prices.sort_values("date", ascending=False)
+        row = prices.iloc[0][["symbol", "date", *continuity.COLS_EQUAL]].to_dict()
+        row["dates"] = list(prices.date.drop_duplicates())[:n_dates]
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["symbol", "date", *continuity.COLS_EQUAL, "dates"])
+
+
+@pytest.fixture
+def price_table(sql_params_mock):
+    with patch("tba_invest_etl.utils.sql_manager.ManagerSQL"):
+        return AlphaTablePrices(
+            table_name="prices_alpha",
+            primary_keys=["symbol", "date"],
+            scraper=Mock(),
+            sql_params=sql_params_mock,
+        )
+
+
+class TestGetPricesToUpload:
+    def test_to_ordinals(self):
+        ordinals = continuity.to_ordinals([date(1970, 1, 2), date(2024, 1, 2)])
+        assert ordinals.dtype == np.int64
+        assert list(ordinals) == [1, 19724]
+
+    def test_batch_matches_per_symbol_decisions(self, price_table):
+        """One pass over every scenario matches get_api_prices_to_upload per scenario"""
+        scenarios = [load_scenario(scenario) for scenario in SCENARIOS]
+        api_prices = pd.concat([s[0] for s in scenarios], ignore_index=True)
+        db_prices = pd.concat([s[1] for s in scenarios], ignore_index=True)
+        sizes = {f"S{scenario}": s[2] for scenario, s in zip(SCENARIOS, scenarios)}
+        watermarks = get_watermarks(db_prices, AlphaTablePrices.WATERMARK_DATES)
+
+        decisions, api_prices_upload = continuity.get_prices_to_upload(
+            api_prices, watermarks, sizes, AlphaTablePrices.WATERMARK_DATES
+        )
+
+        # Scenario 3 has a gap in the db, it must be repaired from the full db history
+        assert list(decisions.index[decisions.fallback]) == ["S3"]
+
+        for api, db, size in scenarios:
+            symbol = api.symbol.iloc[0]
+            if symbol == "S3":
+                continue
+            should_upload, clean_db_table, expected = price_table.get_api_prices_to_upload(
+                api, db, size
+            )
+            decision = decisions.loc[symbol]
+            assert decision.should_upload == should_upload
+            assert decision.clean_db_table == clean_db_table
+            assert decision.needs_full == (should_upload and expected.empty)
+            actual = api_prices_upload.loc[api_prices_upload.symbol == symbol]
+            if expected.empty:
+                assert actual.empty
+            else:
+                pd.testing.assert_frame_equal(
+                    actual.reset_index(drop=True), expected.reset_index(drop=True)
+                )
+
+    def test_no_watermark(self):
+        api_prices, _, _ = load_scenario(1)
+        watermarks = get_watermarks(api_prices.iloc[:0], 10)
+
+        decisions, api_prices_upload = continuity.get_prices_to_upload(
+            api_prices, watermarks, {"S1": "compact"}, 10
+        )
+
+        assert decisions.loc["S1"].tolist() == [True, True, False, True, False]
+        assert api_prices_upload.empty
+
+    def test_price_break(self):
+        api_prices, db_prices, _ = load_scenario(1)
+        db_prices = db_prices.loc[db_prices.date < api_prices.date.max()].copy()
+        db_prices.loc[db_prices.date == db_prices.date.max(), "adjusted_close"] += 1
+        watermarks = get_watermarks(db_prices, 200)
+
+        decisions, api_prices_upload = continuity.get_prices_to_upload(
+            api_prices, watermarks, {"S1": "full"}, 200
+        )
+
+        assert decisions.loc["S1", "price_break"]
+        assert decisions.loc["S1", "clean_db_table"]
+        assert not decisions.loc["S1", "needs_full"]
+        assert len(api_prices_upload) == len(api_prices)
+
+    def test_api_beyond_watermark_dates(self):
+        """API dates older than truncated watermark dates are taken as in the db"""
+        api_prices, db_prices, _ = load_scenario(2)
+        watermarks = get_watermarks(db_prices, 2)
+
+        decisions, api_prices_upload = continuity.get_prices_to_upload(
+            api_prices, watermarks, {"S2": "full"}, 2
+        )
+
+        assert not decisions.loc["S2", "fallback"]
+        assert decisions.loc["S2", "should_upload"]
+        assert not decisions.loc["S2", "clean_db_table"]
+        assert (api_prices_upload.date > db_prices.date.max()).all()
+
+    @pytest.mark.parametrize("price_break", [False, True])
+    def test_full_history(self, price_break):
+        """A full download reaching back past the watermark dates is settled"""
+        dates = pd.Series(pd.bdate_range("2023-01-02", periods=301)).dt.date.to_numpy()
+        api_prices = pd.DataFrame(
+            {
+                "symbol": "FULL",
+                "date": dates,
+                "close": np.arange(301.0),
+                "adjusted_close": np.arange(301.0),
+                "dividend_amount": 0.0,
+                "split_coefficient": 1.0,
+            }
+        )
+        db_prices = api_prices.iloc[:300].copy()
+        if price_break:
+            db_prices.loc[299, "adjusted_close"] += 1
+        watermarks = get_watermarks(db_prices, AlphaTablePrices.WATERMARK_DATES)
+
+        decisions, api_prices_upload = continuity.get_prices_to_upload(
+            api_prices, watermarks, {"FULL": "full"}, AlphaTablePrices.WATERMARK_DATES
+        )
+
+        assert not decisions.loc["FULL", "fallback"]
+        assert decisions.loc["FULL", "clean_db_table"] == price_break
+        assert not decisions.loc["FULL", "needs_full"]
+        assert len(api_prices_upload) == (301 if price_break else 1)
@@ -0,0 +1,192 @@
+import csv
+import json
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tba_invest_etl.alpha import parsers
+
+
+def make_daily_adjusted_payload(n_days: int) -> dict:
+    """Synthetic TIME_SERIES_DAILY_ADJUSTED payload, most recent day first"""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range(end="2024-01-02", periods=n_days)[::-1]
+    time_series = {}
+    for day in dates:
+        close = rng.uniform(1, 500)
+        time_series[day.strftime("%Y-%m-%d")] = {
+            "1. open": f"{close * 0.99:.4f}",
+            "2. high": f"{close * 1.01:.4f}",
+            "3. low": f"{close * 0.98:.4f}",
+            "4. close": f"{close:.4f}",
+            "5. adjusted close": f"{close * 0.9:.4f}",
+            "6. volume": str(int(rng.integers(1, 10**8))),
+            "7. dividend amount": "0.0000",
+            "8. split coefficient": "1.0",
+        }
+    return {"Meta Data": {"2. Symbol": "AAPL"}, "Time Series (Daily)": time_series}
+
+
+def to_csv_content(payload: dict) -> bytes:
+    """Same time series as the API returns it with datatype=csv"""
+    lines = [
+        "timestamp,open,high,low,close,adjusted_close,volume,dividend_amount,split_coefficient"
+    ]
+    for day, values in payload["Time Series (Daily)"].items():
+        lines.append(",".join([day] + list(values.values())))
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def parse_daily_adjusted_legacy(prices_json: dict, symbol: str) -> pd.DataFrame:
+    """Previous AlphaTablePrices.get_api_data transformation"""
+    prices = pd.DataFrame(prices_json["Time Series (Daily)"], dtype="float").T
+    col_rename = {col: col[3:].replace(" ", "_") for col in prices.columns}
+    prices.rename(columns=col_rename, inplace=True)
+    prices = prices.reset_index().rename(columns={"index": "date"})
+    prices["symbol"] = symbol
+    cols = list(prices.columns[-1:]) + list(prices.columns[:-1])
+    prices = prices[cols]
+    prices = prices.astype({"symbol": "object", "date": "datetime64[ns]"})
+    prices["date"] = prices.date.dt.date
+    prices["lud"] = datetime.now()
+    return prices
+
+
+class TestParseDailyAdjusted:
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    def test_matches_legacy_frame(self, monkeypatch, use_orjson):
+        if use_orjson and parsers.orjson is None:
+            pytest.skip("orjson is not installed")
+        if not use_orjson:
+            monkeypatch.setattr(parsers, "orjson", None)
+        payload = make_daily_adjusted_payload(300)
+        content = json.dumps(payload).encode("utf-8")
+
+        expected = parse_daily_adjusted_legacy(payload, "AAPL")
+        actual = parsers.parse_daily_adjusted(content, "AAPL")
+
+        pd.testing.assert_frame_equal(actual.drop(columns="lud"), expected.drop(columns="lud"))
+        assert actual.lud.dtype == expected.lud.dtype
+        assert actual.date.iloc[0] == date(2024, 1, 2)
+
+    def test_missing_field(self):
+        payload = make_daily_adjusted_payload(3)
+        del next(iter(payload["Time Series (Daily)"].values()))["7. dividend amount"]
+        content = json.dumps(payload).encode("utf-8")
+
+        expected = parse_daily_adjusted_legacy(payload, "AAPL")
+        actual = parsers.parse_daily_adjusted(content, "AAPL")
+
+        pd.testing.assert_frame_equal(actual.drop(columns="lud"), expected.drop(columns="lud"))
+        assert np.isnan(actual.dividend_amount.iloc[0])
+
+    def test_error_payload(self):
+        with pytest.raises(ValueError, match="Time Series"):
+            parsers.parse_daily_adjusted(b'{"Error Message": "Invalid API call"}', "AAPL")
+
+
+class TestParseDailyAdjustedCsv:
+    def test_matches_json_frame(self):
+        payload = make_daily_adjusted_payload(300)
+
+        expected = parsers.parse_daily_adjusted(json.dumps(payload).encode("utf-8"), "AAPL")
+        actual = parsers.parse_daily_adjusted_csv(to_csv_content(payload), "AAPL")
+
+        pd.testing.assert_frame_equal(actual.drop(columns="lud"), expected.drop(columns="lud"))
+        assert actual.lud.dtype == expected.lud.dtype
+
+    def test_error_payload(self):
+        with pytest.raises(ValueError, match="Invalid API call"):
+            parsers.parse_daily_adjusted_csv(b'{"Error Message": "Invalid API call"}', "AAPL")
+
+
+class TestParseListings:
+    def test_matches_csv_reader(self):
+        content = (
+            "symbol,name,exchange,assetType,ipoDate,delistingDate,status\r\n"
+            "A,Agilent Technologies Inc,NYSE,Stock,1999-11-18,null,Active\r\n"
+            'AAA,"Listed Funds Trust, AAF",NYSE ARCA,ETF,2020-09-09,null,Active\r\n'
+            "NA,,NASDAQ,Stock,2021-01-04,null,Active\r\n"
+        ).encode("utf-8")
+        rows = list(csv.reader(content.decode("utf-8").splitlines(), delimiter=","))
+        expected = pd.DataFrame(rows[1:], columns=rows[0])
+
+        actual = parsers.parse_listings(content)
+
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+def make_accounting_payload(n_annual: int, n_quarterly: int) -> dict:
+    """Synthetic BALANCE_SHEET payload, with missing values and a long currency"""
+    rng = np.random.default_rng(0)
+
+    def make_report(fiscal_date, i):
+        report = {"fiscalDateEnding": fiscal_date, "reportedCurrency": "USD"}
+        for account in ["totalAssets", "totalLiabilities", "commonStock", "cashAndEquivalents"]:
+            report[account] = str(int(rng.integers(1, 10**12)))
+        report["commonStock"] = "None" if i % 3 == 0 else f"{rng.uniform(1, 10**6):.2f}"
+        if i % 5 == 0:
+            report["reportedCurrency"] = "None"
+        return report
+
+    years = pd.date_range(end="2023-12-31", periods=n_annual, freq="A")[::-1]
+    quarters = pd.date_range(end="2023-12-31", periods=n_quarterly, freq="Q")[::-1]
+    return {
+        "symbol": "AAPL",
+        "annualReports": [make_report(d.strftime("%Y-%m-%d"), i) for i, d in enumerate(years)],
+        "quarterlyReports": [
+            make_report(d.strftime("%Y-%m-%d"), i) for i, d in enumerate(quarters)
+        ],
+    }
+
+
+def parse_accounting_legacy(symbol: str, data_json: dict, accounts: list) -> pd.DataFrame:
+    """Previous AlphaTableAccounting.wrangle_json, for annual then quarterly reports"""
+    data = pd.DataFrame()
+    for key_report, report_type in parsers.ACCOUNTING_REPORT_TYPES.items():
+        for report in data_json.get(key_report, []):
+            data_report_lst = [
+                [k, int(float(v))] for k, v in report.items() if k in accounts and v != "None"
+            ]
+            currency = report["reportedCurrency"]
+            data_report = pd.DataFrame(data_report_lst, columns=["account_name", "account_value"])
+            data_report["symbol"] = symbol
+            data_report["report_type"] = report_type
+            data_report["report_date"] = report["fiscalDateEnding"]
+            data_report["currency"] = currency if len(currency) <= 3 else ""
+            data = pd.concat([data, data_report[parsers.ACCOUNTING_COLUMNS]])
+    return data.reset_index(drop=True)
+
+
+class TestParseAccounting:
+    ACCOUNTS = ["totalAssets", "commonStock", "cashAndEquivalents"]
+
+    def test_matches_legacy_frame(self):
+        payload = make_accounting_payload(20, 80)
+
+        expected = parse_accounting_legacy("AAPL", payload, self.ACCOUNTS)
+        actual = parsers.parse_accounting({"AAPL": json.dumps(payload).encode()}, self.ACCOUNTS)
+
+        keys = ["report_type", "report_date", "account_name"]
+        pd.testing.assert_frame_equal(
+            actual.sort_values(keys, ignore_index=True),
+            expected.sort_values(keys, ignore_index=True),
+        )
+        assert "None" not in actual.currency.tolist()
+
+    def test_many_symbols(self):
+        payload = make_accounting_payload(2, 4)
+
+        actual = parsers.parse_accounting({"AAPL": payload, "MSFT": payload}, self.ACCOUNTS)
+
+        single = parsers.parse_accounting({"AAPL": payload}, self.ACCOUNTS)
+        assert actual.symbol.value_counts().to_dict() == {"AAPL": len(single), "MSFT": len(single)}
+
+    def test_no_reports(self):
+        assert parsers.parse_accounting({}, self.ACCOUNTS).columns.tolist() == (
+            parsers.ACCOUNTING_COLUMNS
+        )
+        with pytest.raises(ValueError, match="AAPL"):
+            parsers.parse_accounting({"AAPL": b'{"Information": "Rate limit"}'}, self.ACCOUNTS)
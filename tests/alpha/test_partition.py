@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tba_invest_etl.alpha import partition
+
+
+def test_get_call_interval():
+    """Ten sublists sharing 75 calls per minute call every 8 seconds each"""
+    assert partition.get_call_interval(75, 10) == 8
+
+
+def test_estimate_costs():
+    """Measured durations come first, then row counts, never below the call interval"""
+    assets = pd.DataFrame(
+        {
+            "symbol": ["NEW", "LONG", "MEASURED", "FAST"],
+            "row_count": [np.nan, 10000, 6000, 10],
+            "last_duration": [np.nan, np.nan, 30.0, 0.1],
+        }
+    )
+
+    costs = partition.estimate_costs(assets, call_interval=2.0)
+
+    write = partition.WRITE_ROW_SECONDS
+    fetch_row = partition.FETCH_ROW_SECONDS
+    rows = partition.PRICES_ROWS
+    assert list(costs.index) == ["NEW", "LONG", "MEASURED", "FAST"]
+    assert costs["NEW"] == pytest.approx(max(1.0 + rows * fetch_row, 2.0) + rows * write)
+    assert costs["LONG"] == pytest.approx(max(1.0 + 10000 * fetch_row, 2.0) + 10000 * write)
+    assert costs["MEASURED"] == pytest.approx(30.0 + 6000 * write)
+    assert costs["FAST"] == pytest.approx(2.0 + 10 * write)
+
+
+def test_estimate_costs_compact():
+    """Compact downloads are capped at their rows, without watermark columns"""
+    assets = pd.DataFrame({"symbol": ["AAPL"]})
+
+    costs = partition.estimate_costs(assets, call_interval=0.0, max_rows=100)
+
+    expected = 1.0 + 100 * partition.FETCH_ROW_SECONDS + 100 * partition.WRITE_ROW_SECONDS
+    assert costs["AAPL"] == pytest.approx(expected)
+
+
+def test_balance_lists():
+    """Skewed costs are balanced better than equal-count sublists"""
+    rng = np.random.default_rng(0)
+    costs = pd.Series(rng.pareto(1.5, 400) + 1, index=[f"S{i}" for i in range(400)])
+
+    lists = partition.balance_lists(costs, 10)
+
+    symbols = [symbol for sublist, _ in lists for symbol in sublist]
+    assert sorted(symbols) == sorted(costs.index)
+    for sublist, seconds in lists:
+        assert seconds == pytest.approx(costs[sublist].sum())
+    makespan = max(seconds for _, seconds in lists)
+    equal_count = max(chunk.sum() for chunk in np.array_split(costs.to_numpy(), 10))
+    assert makespan <= equal_count
+    assert makespan <= max(costs.sum() / 10, costs.max()) * 4 / 3
+
+
+def test_balance_lists_few_symbols():
+    """Empty sublists are dropped"""
+    lists = partition.balance_lists(pd.Series([3.0, 1.0], index=["A", "B"]), 10)
+
+    assert lists == [(["A"], 3.0), (["B"], 1.0)]
+
+
+def test_partition_batches():
+    """Batches are cut by their time budget and their number of symbols"""
+    costs = pd.Series([1.0] * 10 + [100.0] + [1.0] * 30, index=[f"S{i:02d}" for i in range(41)])
+
+    batches = partition.partition_batches(
+        costs, n_lists=2, max_assets_in_batch=20, max_list_seconds=10
+    )
+
+    sizes = [sum(len(symbols) for symbols, _ in batch) for batch in batches]
+    assert sizes == [10, 1, 20, 10]
+    assert batches[1] == [(["S10"], 100.0)]
+    symbols = [symbol for batch in batches for sublist, _ in batch for symbol in sublist]
+    assert sorted(symbols) == list(costs.index)
+
+
+def test_partition_batches_longest_sublist():
+    """Batches shrink until their longest sublist fits, not only their average"""
+    costs = pd.Series(500.0, index=[f"S{i:02d}" for i in range(14)])
+
+    batches = partition.partition_batches(
+        costs, n_lists=10, max_assets_in_batch=4500, max_list_seconds=900
+    )
+
+    assert all(seconds <= 900 for batch in batches for _, seconds in batch)
+    assert [sum(len(symbols) for symbols, _ in batch) for batch in batches] == [10, 4]
+
+
+def test_partition_batches_hourly_quota():
+    """A compact refresh of an hourly quota of symbols fits a single batch"""
+    assets = pd.DataFrame({"symbol": [f"S{i:04d}" for i in range(4500)]})
+    costs = partition.estimate_costs(assets, call_interval=0.0, max_rows=100)
+
+    batches = partition.partition_batches(
+        costs, n_lists=10, max_assets_in_batch=4500, max_list_seconds=720
+    )
+
+    assert len(batches) == 1
+    assert len(batches[0]) == 10
+
+
+def test_get_run_makespan():
+    """Batches but the last last at least the wait between batches"""
+    assert partition.get_run_makespan([600.0, 4000.0, 300.0]) == 3600 + 4000 + 300
+    assert partition.get_run_makespan([]) == 0
+    assert partition.get_run_makespan([600.0, 300.0], wait_seconds=0.0) == 900
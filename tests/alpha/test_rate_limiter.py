@@ -0,0 +1,21 @@
+import time
+from concurrent import futures
+
+from tba_invest_etl.alpha.rate_limiter import TokenBucket
+
+
+class TestTokenBucket:
+    def test_acquire_within_capacity_does_not_wait(self):
+        bucket = TokenBucket(max_requests_per_min=60, capacity=5)
+        waited = [bucket.acquire() for _ in range(5)]
+        assert waited == [0.0] * 5
+
+    def test_acquire_honours_rate_across_threads(self):
+        """40 tokens at 1200 per minute (20 per second) need at least ~2 seconds"""
+        bucket = TokenBucket(max_requests_per_min=1200)
+        start = time.monotonic()
+        with futures.ThreadPoolExecutor(max_workers=8) as ex:
+            list(ex.map(lambda _: bucket.acquire(), range(40)))
+        elapsed = time.monotonic() - start
+        assert elapsed >= 39 / 20 * 0.95
+        assert bucket.tokens < 1
@@ -0,0 +1,39 @@
+import time
+from concurrent import futures
+
+import pytest
+
+from tba_invest_etl.alpha.rate_limiter import PostgresRateLimiter
+
+
+@pytest.mark.integration
+class TestPostgresRateLimiterIntegration:
+    @pytest.fixture
+    def limiter_name(self, sql):
+        name = "test_rate_limiter"
+        yield name
+        sql.query("delete from api_rate_limit where name = %(name)s", {"name": name})
+
+    def test_workers_share_quota(self, sql_params, limiter_name):
+        """Two limiters (e.g. two Lambda workers) with the same name share one bucket.
+
+        30 tokens at 600 per minute (10 per second) with capacity 1 need ~2.9 seconds.
+        """
+        limiters = [
+            PostgresRateLimiter(sql_params, name=limiter_name, max_requests_per_min=600)
+            for _ in range(2)
+        ]
+        start = time.monotonic()
+        with futures.ThreadPoolExecutor(max_workers=6) as ex:
+            list(ex.map(lambda i: limiters[i % 2].acquire(), range(30)))
+        elapsed = time.monotonic() - start
+        for limiter in limiters:
+            limiter.close()
+        assert elapsed >= 29 / 10 * 0.95
+
+    def test_acquire_within_capacity_does_not_wait(self, sql_params, limiter_name):
+        with PostgresRateLimiter(
+            sql_params, name=limiter_name, max_requests_per_min=60, capacity=3
+        ) as limiter:
+            assert [limiter.acquire() for _ in range(3)] == [0.0] * 3
+        assert limiter.sql.cnxn.closed
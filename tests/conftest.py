@@ -1,6 +1,7 @@
 # tests/conftest.py
 
 import functools
+import os
 import re
 from ast import literal_eval
 from datetime import datetime
@@ -105,7 +106,19 @@ def api_key():
 @pytest.fixture(scope="session")
 @sensitive_fixture
 def sql_params() -> SQLParams:
-    """Fixture to get database credentials from AWS Secrets"""
+    """Fixture to get database credentials from AWS Secrets.
+
+    Set TEST_DB_HOST (and optionally TEST_DB_PORT, TEST_DB_NAME, TEST_DB_USER,
+    TEST_DB_PASSWORD) to run the integration tests against a local Postgres instead.
+    """
+    if "TEST_DB_HOST" in os.environ:
+        return SQLParams(
+            dbname=os.environ.get("TEST_DB_NAME", "postgres"),
+            username=os.environ.get("TEST_DB_USER", "postgres"),
+            password=os.environ.get("TEST_DB_PASSWORD", ""),
+            host=os.environ["TEST_DB_HOST"],
+            port=int(os.environ.get("TEST_DB_PORT", 5432)),
+        )
     db_credentials = literal_eval(aws.get_secret("prod/awsportfolio/key"))
     return convert_dict_to_sql_params(db_credentials)
 
@@ -0,0 +1,41 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from tba_invest_etl.utils import aws
+
+
+@pytest.fixture
+def secrets_client():
+    aws.clear_secrets()
+    client = Mock()
+    client.get_secret_value.side_effect = lambda SecretId: {"SecretString": f"value {SecretId}"}
+    with patch.object(aws, "get_client", return_value=client):
+        yield client
+    aws.clear_secrets()
+
+
+def test_get_secret_cached(secrets_client):
+    assert aws.get_secret("prod/a") == "value prod/a"
+    assert aws.get_secret("prod/a") == "value prod/a"
+    assert aws.get_secret("prod/b") == "value prod/b"
+
+    assert secrets_client.get_secret_value.call_count == 2
+
+
+def test_get_secret_expired(secrets_client):
+    aws.get_secret("prod/a")
+    aws.get_secret("prod/a", ttl_seconds=0)
+
+    assert secrets_client.get_secret_value.call_count == 2
+
+
+def test_get_client_created_once():
+    aws.get_client.cache_clear()
+    with patch("boto3.session.Session") as session:
+        first = aws.get_client("secretsmanager", "us-east-2")
+        second = aws.get_client("secretsmanager", "us-east-2")
+
+    assert first is second
+    session.assert_called_once()
+    aws.get_client.cache_clear()
@@ -1,6 +1,11 @@
+from datetime import date
+from unittest.mock import Mock
+
 import pandas as pd
 import pytest
 
+from tba_invest_etl.utils import sql_manager
+
 
 @pytest.fixture
 def test_table(sql):
@@ -125,3 +130,383 @@ def test_integration_query_insert(sql, test_table):
     result = sql.select(test_table)
     expected_df = pd.DataFrame({"col1": [1, 2, 3], "col2": ["a", "b", "c"]})
     pd.testing.assert_frame_equal(result, expected_df)
+
+
+@pytest.mark.integration
+def test_integration_upload_df_copy(sql, test_table):
+    df = pd.DataFrame({"col1": [1.0, None, 3.0], "col2": ['a, "quoted"', None, "multi\nline"]})
+    sql.upload_df_copy(test_table, df)
+    result = sql.select(test_table)
+    expected_df = pd.DataFrame(
+        {"col1": [1.0, None, 3.0], "col2": ['a, "quoted"', None, "multi\nline"]}
+    )
+    pd.testing.assert_frame_equal(result, expected_df)
+
+
+@pytest.mark.integration
+def test_integration_upload_df_copy_matches_upload_df_chunks(sql):
+    table_name = "test_table_copy"
+    sql.query(
+        f"""
+        CREATE TABLE {table_name}
+        (symbol varchar(20), date date, close numeric(14,2), volume bigint, lud timestamp)
+        """
+    )
+    df = pd.DataFrame(
+        {
+            "symbol": ["AAPL", "MSFT"],
+            "date": [date(2024, 1, 2), date(2024, 1, 3)],
+            "close": [100.456, None],
+            "volume": [1000000.0, 2e9],
+            "lud": pd.to_datetime(["2024-01-02 10:00:00.123456", "2024-01-03 11:00:00"]),
+        }
+    )
+    try:
+        sql.upload_df_chunks(table_name, df)
+        expected = sql.select(table_name)
+        sql.clean_table(table_name)
+        sql.upload_df_copy(table_name, df)
+        result = sql.select(table_name)
+    finally:
+        sql.query(f"DROP TABLE {table_name}")
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.integration
+def test_integration_upload_df_copy_unknown_column(sql, test_table):
+    df = pd.DataFrame({"col1": [1], "col3": ["a"]})
+    with pytest.raises(ValueError, match="col3"):
+        sql.upload_df_copy(test_table, df)
+
+
+@pytest.mark.integration
+def test_integration_upsert_df(sql):
+    table_name = "test_table_upsert"
+    sql.query(
+        f"""
+        CREATE TABLE {table_name}
+        (symbol varchar(20), date date, close numeric(14,2), lud timestamp,
+        PRIMARY KEY (symbol, date))
+        """
+    )
+    old = pd.DataFrame(
+        {
+            "symbol": ["AAPL", "AAPL"],
+            "date": [date(2024, 1, 2), date(2024, 1, 3)],
+            "close": [100.0, 101.0],
+            "lud": pd.to_datetime(["2024-01-03", "2024-01-03"]),
+        }
+    )
+    new = pd.DataFrame(
+        {
+            "symbol": ["AAPL", "AAPL", "AAPL"],
+            "date": [date(2024, 1, 2), date(2024, 1, 3), date(2024, 1, 4)],
+            "close": [100.0, 111.0, 102.0],
+            "lud": pd.to_datetime(["2024-01-05", "2024-01-05", "2024-01-05"]),
+        }
+    )
+    # Permanent tables named like the staging table are left alone
+    sql.query(f"CREATE TABLE _upsert_{table_name} (id int)")
+    sql.query(f"CREATE TABLE {table_name}_staging (id int)")
+    try:
+        sql.upload_df_copy(table_name, old)
+        sql.upsert_df(table_name, new, ["symbol", "date"], ignore_columns=["lud"])
+        result = sql.select_query(f"SELECT * FROM {table_name} ORDER BY date")
+        permanent = sql.query_fetchall(
+            f"SELECT to_regclass('public._upsert_{table_name}'), "
+            f"to_regclass('public.{table_name}_staging')"
+        )[0]
+    finally:
+        sql.query(f"DROP TABLE {table_name}, _upsert_{table_name}, {table_name}_staging")
+
+    assert None not in permanent
+
+    # Unchanged rows keep their lud
+    assert result.close.tolist() == [100.0, 111.0, 102.0]
+    assert (
+        result.lud.tolist() == pd.to_datetime(["2024-01-03", "2024-01-05", "2024-01-05"]).tolist()
+    )
+
+
+@pytest.mark.integration
+def test_integration_transaction_rollback(sql, test_table):
+    with pytest.raises(ValueError):
+        with sql.transaction():
+            sql.query(f"INSERT INTO {test_table} (col1, col2) VALUES (1, 'a')")
+            raise ValueError("abort")
+    assert sql.select(test_table).empty
+
+
+@pytest.mark.integration
+def test_integration_transaction_shared_connection(sql, sql_params, test_table):
+    """Managers sharing the connection neither commit nor roll back an open transaction"""
+    other = sql_manager.ManagerSQL(sql_params)
+    assert other.cnxn is sql.cnxn
+
+    with pytest.raises(ValueError):
+        with sql.transaction():
+            sql.query(f"INSERT INTO {test_table} (col1, col2) VALUES (1, 'a')")
+            other.query(f"INSERT INTO {test_table} (col1, col2) VALUES (2, 'b')")
+            assert other.in_transaction
+            raise ValueError("abort")
+    assert sql.select(test_table).empty
+
+    # An error of the other manager aborts the whole transaction, nothing is committed
+    with pytest.raises(Exception):
+        with sql.transaction():
+            sql.query(f"INSERT INTO {test_table} (col1, col2) VALUES (1, 'a')")
+            try:
+                other.query(f"INSERT INTO {test_table} (col1, col2) VALUES ('x', 'b')")
+            except Exception:  # pylint: disable=broad-except
+                pass
+            sql.query(f"INSERT INTO {test_table} (col1, col2) VALUES (3, 'c')")
+    assert sql.select(test_table).empty
+
+
+@pytest.mark.integration
+def test_integration_select_chunks(sql, test_table):
+    sql.upload_df_copy(test_table, pd.DataFrame({"col1": range(5), "col2": list("abcde")}))
+    query = f"SELECT col1, col2, NULL::float8 col3 FROM {test_table} ORDER BY col1"
+
+    chunks = list(sql.select_chunks(query, chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    result = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(
+        result.drop(columns="col3"), sql.select_query(query).drop(columns="col3")
+    )
+    assert all(chunk.col3.dtype == "float64" for chunk in chunks)
+
+
+@pytest.mark.integration
+def test_integration_select_chunks_empty(sql, test_table):
+    chunks = list(sql.select_chunks(f"SELECT * FROM {test_table}"))
+
+    assert len(chunks) == 1
+    assert chunks[0].empty
+    assert chunks[0].columns.tolist() == ["col1", "col2"]
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("use_arrow", [True, False])
+def test_integration_select_typed(sql, monkeypatch, use_arrow):
+    if not use_arrow:
+        monkeypatch.setattr(sql_manager, "_read_copy_arrow", Mock(side_effect=ImportError))
+    query = """
+        SELECT * FROM (VALUES
+            ('AAA', DATE '2024-01-02', 1.25::numeric(14,2), 10::bigint, NULL::int, ''),
+            ('BBB', NULL, NULL, 11, 3, NULL)
+        ) v(symbol, date, close, volume, n, t)
+        WHERE symbol = ANY(%(symbols)s)
+    """
+    params = {"symbols": ["AAA", "BBB"]}
+
+    result = sql.select_typed(query, params, categories=["symbol"])
+
+    assert result.symbol.dtype == "category"
+    assert result.close.dtype == "float64"
+    assert result.volume.dtype == "int64"
+    pd.testing.assert_frame_equal(
+        result.astype({"symbol": object}), sql.select_query(query, params), check_dtype=False
+    )
+    assert result.date.tolist() == [date(2024, 1, 2), None]
+    assert result.t.tolist() == ["", None]
+
+    # Output columns are cached for later calls
+    assert query in sql.typed_fields
+    result = sql.select_typed(query, {"symbols": ["BBB"]}, categories=["symbol"])
+    assert result.volume.dtype == "int64"
+    assert result.n.tolist() == [3]
+
+
+def test_chunks_by_key():
+    df = pd.DataFrame({"key": list("aabbbc"), "value": range(6)})
+    chunks = [df.iloc[:3], df.iloc[3:4], df.iloc[4:]]
+
+    regrouped = list(sql_manager.chunks_by_key(chunks, "key"))
+
+    assert [chunk.key.tolist() for chunk in regrouped] == [["a", "a"], ["b", "b", "b"], ["c"]]
+    pd.testing.assert_frame_equal(pd.concat(regrouped, ignore_index=True), df)
+
+
+@pytest.mark.integration
+def test_integration_select_prepared(sql, test_table):
+    sql.upload_df_copy(test_table, pd.DataFrame({"col1": [1, 2, 3], "col2": ["a", "b", "c"]}))
+    sql.prepare(
+        "test_table_by_col2",
+        f"select * from {test_table} where col2 = any($1) order by col1",
+        ["text[]"],
+    )
+
+    first = sql.select_prepared("test_table_by_col2", [["a", "c"]])
+    second = sql.select_prepared("test_table_by_col2", [["b"]])
+
+    assert first.col1.tolist() == [1, 3]
+    assert second.col1.tolist() == [2]
+    stats = sql.get_prepared_stats()["test_table_by_col2"]
+    assert stats["prepares"] == 1
+    assert stats["executions"] == 2
+    assert stats["parse_hits"] == 1
+    assert stats["generic_plans"] + stats["custom_plans"] == 2
+
+
+@pytest.mark.integration
+def test_integration_prepared_stats_without_plan_counts(sql, test_table):
+    sql.prepare("test_table_count", f"select count(*) from {test_table} where col1 = $1", ["int"])
+    sql.select_prepared("test_table_count", [1])
+
+    # Before Postgres 14 pg_prepared_statements has no plan counts, they are not queried
+    cnxn, old_cnxn = Mock(server_version=130012), sql.cnxn
+    sql.cnxn = cnxn
+    try:
+        stats = sql.get_prepared_stats()["test_table_count"]
+    finally:
+        sql.cnxn = old_cnxn
+
+    assert not cnxn.cursor.called
+    assert stats["executions"] == 1
+    assert stats["generic_plans"] is None
+    assert stats["custom_plans"] is None
+
+
+@pytest.mark.integration
+def test_integration_query_prepared(sql, test_table):
+    sql.upload_df_copy(test_table, pd.DataFrame({"col1": [1, 2], "col2": ["a", "b"]}))
+    sql.prepare("test_table_delete", f"delete from {test_table} where col1 = $1", ["int"])
+    sql.query_prepared("test_table_delete", [1])
+
+    # Changing a statement prepares it again under the same name
+    sql.prepare("test_table_delete", f"delete from {test_table} where col2 = $1", ["text"])
+    sql.query_prepared("test_table_delete", ["b"])
+
+    assert sql.select(test_table).empty
+    assert sql.get_prepared_stats()["test_table_delete"]["prepares"] == 2
+
+
+@pytest.fixture
+def refresh_table(sql):
+    table_name = "test_table_refresh"
+    sql.query(
+        f"""
+        CREATE TABLE {table_name} (col1 INT NOT NULL, col2 TEXT, PRIMARY KEY (col1));
+        CREATE INDEX {table_name}_col2_idx ON {table_name} (col2);
+        CREATE VIEW {table_name}_view AS SELECT col1 FROM {table_name} WHERE col1 > 1;
+        CREATE VIEW {table_name}_nested AS SELECT col1 + 1 AS col1 FROM {table_name}_view;
+        INSERT INTO {table_name} VALUES (1, 'old');
+        """
+    )
+    yield table_name
+    sql.query(f"DROP TABLE IF EXISTS {table_name}, {table_name}_staging, {table_name}_old CASCADE")
+
+
+@pytest.mark.integration
+def test_integration_refresh_table_df(sql, refresh_table):
+    df = pd.DataFrame({"col1": [2, 3], "col2": ["a", "b"]})
+    sql.refresh_table(refresh_table, df)
+
+    pd.testing.assert_frame_equal(sql.select(refresh_table), df)
+    assert sql.select_column_list("col1", f"{refresh_table}_view") == [2, 3]
+    assert sql.select_column_list("col1", f"{refresh_table}_nested") == [3, 4]
+    indexes = sql.select_query(
+        "SELECT indexname FROM pg_indexes WHERE tablename = %(table)s ORDER BY indexname",
+        params={"table": refresh_table},
+    )
+    assert indexes.indexname.tolist() == [f"{refresh_table}_col2_idx", f"{refresh_table}_pkey"]
+    with pytest.raises(Exception, match="duplicate key"):
+        sql.query(f"INSERT INTO {refresh_table} VALUES (2, 'c')")
+
+
+@pytest.mark.integration
+def test_integration_refresh_table_chunks(sql, refresh_table):
+    df = pd.DataFrame({"col1": [2, 3, 4], "col2": ["a", "b", "c"]})
+    sql.refresh_table(refresh_table, (df.iloc[i : i + 2] for i in range(0, len(df), 2)))
+
+    pd.testing.assert_frame_equal(sql.select(refresh_table), df)
+
+
+@pytest.mark.integration
+def test_integration_refresh_table_query(sql, refresh_table):
+    sql.refresh_table(refresh_table, query="SELECT 5 AS col1, 'e' AS col2")
+
+    expected_df = pd.DataFrame({"col1": [5], "col2": ["e"]})
+    pd.testing.assert_frame_equal(sql.select(refresh_table), expected_df)
+    assert sql.select_column_list("col1", f"{refresh_table}_view") == [5]
+
+
+@pytest.mark.integration
+def test_integration_refresh_table_typed_fields(sql, refresh_table):
+    query = f"SELECT * FROM {refresh_table}"
+    assert sql.select_typed(query).columns.tolist() == ["col1", "col2"]
+    sql.query(f"DROP VIEW {refresh_table}_nested, {refresh_table}_view")
+    sql.refresh_table(refresh_table, query="SELECT 5 AS col1, 'e' AS col2, 1.5 AS col3")
+
+    result = sql.select_typed(query)
+    assert result.columns.tolist() == ["col1", "col2", "col3"]
+    assert result.col3.dtype == "float64"
+
+
+@pytest.mark.integration
+def test_integration_refresh_table_leftovers(sql, refresh_table):
+    # Left behind by an interrupted refresh
+    sql.query(f"CREATE TABLE {refresh_table}_staging (col1 INT)")
+    sql.query(f"CREATE TABLE {refresh_table}_old (col1 INT)")
+    df = pd.DataFrame({"col1": [2], "col2": ["a"]})
+    sql.refresh_table(refresh_table, df)
+
+    pd.testing.assert_frame_equal(sql.select(refresh_table), df)
+    leftovers = sql.query_fetchall(
+        f"SELECT to_regclass('{refresh_table}_staging'), to_regclass('{refresh_table}_old')"
+    )[0]
+    assert leftovers == (None, None)
+
+
+@pytest.mark.integration
+def test_integration_refresh_table_lock(sql, sql_params, refresh_table):
+    other = sql_manager.ManagerSQL(sql_params, shared=False)
+    lock = "pg_try_advisory_lock(hashtext('refresh_table'), hashtext(%(table)s))"
+    try:
+        assert other.query_fetchall(f"SELECT {lock}", {"table": refresh_table})[0][0]
+        with pytest.raises(Exception, match="lock timeout"):
+            sql.query("SET lock_timeout = '100ms'")
+            sql.refresh_table(refresh_table, query="SELECT 5 AS col1, 'e' AS col2")
+    finally:
+        sql.query("RESET lock_timeout")
+        other.cnxn.close()
+
+    # The lock is released with the session
+    sql.refresh_table(refresh_table, query="SELECT 5 AS col1, 'e' AS col2")
+    assert sql.select_column_list("col1", refresh_table) == [5]
+
+
+@pytest.mark.integration
+def test_integration_refresh_table_failed_load(sql, refresh_table):
+    df = pd.DataFrame({"col1": [None], "col2": ["a"]})
+    with pytest.raises(Exception):
+        sql.refresh_table(refresh_table, df)
+
+    expected_df = pd.DataFrame({"col1": [1], "col2": ["old"]})
+    pd.testing.assert_frame_equal(sql.select(refresh_table), expected_df)
+
+
+@pytest.mark.integration
+def test_integration_shared_connection(sql_params):
+    first = sql_manager.ManagerSQL(sql_params)
+    stats = sql_manager.get_pool_stats()
+    second = sql_manager.ManagerSQL(sql_params)
+
+    assert second.cnxn is first.cnxn
+    assert sql_manager.get_pool_stats()["reuses"] == stats["reuses"] + 1
+    assert sql_manager.ManagerSQL(sql_params, shared=False).cnxn is not first.cnxn
+
+
+@pytest.mark.integration
+def test_integration_shared_connection_reconnects(sql_params):
+    first = sql_manager.ManagerSQL(sql_params)
+    first.cnxn.close()
+    stats = sql_manager.get_pool_stats()
+
+    second = sql_manager.ManagerSQL(sql_params)
+
+    assert second.cnxn is not first.cnxn
+    assert second.query_fetchall("select 1") == [(1,)]
+    assert sql_manager.get_pool_stats()["reconnects"] == stats["reconnects"] + 1